@@ -1,16 +1,41 @@
 #!/usr/bin/python3
 
-# import pyexiv2
+import pyexiv2
 import re
+import asyncio
 import os
+import stat
 import pathlib
 import collections
 import datetime
 import pandas as pd
 import sys
+import pathFormats
+import renamePlanner
+import warehouseIndex
+import uploadScheduler
+import uploadPipeline
+import scanProfile
+import sparcCatalog
 from blackfynn import Blackfynn, Settings
 from blackfynn.models import Collection
 
+SPARC_LABELS = [
+    'sample_id', 'specimen', 'laterality', 'stain',
+    'section', 'magnification', 'z_stack', 'suffix'
+]
+
+# catalog columns with a saved secondary index
+SPARC_INDEX_LABELS = [
+    'sample_id', 'stain', 'section', 'magnification', 'laterality'
+]
+
+SparcMetadata = collections.namedtuple('SparcMetadata', SPARC_LABELS)
+SparcMetadata.__doc__ = '''
+    Immutable record of Sparc metadata parsed from an image Path.
+    Built once per SparcImage by parse_metadata()
+    '''
+
 
 class ImagePath(type(pathlib.Path())):
     '''
@@ -23,6 +48,24 @@ class ImagePath(type(pathlib.Path())):
     def get_base_comp(self):
         return re.split(r'[\s,_.]', self.name)
 
+    def cache_stat(self, stat_result):
+        '''
+        Stores stat result already read by a directory
+        scan, e.g. from os.DirEntry.stat()
+        '''
+        self._stat = stat_result
+
+    def get_stat(self):
+        '''
+        Returns stat result for Path, calling stat only
+        when no result was cached
+        '''
+        try:
+            return self._stat
+        except AttributeError:
+            self._stat = self.stat()
+            return self._stat
+
     def get_zstack(self):
         return re.search('z[0-9]+', self.name)[0]
 
@@ -42,8 +85,21 @@ class SparcImage(ImagePath):
     by passing to BlackfynnUploader.upload_file(SparcImage)
     '''
 
-    def __init__(self, image_path):
+    def __init__(self, image_path, *, parts=None):
         super().__init__(image_path)
+        if parts is not None:
+            self._split_parts = parts
+
+    def get_split_parts(self):
+        '''
+        Returns path components as split by the format
+        classifier, splitting Path only when not given
+        '''
+        try:
+            return self._split_parts
+        except AttributeError:
+            self._split_parts = self.as_posix().split('/')
+            return self._split_parts
 
     def get_base_comp(self):
         sparc_pattern = re.compile(r"[^_]*-[^_.]*", re.IGNORECASE)
@@ -52,98 +108,118 @@ class SparcImage(ImagePath):
             ]
          }
 
+    def get_metadata(self):
+        '''
+        Returns SparcMetadata record for Path,
+        parsing the path on first call only
+        '''
+        try:
+            return self._metadata
+        except AttributeError:
+            with scanProfile.PROFILER.phase('sparc.parse'):
+                self._metadata = self.parse_metadata()
+            return self._metadata
+
+    def parse_metadata(self):
+        base_comp = self.get_base_comp()
+        return SparcMetadata(
+            base_comp['sam'], base_comp['spec'], base_comp['lat'],
+            base_comp['stain'], base_comp['sec'], base_comp['mag'],
+            base_comp.get('z', ''), self.suffix
+        )
+
     def get_sample_id(self):
-        return self.get_base_comp()['sam']
+        return self.get_metadata().sample_id
 
     def get_specimen(self):
-        return self.get_base_comp()['spec']
+        return self.get_metadata().specimen
 
     def get_laterality(self):
-        return self.get_base_comp()['lat']
+        return self.get_metadata().laterality
 
     def get_section(self):
-        return self.get_base_comp()['sec']
+        return self.get_metadata().section
 
     def get_magnification(self):
-        return self.get_base_comp()['mag']
+        return self.get_metadata().magnification
 
     def get_stain(self):
-        return self.get_base_comp()['stain']
+        return self.get_metadata().stain
 
     def get_zstack(self):
-        try:
-            return self.get_base_comp()['z']
-        except:
-            return ''
+        return self.get_metadata().z_stack
 
+    @scanProfile.timed('sparc.creation_date')
     def get_creation_date(self):
 
-        if os.path.isfile(self):
+        try:
+            stat_result = self.get_stat()
+        except OSError:
+            stat_result = None
+        if stat_result and stat.S_ISREG(stat_result.st_mode):
             return str(
                 datetime.date.fromtimestamp(
-                    os.path.getmtime(
-                        self
-                    )
+                    stat_result.st_mtime
                 )
             )
         else:
             print(str(self) + ' is not a real file')
             return ''
 
+    @scanProfile.timed('sparc.path')
     def get_sparc_path(self):
-        sparc_dict = self.get_sparc_dict()
-        if sparc_dict['z_stack']:
+        metadata = self.get_metadata()
+        if metadata.z_stack:
             sparc_path = 'samples/sample-{0}/specimen-{1}/laterality-{2}/' \
                          'stain-{3}/section-{4}/magnification-{5}/' \
                          'sam-{0}_spec-{1}_lat-{2}_stain-{3}_sec-{4}_mag-{5}_z-{6}{7}'.format(
-                sparc_dict['sample_id'], sparc_dict['specimen'], sparc_dict['laterality'],
-                sparc_dict['stain'], sparc_dict['section'], sparc_dict['magnification'],
-                sparc_dict['z_stack'], sparc_dict['suffix']
+                *metadata
             )
 
-
         else:
             sparc_path = 'samples/sample-{0}/specimen-{1}/laterality-{2}/' \
                          'stain-{3}/section-{4}/magnification-{5}/' \
-                         'sam-{0}_spec-{1}_lat-{2}_stain-{3}_sec-{4}_mag-{5}{6}'.format(
-                sparc_dict['sample_id'], sparc_dict['specimen'], sparc_dict['laterality'],
-                sparc_dict['stain'], sparc_dict['section'], sparc_dict['magnification'],
-                sparc_dict['suffix']
+                         'sam-{0}_spec-{1}_lat-{2}_stain-{3}_sec-{4}_mag-{5}{7}'.format(
+                *metadata
             )
         return SparcImage(sparc_path)
 
     def get_sparc_dict(self):
+        return collections.OrderedDict(self.get_metadata()._asdict())
 
-        metadata = [
-            self.get_sample_id(), self.get_specimen(), self.get_laterality(),
-            self.get_stain(), self.get_section(), self.get_magnification(),
-            self.get_zstack(), self.suffix
-        ]
-
-        labels = [
-            'sample_id', 'specimen', 'laterality', 'stain',
-            'section', 'magnification', 'z_stack', 'suffix'
-        ]
-
-        if metadata:
-            sample_metadata = collections.OrderedDict(zip(labels, metadata))
-            return sample_metadata
-
+    @scanProfile.timed('sparc.xmp')
     def write_xmp(self):
         '''
         Labels image files with metadata values as
         XMP property tags searchable in windows explorer.
+        Skips the write when the file already holds the same tags.
+        Returns True if written, False if not.
         '''
         if self.exists():
 
-            metadata = pyexiv2.ImageMetadata(self)
+            tag_list = list(self.get_metadata())
+            metadata = pyexiv2.ImageMetadata(str(self))
             metadata.read()
-            metadata['Xmp.dc.subject'] = list(self.get_sparc_dict().values())
+            if 'Xmp.dc.subject' in metadata.xmp_keys \
+                    and metadata['Xmp.dc.subject'].value == tag_list:
+                return False
+            metadata['Xmp.dc.subject'] = tag_list
             metadata.write()
+            return True
         else:
             print(str(self) + ' is not a real file')
-            pass
+            return False
+
+    def get_sparc_target(self, write_to=None):
+        '''
+        Returns Path renamed to the Sparc file name in place,
+        or the full Sparc path originating at write_to
+        '''
+        if write_to is None:
+            return self.with_name(self.get_sparc_path().name)
+        return pathlib.Path(write_to).joinpath(self.get_sparc_path())
 
+    @scanProfile.timed('sparc.rename')
     def rename_to_sparc(self):
         '''
         Renames file at Path
@@ -154,15 +230,16 @@ class SparcImage(ImagePath):
             try:
                 return SparcImage(
                     self.rename(
-                        self.get_sparc_path().name
+                        self.get_sparc_target()
                     )
                 )
 
             except Exception as ex:
-                print('Rename error for {}.\n{}'.format(self, new_path))
+                print('Rename error for {}.\n{}'.format(self, str(ex)))
         else:
             print(str(self) + ' is not a real file')
 
+    @scanProfile.timed('sparc.rename')
     def write_sparc_path(self, write_to):
         '''
         Replaces Path with Sparc conforming file and
@@ -171,11 +248,7 @@ class SparcImage(ImagePath):
         '''
 
         if self.exists():
-            new_path = write_to.joinpath(
-                self.get_sparc_path(
-                    self.get_sparc_dict()
-                )
-            )
+            new_path = self.get_sparc_target(write_to)
 
             try:
                 return SparcImage(self.replace(new_path))
@@ -195,7 +268,7 @@ class SparcImage(ImagePath):
             self.get_sparc_path()
         )
         try:
-            return new_path.parent.mkDir(parents=True, exist_ok=True)
+            return new_path.parent.mkdir(parents=True, exist_ok=True)
 
         except Exception as ex:
             print('Cannot make Sparc directories for {}.\n{}'.format(self, new_path))
@@ -205,7 +278,7 @@ class SparcImage(ImagePath):
         '''
         Returns Sparc metadata for Path as a pandas Series
         '''
-        return pd.Series(self.get_sparc_dict())
+        return pd.Series(self.get_metadata(), index=SPARC_LABELS)
 
 
 class PathFormatFactory:
@@ -223,63 +296,68 @@ class PathFormatFactory:
         if sparc_pattern.search(self.image_path):
             return True
 
+    @scanProfile.timed('sparc.factory')
     def format(self):
-        if self.is_sparcy:
-            return SparcImage(self.image_path)
-        if '5ht7' in self.image_path.parts:
-            return Ht7(self.image_path)
-        if '5ht2a' in self.image_path.parts:
-            return Ht2a(self.image_path)
-        if '5ht2b' in self.image_path.parts:
-            return Ht2b(self.image_path)
-        if '5ht' in self.image_path.parts:
-            return Ht(self.image_path)
-        if 'a2a' in self.image_path.parts:
-            return a2a(self.image_path)
-        else:
+        path_format = IMAGE_FORMATS.classify(self.image_path)
+        if path_format is None:
             return self.image_path
+        label, image_class, parts = path_format
+        return image_class(self.image_path, parts=parts)
 
 
-class Ht(SparcImage):
+def parse_folder_stain(parts, channel):
     '''
-    Subclass of Sparc Image with format
-    specific metadata interface
+    Returns stain for user-format Paths, read from the
+    stain folder five levels up and picked by channel
     '''
+    if channel == 'overlay':
+        return parts[-5]
+    stains = parts[-5].split('+')
+    return stains[int(channel[2:] or 1) - 1]
 
-    def __init__(self, image_path):
-        super().__init__(image_path)
 
-    def get_sample_id(self):
-        return self.get_base_comp()[0]
+def parse_zstack(name):
+    zstack = re.search('z[0-9]+', name)
+    if zstack:
+        return zstack[0][1:]
+    return ''
 
-    def get_laterality(self):
-        if self.get_magnification() == '2x':
-            return 'whole'
-        elif self.get_base_comp()[-4].lower() in ['il', 'l', 'lft']:
-            return 'left'
-        elif self.get_base_comp()[-4].lower() in ['r', 'cl', 'rt']:
-            return 'right'
-        else:
-            return None
-
-    def get_section(self):
-        if self.get_magnification() == '2x':
-            return self.get_base_comp()[-4][7:]
-        elif 'section' in self.get_base_comp()[1]:
-            return self.get_base_comp()[1][7:]
-        else:
-            return self.get_base_comp()[-5][7:]
 
-    def get_magnification(self):
-        return self.get_base_comp()[-3]
+class Ht(SparcImage):
+    '''
+    Subclass of Sparc Image with format
+    specific metadata interface
+    '''
 
-    def get_stain(self):
-        if self.get_channel() == 'overlay':
-            return self.parts[-5]
+    def __init__(self, image_path, *, parts=None):
+        super().__init__(image_path, parts=parts)
+
+    def parse_metadata(self):
+        parts = self.get_split_parts()
+        name = parts[-1].split('_')
+        sample_id = name[1]
+        if 'section' in sample_id:
+            sample_id = name[0].split()[2]
+        magnification = name[-2]
+        if magnification == '2x':
+            laterality = 'whole'
+        elif name[-3].lower() in ['il', 'l', 'lft']:
+            laterality = 'left'
+        elif name[-3].lower() in ['r', 'cl', 'rt']:
+            laterality = 'right'
+        else:
+            laterality = None
+        if magnification == '2x':
+            section = name[-3][7:]
+        elif 'section' in name[1]:
+            section = name[1][7:]
         else:
-            stains = self.parts[-5].split('+')
-            stain = stains[int(self.get_channel()) - 1]
-            return stain
+            section = name[-4][7:]
+        return SparcMetadata(
+            sample_id, 'phrenic', laterality,
+            parse_folder_stain(parts, self.get_channel()),
+            section, magnification, parse_zstack(self.name), self.suffix
+        )
 
 
 class Ht2a(SparcImage):
@@ -288,57 +366,26 @@ class Ht2a(SparcImage):
     specific metadata interface
     '''
 
-    def __init__(self, image_path):
-        super().__init__(image_path)
-
-    def get_sample_id(self):
-        return self.parts[-3]
-
-    def get_laterality(self):
-        return self.parts[-2].split()[1]
-
-    def get_section(self):
-        return self.parts[-2].split()[3]
-
-    def get_magnification(self):
-        return self.parts[-2].split()[4]
+    def __init__(self, image_path, *, parts=None):
+        super().__init__(image_path, parts=parts)
 
-    def get_stain(self):
-        if self.get_channel() == 'overlay':
-            return self.parts[-5]
-        else:
-            stains = self.parts[-5].split('+')
-            stain = stains[int(self.get_channel()) - 1]
-            return stain
+    def parse_metadata(self):
+        parts = self.get_split_parts()
+        folder = parts[-2].split()
+        return SparcMetadata(
+            parts[-3], 'phrenic', folder[1],
+            parse_folder_stain(parts, self.get_channel()),
+            folder[3], folder[4], parse_zstack(self.name), self.suffix
+        )
 
 
-class Ht2b(SparcImage):
+class Ht2b(Ht2a):
     '''
     Subclass of Sparc Image with format
     specific metadata interface
     '''
-    def __init__(self, image_path):
-        super().__init__(image_path)
-
-    def get_sample_id(self):
-        return self.parts[-3]
-
-    def get_laterality(self):
-        return self.parts[-2].split()[1]
-
-    def get_section(self):
-        return self.parts[-2].split()[3]
-
-    def get_magnification(self):
-        return self.parts[-2].split()[4]
-
-    def get_stain(self):
-        if self.get_channel() == 'overlay':
-            return self.parts[-5]
-        else:
-            stains = self.parts[-5].split('+')
-            stain = stains[int(self.get_channel()) - 1]
-            return stain
+    def __init__(self, image_path, *, parts=None):
+        super().__init__(image_path, parts=parts)
 
 
 class Ht7(SparcImage):
@@ -346,28 +393,17 @@ class Ht7(SparcImage):
     Subclass of Sparc Image with format
     specific metadata interface
     '''
-    def __init__(self, image_path):
-        super().__init__(image_path)
-
-    def get_sample_id(self):
-        return self.parts[-3]
-
-    def get_laterality(self):
-        return self.parts[-2].split()[1]
-
-    def get_section(self):
-        return self.parts[-2].split()[-2]
-
-    def get_magnification(self):
-        return self.parts[-2].split()[-1]
-
-    def get_stain(self):
-        if self.get_channel() == 'overlay':
-            return self.parts[-5]
-        else:
-            stains = self.parts[-5].split('+')
-            stain = stains[int(self.get_channel()) - 1]
-            return stain
+    def __init__(self, image_path, *, parts=None):
+        super().__init__(image_path, parts=parts)
+
+    def parse_metadata(self):
+        parts = self.get_split_parts()
+        folder = parts[-2].split()
+        return SparcMetadata(
+            parts[-3], 'phrenic', folder[1],
+            parse_folder_stain(parts, self.get_channel()),
+            folder[-2], folder[-1], parse_zstack(self.name), self.suffix
+        )
 
 
 class A2a(SparcImage):
@@ -375,28 +411,78 @@ class A2a(SparcImage):
     Subclass of Sparc Image with format
     specific metadata interface
     '''
-    def __init__(self, image_path):
-        super().__init__(image_path)
+    def __init__(self, image_path, *, parts=None):
+        super().__init__(image_path, parts=parts)
+
+    def parse_metadata(self):
+        parts = self.get_split_parts()
+        name = parts[-1].split('_')
+        folder = parts[-2].split('_')
+        return SparcMetadata(
+            name[2], 'phrenic', name[-3],
+            parse_folder_stain(parts, self.get_channel()),
+            folder[3][3:], folder[1], parse_zstack(self.name), self.suffix
+        )
 
-    def get_sample_id(self):
-        return self.get_base_comp()[2]
 
-    def get_laterality(self):
-        return self.get_base_comp()[-3]
+# Image class of each format in pathFormats.PATH_FORMATS.
+# Register a new lab format with a (label, class) row.
+IMAGE_FORMATS = pathFormats.FormatClassifier([
+    ('sparc', SparcImage),
+    ('5ht2b', Ht2b),
+    ('5ht2a', Ht2a),
+    ('5ht7', Ht7),
+    ('a2a', A2a),
+    ('5ht', Ht),
+])
 
-    def get_section(self):
-        return self.parts[-2].split('_')[3][3:]
 
-    def get_magnification(self):
-        return self.parts[-2].split('_')[1]
+def plan_sparc_renames(images, write_to=None):
+    '''
+    Plans renames of all images to Sparc names in place,
+    or to Sparc paths originating at write_to, checking
+    for conflicts before any file is moved.
+    Run with RenamePlan.execute(journal_file)
+    '''
+    return renamePlanner.RenamePlan(
+        (str(image), str(image.get_sparc_target(write_to)))
+        for image in images
+    )
 
-    def get_stain(self):
-        if self.get_channel() == 'overlay':
-            return self.parts[-5]
-        else:
-            stains = self.parts[-5].split('+')
-            stain = stains[int(self.get_channel()) - 1]
-            return stain
+
+def sparc_catalog(images):
+    '''
+    Returns SparcCatalog of the Sparc metadata of images, values
+    interned into integer codes, with image paths under 'path'.
+    Images whose metadata cannot be parsed are left out.
+    Save with indexes by catalog.save(catalog_dir, SPARC_INDEX_LABELS)
+    '''
+    catalog = sparcCatalog.SparcCatalog(SPARC_LABELS, ['path'])
+    for image in images:
+        try:
+            metadata = image.get_metadata()
+        except Exception as ex:
+            print('Cannot parse Sparc metadata of {}.\n{}'.format(image, str(ex)))
+            continue
+        row = metadata._asdict()
+        row['path'] = str(image)
+        catalog.append(row)
+    catalog.freeze()
+    return catalog
+
+
+def sparc_tasks(images):
+    '''
+    Yields UploadTask to the Sparc collection of each image,
+    skipping images whose Sparc path cannot be parsed
+    '''
+    for image in images:
+        try:
+            collection_path = image.get_sparc_path().parent.as_posix()
+        except Exception as ex:
+            print('Cannot parse Sparc path of {}.\n{}'.format(image, str(ex)))
+            continue
+        yield uploadScheduler.UploadTask(collection_path, [str(image)])
 
 
 class BlackfynnUploader:
@@ -406,12 +492,20 @@ class BlackfynnUploader:
     attempts connection to destination dataset_name.
     Checks/creates Sparc conforming collections
     and uploads file passed to upload_file(to_upload)
+    An already connected dataset can be passed instead,
+    e.g. from fakeBlackfynn. Collection listings for
+    duplicate checks are cached in index_file
     '''
 
-    def __init__(self, dataset_name):
+    def __init__(self, dataset_name, dataset=None, index_file=None):
         self.dataset_name = dataset_name
-        self.working_profile = self.get_profile()
-        self.dataset = self.connect()
+        if dataset is None:
+            self.working_profile = self.get_profile()
+            self.dataset = self.connect()
+        else:
+            self.dataset = dataset
+        self.index = warehouseIndex.RemoteIndexCache(index_file)
+        self.trees = {}
 
     def get_profile(self):
         '''
@@ -461,75 +555,114 @@ class BlackfynnUploader:
 
         print()
         print('Dataset:  {}\nProfile:  {}'.format(
-            data_set, self.working_profile))
+            dataset.name, self.working_profile))
 
         prompt = input('Continue with upload (y/n)? ')
         if prompt != 'y':
             sys.exit('Aborting upload.')
         return dataset
 
+    @scanProfile.timed('sparc.collection')
     def make_collection(self, collection, to_upload):
         '''
-        Finds or creates one or more collections in a collection hierarchy
-        and returns the lowest collection.
+        Finds or creates the collections of the Sparc path
+        of to_upload below collection and returns the lowest.
+        Resolved levels are cached by path prefix per collection
         '''
-        for level in to_upload.parents:
-            for curr_coll in collection.items:
-                if curr_coll.name == level:
-                    break
-            else:
-                print('Creating', level, ' in', collection.name)
-                curr_coll = collection.create_collection(level)
-            collection = curr_coll  # step down into new collection
-        return curr_coll
+        return self.get_tree(collection).resolve(
+            to_upload.get_sparc_path().parent.as_posix()
+        )
+
+    def get_tree(self, collection):
+        '''
+        Returns the CollectionTree caching collections below collection
+        '''
+        if collection.id not in self.trees:
+            self.trees[collection.id] = warehouseIndex.CollectionTree(collection)
+        return self.trees[collection.id]
 
     def check_collection(self, collection, to_upload):
         '''
         Checks to see if the source file name exists in the current collection.
-        Drills down into collection to find file.
-        '''
-        for item in collection:
-            if isinstance(item, Collection):
-                continue
-            true_names = item.sources
-            for lookup in true_names:
-                real_file = os.path.basename(lookup.s3_key)
-                if not real_file:
-                    print('List of sources empty')
-                if real_file == to_upload.name:
-                    return True
-        return False
+        Looks up the collection listing cached in self.index.
+        '''
+        return self.index.contains(collection, to_upload.name)
 
+    @scanProfile.timed('sparc.upload')
     def upload_file(self, to_upload):
 
         if to_upload.exists():
 
-            collection = self.dataset
             print(
                 'Uploading {} to {}.'.format(
-                    to_upload.name, to_upload.get_sparc_path(
-                        self.get_sparc_dict()
-                    )
+                    to_upload.name, to_upload.get_sparc_path()
                 )
             )
 
-
-            if self.check_collection(collection, to_upload):
-                print(
-                    'File {} already uploaded to {}.'.format(
-                    to_upload.name, to_upload.get_sparc_path(
-                        self.get_sparc_dict()
+            try:
+                collection = self.make_collection(self.dataset, to_upload)
+                if self.check_collection(collection, to_upload):
+                    print(
+                        'File {} already uploaded to {}.'.format(
+                            to_upload.name, to_upload.get_sparc_path()
+                        )
                     )
-                )
-            )
-
-            else:
-                try:
-                    collection = self.make_collection(collection, to_upload)
+                else:
                     collection.upload(to_upload, display_progress=True)
-                except Exception as ex:
-                    print('Error uploading {}.  {}'.format(path.name, str(ex)))
-                    pass
+                    self.index.add(collection, to_upload.name)
+            except Exception as ex:
+                print('Error uploading {}.  {}'.format(to_upload.name, str(ex)))
+
+        else:
+            print('Error uploading {}. File does not exist.'.format(to_upload.name))
+
+    def upload_pipeline(self, jobs=uploadScheduler.UPLOAD_JOBS,
+                        journal=None, dedup=None, task_batches=False):
+        '''
+        Returns UploadPipeline to the Sparc collections of the dataset
+        '''
+        return uploadPipeline.UploadPipeline(
+            self.get_tree(self.dataset), self.index, jobs, journal=journal,
+            dedup=dedup, task_batches=task_batches
+        )
 
+    async def upload_files_async(self, images, jobs=uploadScheduler.UPLOAD_JOBS,
+                                 journal=None, dedup=None, stacks=None):
+        '''
+        Uploads many SparcImages to their Sparc collections from a running
+        event loop. Images are read lazily, so images can be a generator
+        still scanning the disk. Local checks, collection resolution,
+        remote duplicate checks and jobs uploads at a time overlap,
+        transient errors are retried. Images recorded in journal, an
+        UploadJournal, or copies of other images in dedup, a DedupIndex,
+        are skipped. If stacks, a stackGroups.StackIndex, is given,
+        images are grouped in it and each z-stack is uploaded as one batch.
+        Returns the UploadPipeline with per task results
+        '''
+        pipeline = self.upload_pipeline(
+            jobs, journal, dedup, task_batches=stacks is not None
+        )
+        if stacks is None:
+            tasks = sparc_tasks(images)
         else:
-            print('Error uploading {}. File does not exist.'.format(path.name))
+            tasks = stacks.tasks(images)
+        await pipeline.runAsync(tasks)
+        for result in pipeline.results:
+            scanProfile.PROFILER.count(
+                'sparc.' + result.status, len(result.task.files)
+            )
+            scanProfile.PROFILER.count('sparc.upload_bytes', result.bytes)
+        print(pipeline.report())
+        return pipeline
+
+    @scanProfile.timed('sparc.upload')
+    def upload_files(self, images, jobs=uploadScheduler.UPLOAD_JOBS,
+                     journal=None, dedup=None, stacks=None):
+        '''
+        Synchronous wrapper of upload_files_async,
+        running it in a new event loop
+        Returns the UploadPipeline with per task results
+        '''
+        return asyncio.run(
+            self.upload_files_async(images, jobs, journal, dedup, stacks)
+        )
@@ -20,47 +20,148 @@ import csv
 import glob
 import sys
 import time
+import fnmatch
+import concurrent.futures
 from blackfynn import Blackfynn, Settings
-from blackfynn.models import Collection
+import warehouseIndex
+import uploadScheduler
+import dedupIndex
 
-def checkFilesExist(csv_name):
+INDEX_FILE = 'blackfynn_index.sqlite'
+JOURNAL_FILE = 'upload_journal.csv'
+VERIFY_JOBS = 16
+
+class UploadPlan:
+    '''
+    Upload csv file parsed once: data set name from the header, and
+    (destination collection, source file pattern) rows. Rows without a
+    destination go to the previous row's collection. verify() expands the
+    source patterns and records file sizes, listing each parent directory
+    once, and tasks() hands the expanded files to the upload scheduler.
+    '''
+
+    def __init__(self, working_csv):
+        self.working_csv = working_csv
+        self.rows = []
+        self.expanded = []
+        self.sizes = {}
+        self.listings = {}
+        with open(working_csv) as csvfile:
+            in_file = csv.reader(csvfile, delimiter=',')
+            header = next(in_file, [])
+            self.dataset_name = header[0] if header else ''
+            dest_folder = ''
+            for row in in_file:
+                if row and row[0]:
+                    dest_folder = row[0]
+                self.rows.append((dest_folder, row[1] if len(row) > 1 else ''))
+
+    def listDirectory(self, path):
+        '''
+        Returns dictionary of entry name to os.DirEntry in path, or None
+        if path cannot be listed. Entries are stat'ed later by entrySize,
+        only for the names a row looks up.
+        '''
+        try:
+            with os.scandir(path) as entries:
+                return {entry.name: entry for entry in entries}
+        except OSError:
+            return None
+
+    def entrySize(self, entry):
+        '''
+        Returns size of a listed file, 0 for other entries.
+        '''
+        try:
+            return entry.stat().st_size if entry.is_file() else 0
+        except OSError:
+            return 0
+
+    def expand(self, src_file):
+        '''
+        Returns sorted files matching src_file, like glob.glob, from
+        the listing of its parent directory.
+        '''
+        parent, sep, name = src_file.rpartition('/')
+        if not name:
+            return []
+        if glob.has_magic(parent):
+            matches = sorted(glob.glob(src_file))
+            for file_path in matches:
+                self.sizes[file_path] = os.path.getsize(file_path)
+            return matches
+        listing = self.listings.get(parent + sep or '.')
+        if listing is None:
+            return []
+        if not glob.has_magic(name):
+            if name not in listing:
+                return []
+            self.sizes[src_file] = self.entrySize(listing[name])
+            return [src_file]
+        matches = []
+        for entry in sorted(fnmatch.filter(listing, name)):
+            if entry.startswith('.') and not name.startswith('.'):
+                continue
+            file_path = parent + sep + entry
+            self.sizes[file_path] = self.entrySize(listing[entry])
+            matches.append(file_path)
+        return matches
+
+    def verify(self, jobs=VERIFY_JOBS):
+        '''
+        Lists the parent directory of every source pattern in a pool of
+        jobs threads, then expands each row.
+        Returns True if every source pattern matched a file.
+        '''
+        parents = set()
+        for dest_folder, src_file in self.rows:
+            parent, sep, name = src_file.rpartition('/')
+            parents.add(parent + sep or '.')
+        parents = [parent for parent in parents if not glob.has_magic(parent)]
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            self.listings = dict(zip(
+                parents, pool.map(self.listDirectory, parents)
+                ))
+        okay = True
+        self.expanded = []
+        for dest_folder, src_file in self.rows:
+            matches = self.expand(src_file)
+            if not matches:
+                print('The path or file {} does not exist.'.format(src_file))
+                okay = False
+            self.expanded.append((dest_folder, matches))
+        return okay
+
+    def tasks(self):
+        '''
+        Returns list of UploadTask for the expanded rows.
+        '''
+        return [uploadScheduler.UploadTask(dest_folder, matches)
+                for dest_folder, matches in self.expanded if matches]
+
+    def totalBytes(self):
+        return sum(self.sizes.values())
+
+def checkFilesExist(csv_name, jobs=VERIFY_JOBS):
     '''
     Returns True if all the source files in second column of .csv file exist.
     Returns False if not.
     '''
-    okay = True
     print('Making sure that files to upload exist')
-    with open(csv_name) as csv_file:
-        read = csv.reader(csv_file, delimiter=',')
-        next(read)
-        files = [fname[1] for fname in read]
-        for fname in files:
-            match = glob.glob(fname)
-            if not match:
-                print('The path or file {} does not exist.'.format(fname)
-                okay = False
+    okay = UploadPlan(csv_name).verify(jobs)
     if okay:
         print('All files in place!')
     return okay
 
-def checkBfynnCollection(collection, fname):
+def checkBfynnCollection(collection, fname, index):
     '''
     Checks to see if the source file name exists in the current collection.
-    Drills down into collection to find file.
-    '''
-    for item in collection:
-        if isinstance(item, Collection):
-            continue
-        true_names = item.sources
-        for lookup in true_names:
-            real_file = os.path.basename(lookup.s3_key)
-            if not real_file:
-                print('List of sources empty')
-            if real_file == fname:
-                return True
-    return False
-
-def uploadList(collection, files, name):
+    Looks the name up in the collection listing held by index, which lists
+    the collection remotely only when it has no fresh cached listing.
+    '''
+    return index.contains(collection, fname)
+
+def uploadList(collection, files, name, index):
     '''
     Uploads list of files to the collection
     '''
@@ -69,32 +170,28 @@ def uploadList(collection, files, name):
         next_file = ''
         for next_file in file_list:
             dest_copy = os.path.basename(next_file)
-            if checkBfynnCollection(collection, dest_copy):
+            if checkBfynnCollection(collection, dest_copy, index):
                 print('File {} already uploaded to {}.'.format(next_file, name))
                 upload = False
         if upload:
             print('Uploading', file_list, ' to', name)
             try:
-                res = collection.upload(file_list, display_progress=True)
+                collection.upload(*file_list, display_progress=True)
             except Exception as ex:
                 print('Error uploading {}.  {}'.format(next_file, str(ex)))
                 continue
+            for next_file in file_list:
+                index.add(collection, os.path.basename(next_file))
 
-def makeCollection(collection, paths):
+def makeCollection(collection, paths, tree=None):
     '''
     Finds or creates one or more collections in a collection hierarchy
-    and returns the lowest collection.
-    '''
-    hier = paths.split('/')
-    for level in hier:
-        for curr_coll in collection.items:
-            if curr_coll.name == level:
-                break
-        else:
-            print('Creating', level, ' in', collection.name)
-            curr_coll = collection.create_collection(level)
-        collection = curr_coll  # step down into new collection
-    return curr_coll
+    and returns the lowest collection. Pass the same CollectionTree for
+    every call below one collection to reuse resolved levels.
+    '''
+    if tree is None:
+        tree = warehouseIndex.CollectionTree(collection)
+    return tree.resolve(paths)
 
 def selectCsv():
     '''
@@ -156,16 +253,22 @@ def setup():
     Prompts for csv file with info we need to upload.
     Checks if files to upload exist.
     Connects to Blackfynn API and activates top level dataset destination.
-    Returns csv file name, destination dataset.
+    Returns UploadPlan of verified csv file, destination dataset.
     '''
     working_csv = selectCsv()
     if not working_csv:
         sys.exit('No input csv, aborting.')
-    if not checkFilesExist(working_csv):
+    print('Making sure that files to upload exist')
+    upload_plan = UploadPlan(working_csv)
+    if upload_plan.verify():
+        print('All files in place!')
+    else:
         cont = input('Some files are missing,'
                        'Continue anyway (y/n): ')
         if cont != 'y':
             sys.exit('Uploading aborted.')
+    print('{} files, {} bytes to upload'.format(
+        len(upload_plan.sizes), upload_plan.totalBytes()))
     # Profile
     working_profile = getProfile()
     try:
@@ -173,11 +276,8 @@ def setup():
     except Exception as ex:
         sys.exit('Error Connecting to ' + 'Blackfynn. ' + str(ex))
     # Dataset
-    with open(working_csv) as csvfile:
-        in_file = csv.reader(csvfile, delimiter=',')
-        header = next(in_file)
-
-    if not working_dset[0] or working_dset[1]:
+    working_dset = upload_plan.dataset_name
+    if not working_dset:
         sys.exit('No dataset name header')
     try:
         print("Trying to connect to dataset.",flush=True)
@@ -190,45 +290,56 @@ def setup():
     prompt = input('Continue with upload (y/n)? ')
     if prompt != 'y':
         sys.exit('Aborting upload.')
-    return (working_csv, data_set)
-
-def doUpload(working_csv, data_set):
-    '''
-    Takes a csv file with top level data set in header, Blackfynn
-    collection destination in first column and local source file in second.
-    Uploads source file to collection destination in top level data set.
-    Steps through collection and creates sub-folders as necessary.
-    '''
-    curr_data_dir = data_set
-    dest_name = data_set.name
-    curr_sess_dir = []
-    print('Reading file {}'.format(working_csv))
-    with open(working_csv) as csvfile:
-        in_file = csv.reader(csvfile, delimiter=',')
-        top_name = next(in_file)[0]
-        for row in in_file:
-            dest_folder = row[0]
-            src_file = row[1]
-            if dest_folder:
-                if isinstance(curr_sess_dir, Collection):
-                    curr_data_dir = makeCollection(curr_sess_dir, dest_folder)
-                else:
-                    curr_data_dir = makeCollection(curr_data_dir, dest_folder)
-                dest_name = top_level
-                if curr_sess_name:
-                    dest_name += '/' + curr_sess_name
-            if not src_file:
-                continue
-            expanded_files = makeFileList(src_file)
-            if expanded_files:
-                uploadList(curr_data_dir, src_file, dest_name)
+    return (upload_plan, data_set)
+
+def doUpload(working_csv, data_set, index=None,
+             jobs=uploadScheduler.UPLOAD_JOBS, journal_file=JOURNAL_FILE,
+             checkpoint=uploadScheduler.UPLOAD_CHECKPOINT, dedup_file=None):
+    '''
+    Takes a csv file, or its verified UploadPlan, with top level data set in
+    header, Blackfynn collection destination in first column and local
+    source file in second.
+    Uploads source files to collection destinations in top level data set,
+    jobs at a time, creating sub-folders as necessary.
+    Files in journal_file from an earlier run are skipped without remote
+    checks, other duplicate checks use index, a RemoteIndexCache.
+    Copies of other files in the dedup_file content hash index are skipped.
+    '''
+    if index is None:
+        index = warehouseIndex.RemoteIndexCache(INDEX_FILE)
+    journal = None
+    if journal_file:
+        journal = uploadScheduler.UploadJournal(journal_file, checkpoint)
+    dedup = None
+    if dedup_file:
+        dedup = dedupIndex.DedupIndex(dedup_file)
+    upload_plan = working_csv
+    if not isinstance(upload_plan, UploadPlan):
+        print('Reading file {}'.format(working_csv))
+        upload_plan = UploadPlan(working_csv)
+        upload_plan.verify()
+    tree = warehouseIndex.CollectionTree(data_set)
+    scheduler = uploadScheduler.UploadScheduler(
+        tree, index, jobs, journal=journal, sizes=upload_plan.sizes,
+        dedup=dedup
+        )
+    try:
+        scheduler.run(upload_plan.tasks())
+    finally:
+        if journal:
+            journal.close()
+        if dedup:
+            dedup.close()
+    print(scheduler.report())
+    print('{} collections listed remotely'.format(index.fetches))
+    print(tree.report())
 
 def main():
     '''
     Takes input csv and uploads to selected dataset on the Blackfynn site.
     '''
-    (working_csv, dataset) = setup()
-    doUpload(working_csv, dataset)
+    (upload_plan, dataset) = setup()
+    doUpload(upload_plan, dataset)
     print('\nDONE!')
 
 if __name__ == '__main__':
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+'''
+Content hash index of image files, kept in a SQLite file, for finding
+byte-identical copies stored under different paths.
+
+Only files sharing their size with another file can be copies, so file size
+is compared first and only those files are hashed. Files are read in chunks
+and hashed in a thread pool. Hashes are stored with the size and mtime of
+the file, and reused while both still match.
+
+Of each set of copies the first path in sorted order is the original, the
+rest are duplicates of it.
+'''
+
+import os
+import hashlib
+import sqlite3
+import collections
+import concurrent.futures
+
+HASH_CHUNK = 1024 * 1024
+HASH_JOBS = 4
+
+
+def hashFile(file_path, chunk_size=HASH_CHUNK):
+    '''
+    Returns sha256 hex digest of file_path, read chunk_size bytes at a time.
+    '''
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tryHashFile(file_path, chunk_size=HASH_CHUNK):
+    '''
+    Returns hashFile of file_path, or None if the file cannot be read.
+    '''
+    try:
+        return hashFile(file_path, chunk_size)
+    except OSError as ex:
+        print('Cannot hash {}. {}'.format(file_path, str(ex)))
+        return None
+
+
+def statFile(file_path):
+    try:
+        return os.stat(file_path)
+    except OSError:
+        return None
+
+
+class DedupIndex:
+    '''
+    SQLite table of file path, size, mtime and content hash.
+    Counts files hashed and hashes reused from the index.
+    '''
+
+    def __init__(self, index_file, jobs=HASH_JOBS, chunk_size=HASH_CHUNK):
+        self.index_file = index_file
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.hashed = 0
+        self.reused = 0
+        self.connection = sqlite3.connect(index_file)
+        self.connection.executescript(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime REAL, digest TEXT);'
+            'CREATE INDEX IF NOT EXISTS files_digest ON files (digest);'
+            )
+
+    def hashes(self, paths):
+        '''
+        Stats paths, then hashes the files whose size is shared with
+        another file in paths, unless the index holds a current hash.
+        Files that cannot be read are left unhashed.
+        Returns dictionary of path to hex digest for those files.
+        '''
+        paths = list(paths)
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as pool:
+            stats = list(pool.map(statFile, paths))
+            by_size = collections.defaultdict(list)
+            for file_path, stat_result in zip(paths, stats):
+                if stat_result is not None:
+                    by_size[stat_result.st_size].append(
+                        (file_path, stat_result)
+                        )
+            known = {
+                path: (size, mtime, digest) for path, size, mtime, digest in
+                self.connection.execute(
+                    'SELECT path, size, mtime, digest FROM files'
+                    )
+                }
+            digests = {}
+            to_hash = []
+            for group in by_size.values():
+                if len(group) < 2:
+                    continue
+                for file_path, stat_result in group:
+                    size, mtime, digest = known.get(
+                        file_path, (None, None, None)
+                        )
+                    if (size, mtime) == (stat_result.st_size,
+                                         stat_result.st_mtime):
+                        digests[file_path] = digest
+                        self.reused += 1
+                    else:
+                        to_hash.append((file_path, stat_result))
+            hashed = pool.map(
+                lambda item: tryHashFile(item[0], self.chunk_size), to_hash
+                )
+            rows = []
+            for (file_path, stat_result), digest in zip(to_hash, hashed):
+                if digest is None:
+                    continue
+                digests[file_path] = digest
+                rows.append((file_path, stat_result.st_size,
+                             stat_result.st_mtime, digest))
+        self.hashed += len(rows)
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', rows
+                )
+        return digests
+
+    def duplicates(self, paths):
+        '''
+        Returns dictionary of path to content hash for hashed paths, and
+        dictionary of each duplicate path to its original.
+        '''
+        digests = self.hashes(paths)
+        originals = {}
+        duplicates = {}
+        for file_path in sorted(digests):
+            digest = digests[file_path]
+            if digest in originals:
+                duplicates[file_path] = originals[digest]
+            else:
+                originals[digest] = file_path
+        return digests, duplicates
+
+    def originalOf(self, file_path):
+        '''
+        Returns the original of file_path if the index holds a current hash
+        of it and of an unchanged copy sorted before it, else None.
+        '''
+        row = self.connection.execute(
+            'SELECT size, mtime, digest FROM files WHERE path = ?',
+            (file_path,)
+            ).fetchone()
+        stat_result = statFile(file_path)
+        if not row or stat_result is None or \
+                row[:2] != (stat_result.st_size, stat_result.st_mtime):
+            return None
+        for original, size, mtime in self.connection.execute(
+                'SELECT path, size, mtime FROM files '
+                'WHERE digest = ? AND path < ? ORDER BY path',
+                (row[2], file_path)):
+            original_stat = statFile(original)
+            if original_stat is not None and (size, mtime) == (
+                    original_stat.st_size, original_stat.st_mtime):
+                return original
+        return None
+
+    def report(self):
+        return '{} files hashed, {} hashes reused'.format(
+            self.hashed, self.reused
+            )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+'''
+Local stand-in for the parts of the Blackfynn client used by
+dataWarehouseUpload.py and SparcDataOOP.BlackfynnUploader.
+
+Datasets, collections and packages are kept in memory. Every call that
+would reach the Blackfynn API is counted in FakeBlackfynn.calls, so upload
+planning can be checked and benchmarked without a profile or network.
+Latency and failures can be injected into uploads.
+'''
+
+import os
+import time
+import random
+import itertools
+import threading
+import collections
+
+
+class FakeSource:
+
+    def __init__(self, s3_key):
+        self.s3_key = s3_key
+
+
+class FakePackage:
+
+    def __init__(self, client, name, file_name):
+        self.client = client
+        self.id = 'N:package:{}'.format(next(client.ids))
+        self.name = name
+        self.type = 'Unknown'
+        self.file_name = file_name
+
+    @property
+    def sources(self):
+        self.client.call('sources')
+        return [FakeSource('fake-bucket/{}/{}'.format(self.id, self.file_name))]
+
+
+class FakeCollection:
+
+    def __init__(self, client, name, package_type='Collection'):
+        self.client = client
+        self.id = 'N:collection:{}'.format(next(client.ids))
+        self.name = name
+        self.type = package_type
+        self._items = []
+
+    @property
+    def items(self):
+        self.client.call('items')
+        return self._items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def create_collection(self, name):
+        self.client.call('create_collection')
+        collection = FakeCollection(self.client, name)
+        self._items.append(collection)
+        return collection
+
+    def upload(self, *files, **kwargs):
+        self.client.request('upload', len(files))
+        with self.client.lock:
+            for file_path in files:
+                file_path = str(file_path)
+                self._items.append(FakePackage(
+                    self.client,
+                    os.path.splitext(os.path.basename(file_path))[0],
+                    os.path.basename(file_path)
+                    ))
+        return [{'files': [str(file_path) for file_path in files]}]
+
+
+class FakeBlackfynn:
+    '''
+    In memory client holding named datasets. Uploads take latency
+    seconds plus per_file seconds for each file, and fail with
+    ConnectionError at failure_rate, like a slow or flaky link.
+    Listing and creating collections take call_latency seconds.
+    '''
+
+    def __init__(self, latency=0.0, per_file=0.0, failure_rate=0.0, seed=0,
+                 call_latency=0.0):
+        self.calls = collections.Counter()
+        self.ids = itertools.count(1)
+        self.datasets = {}
+        self.latency = latency
+        self.per_file = per_file
+        self.failure_rate = failure_rate
+        self.call_latency = call_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def request(self, call, files=1):
+        '''
+        Counts call and applies injected latency and failures.
+        '''
+        with self.lock:
+            self.calls[call] += 1
+            failed = self.random.random() < self.failure_rate
+        time.sleep(self.latency + self.per_file * files)
+        if failed:
+            with self.lock:
+                self.calls['failed_' + call] += 1
+            raise ConnectionError('Injected failure in {}'.format(call))
+
+    def call(self, call):
+        '''
+        Counts call and applies call_latency, without failures.
+        '''
+        with self.lock:
+            self.calls[call] += 1
+        if self.call_latency:
+            time.sleep(self.call_latency)
+
+    def get_dataset(self, name):
+        self.calls['get_dataset'] += 1
+        if name not in self.datasets:
+            self.datasets[name] = FakeCollection(self, name, 'DataSet')
+        return self.datasets[name]
@@ -1,330 +1,1062 @@
-#!/usr/bin/python3
-'''
-This program walks a root directory to find image files and log metadata
-properties in a dataframe, with optional command line functions. Data can
-then be written to csv log file, used to rename files to conform to SPARC-BIDS
-standards, or written to image files for search/filtering in filesystem.
-
-SPARC-BIDS data formatting standard
-https://docs.google.com/presentation/d/1EQPn1FmANpPsFt3CguU-JOQVMMlJsNXluQAK_gb2qVg/edit#slide=id.p1
-'''
-
-import pyexiv2
-import os
-import datetime
-import pandas as pd
-import argparse
-import collections
-import glob
-import csv
-
-def writeXmpTag(file_path, tag_list):
-    '''
-    Labels image files with metadata values as XMP property tags,
-    searchable in windows explorer.
-    '''
-
-    metadata = pyexiv2.ImageMetadata(file_path)
-    metadata.read()
-    metadata['Xmp.dc.subject'] = tag_list
-    metadata.write()
-
-def getSampleMetadata(file_path):
-    '''
-    Blocks of code parse input file path for source-format
-    specific metadata. First block is simple test for the SPARC conforming
-    format, the rest are user-specific formats. Code outside of blocks assign
-    remaining metadata based on common scheme and returns metadata dictionary.
-    '''
-
-    try:
-
-        if 'sam-' in os.path.basename(file_path):
-            sparc_path = file_path.split('/')[-1]
-            subject_id = sparc_path.split('_')[0][4:]
-            specimen = sparc_path.split('_')[1].split('-')[1]
-            laterality = sparc_path.split('_')[2].split('-')[1]
-            section = sparc_path.split('_')[4].split('-')[1]
-            magnification = sparc_path.split('_')[5].split('-')[1]
-            stain = sparc_path.split('_')[3].split('-')[1]
-            z_stack = sparc_path.split('_')[6]
-            if '+' in stain:
-                channel = 'overlay'
-                stain_1 = stain.split('+')[0]
-                stain_2 = stain.split('+')[1]
-            else:
-                channel = 'ch1'
-                stain_1 = sparc_path.split('_')[3].split('-')[1]
-                stain_2 = None
-
-        elif '5ht2b' in file_path:
-            subject_id = file_path.split('/')[-3]
-            laterality = file_path.split('/')[-2].split()[1]
-            stain_1 = '5ht2b'
-            stain_2 = 'ctb'
-            section = file_path.split('/')[-2].split()[3]
-            magnification = file_path.split('/')[-2].split()[4]
-
-        elif '5ht2a' in file_path:
-            subject_id = file_path.split('/')[-3]
-            laterality = file_path.split('/')[-2].split()[1]
-            stain_1 = '5ht2a'
-            stain_2 = 'ctb'
-            section = file_path.split('/')[-2].split()[3]
-            magnification = file_path.split('/')[-2].split()[4]
-
-        elif '5ht7' in file_path:
-            subject_id = file_path.split('/')[-3]
-            laterality = file_path.split('/')[-2].split()[1]
-            stain_1 = '5ht7'
-            stain_2 = 'ctb'
-            section = file_path.split('/')[-2].split()[-2]
-            magnification = file_path.split('/')[-2].split()[-1]
-
-        elif 'a2a' in file_path:
-            subject_id = file_path.split('/')[-1].split('_')[2]
-            laterality = file_path.split('/')[-1].split('_')[-3]
-            stain_1 = 'a2a'
-            stain_2 = 'ctb'
-            section = file_path.split('/')[-2].split('_')[3][3:]
-            magnification = file_path.split('/')[-2].split('_')[1]
-
-        elif '5ht' in file_path:
-            subject_id = file_path.split('/')[-1].split('_')[1]
-            magnification = file_path.split('/')[-1].split('_')[-2]
-            if 'section' in subject_id:
-                subject_id = file_path.split('/')[-1].split('_')[0].split()[2]
-            if magnification == '2x':
-                laterality = 'whole'
-            elif file_path.split('/')[-1].split('_')[-3].lower() in ['il', 'l', 'lft']:
-                laterality = 'left'
-            elif file_path.split('/')[-1].split('_')[-3].lower() in ['r', 'cl', 'rt']:
-                laterality = 'right'
-            else:
-                laterality = None
-            stain_1 = '5ht'
-            stain_2 = 'ctb'
-            if magnification == '2x':
-                section = file_path.split('/')[-1].split('_')[-3][7:]
-            elif 'section' in file_path.split('/')[-1].split('_')[1]:
-                section = file_path.split('/')[-1].split('_')[1][7:]
-            else:
-                section = file_path.split('/')[-1].split('_')[-4][7:]
-
-        else:
-            raise ValueError('Make sure root contains format label')
-
-        specimen = 'phrenic'
-        if  'channel' not in locals():
-            channel = file_path.split('/')[-1][-7:-4].lower()
-        if channel == 'ch1':
-            stain = stain_1
-            stain_2 = None
-        else:
-            channel = 'overlay'
-            stain = stain_1 + '+' + stain_2
-        if  'z_stack' not in locals():
-            z_stack = file_path.split('/')[-1].split('_')[-1].lower()
-        if 'z0' not in z_stack.lower():
-            z_stack = None
-
-        timestamp = str(
-                datetime.date.fromtimestamp(
-                    os.path.getmtime(
-                        file_path
-                        )))
-        filetype = os.path.splitext(
-                file_path
-                )[1]
-
-        metadata = [
-            timestamp, filetype, subject_id,
-            specimen, laterality, stain_1,
-            stain_2, channel, stain,
-            section, magnification, z_stack
-            ]
-
-        labels = [
-            'timestamp', 'filetype', 'subject_id',
-            'specimen', 'laterality', 'stain_1',
-            'stain_2', 'channel', 'stain',
-            'section', 'magnification', 'z_stack'
-            ]
-
-        if metadata:
-            sample_metadata = collections.OrderedDict(zip(labels, metadata))
-            return sample_metadata
-        else:
-            raise ValueError('Metadata missing')
-
-    except Exception as ex:
-        print('{} Metadata Error\n{}'.format(file_path, str(ex)))
-        traceback.print_tb()
-        return {}
-
-def getSparcFilePath(sample_metadata):
-    '''
-    Takes metadata dictionary and generates a file path conforming to sparc
-    data format. Returns sparc file path string.
-    '''
-
-    if 'z_stack' in sample_metadata:
-        sparc_file_path =
-            'samples/sam-{0}/{1}/{2}/{3}/section_{4}/{5}/'
-            'sam-{0}_spec-{1}_lat-{2}_stain-{3}_sec-{4}_mag-{5}_{6}_IHC{7}'
-            .format(
-                sample_metadata['subject_id'], sample_metadata['specimen'],
-                sample_metadata['laterality'], sample_metadata['stain'],
-                sample_metadata['section'], sample_metadata['magnification'],
-                sample_metadata['z_stack'], sample_metadata['filetype'],
-                )
-
-    else:
-        sparc_file_path =
-            'samples/sam-{0}/{1}/{2}/{3}/section_{4}/{5}/'
-            'sam-{0}_spec-{1}_lat-{2}_stain-{3}_sec-{4}_mag-{5}_IHC{6}'
-            .format(
-                sample_metadata['subject_id'], sample_metadata['specimen'],
-                sample_metadata['laterality'], sample_metadata['stain'],
-                sample_metadata['section'], sample_metadata['magnification'],
-                sample_metadata['filetype'],
-                )
-
-    return sparc_file_path
-
-def changeBaseName(file_path, sparc_file_path):
-    '''
-    Renames base name at file_path to conform to sparc_file_path.
-    '''
-
-    if os.path.basename(file_path) == os.path.basename(sparc_file_path):
-        print('{} already in sparc format'.format(file_path))
-        continue
-    else:
-        try:
-            os.rename(file_path, file_path.replace(
-                os.path.basename(file_path), os.path.basename(sparc_file_path)
-                )
-                    )
-        except Exception as ex:
-            print('Rename error for {}. {}'.format(file_path, str(ex)))
-            continue
-
-def collectDataframe(to_walk, dfSamples):
-    '''
-    Walks directory tree starting in to_walk, gets metadata and formatted file
-    path for .tif image files and collects them as rows in a dataframe.
-    Returns full dataframe.
-    '''
-
-    for root, dirs, files in os.walk(to_walk):
-        for file_path in files:
-            file_path = root + '/' + file_path
-            if file_path.endswith('.tif'):
-                sample_metadata = getSampleMetadata(file_path)
-                if sample_metadata:
-                    sparc_file_path = getSparcFilePath(sample_metadata)
-                    sample_metadata['sparc_file_path'] = sparc_file_path
-                sample_metadata['current_file_path'] = file_path
-                df = pd.DataFrame(data=sample_metadata,
-                                       columns=sample_metadata.keys(),index=[0])
-                dfSamples = dfSamples.append(df, ignore_index=True)
-            else:
-                pass
-    return dfSamples
-
-def writeMetadata(fromDf, toCsv):
-    '''
-    Writes metadata from collected dataframe to a log csv files.
-    '''
-    with open(toCsv, 'a+') as f:
-        has_data = f.readline()
-        if has_data:
-            f.to_csv(
-                f, header=False, index=False, line_terminator="\n"
-                )
-        else:
-            f.to_csv(
-                f, index=False, line_terminator="\n"
-                )
-
-def parseArguments():
-    '''
-    Parses command line arguments for optional file management
-    functions, source and destination file names. Returns arguments object.
-    '''
-
-    parser = argparse.ArgumentParser(description='Provide directory path to'
-    'walk and optionally write metadata, change names, or tag files.')
-    parser.add_argument('-wd', '--working_dir', type=str, default=getcwd(),
-                        help='set directory path to parse for files, defaults '
-                        'to current working directory.')
-    parser.add_argument('-cn', '--change_name',
-                        help='set to rename found files to sparc format',
-                        action="store_true")
-    parser.add_argument('-mf', '--metadata_file', type=str,
-                        help='set with valid file path to write metadata')
-    parser.add_argument('-tag', '--write_tags',
-                        help='set to write metadata to files in xmp namespace',
-                        action="store_true")
-    args = parser.parse_args()
-
-    dir = glob.glob(args.working_dir)
-    if not dir:
-        print('Invalid directory specified in arguments.')
-        exit()
-
-    if args.metadata_file and not args.metadata_file.endswith('.csv'):
-        print('Invalid file name for writing metadata')
-        exit()
-
-    return args
-
-def setup():
-    '''
-    Sets up command line arguments, checks/creates Csv file to write metadata,
-    initializes data frame. Returns arguments and dataframe objects.
-    '''
-    args = parseArguments()
-    if args.metadata_file:
-        try:
-            with open(args.metadata_file, 'a+') as csv:
-                csv.close()
-        except Exception as ex:
-            print('Error creating metadata .csv file. {}'.format(str(ex)))
-            exit()
-    dFrame = pd.DataFrame(data=None, columns=None)
-    return(args, dFrame)
-
-def main():
-    '''
-    Collects metadata dataframe and executes optional log csv file, file
-    renaming, and xmp metadata file tagging functions. Prints collected
-    dataframe header.
-    '''
-    (args, dFrame) = setup()
-    dFrame = collectDataframe(args.working_dir, dFrame)
-    if args.metadata_file:
-        writeMetadata(dFrame, args.metadata_file)
-    if args.change_name:
-        for row in dFrame.iterrows():
-            changeBaseName(row[1]['current_file_path'],
-                           row[1]['sparc_File_Path'])
-    if args.write_tags:
-        tagLabels = ['subject_id', 'specimen', 'laterality', 'stain_1',
-                    'stain_2', 'channel', 'section', 'magnification']
-        for row in dFrame.iterrows():
-            tagList = []
-            for label in tagLabels:
-                try:
-                    tagList.append(row[1][label])
-                except KeyError:
-                    print('Missing metadata {}\n{}'.format(
-                          label,row[1]['current_file_path']))
-            writeXmpTag(row[1]['current_file_path'], filter(None,tagList))]
-
-    print(dFrame.head())
-
-
-if __name__ == '__main__':
-    main()
+#!/usr/bin/python3
+'''
+This program walks a root directory to find image files and log metadata
+properties in a dataframe, with optional command line functions. Data can
+then be written to csv log file, used to rename files to conform to SPARC-BIDS
+standards, or written to image files for search/filtering in filesystem.
+
+SPARC-BIDS data formatting standard
+https://docs.google.com/presentation/d/1EQPn1FmANpPsFt3CguU-JOQVMMlJsNXluQAK_gb2qVg/edit#slide=id.p1
+'''
+
+import pyexiv2
+import os
+import datetime
+import pandas as pd
+import argparse
+import collections
+import glob
+import traceback
+import time
+import itertools
+import concurrent.futures
+import pathFormats
+import scanManifest
+import renamePlanner
+import dedupIndex
+import scanProfile
+import sparcCatalog
+import tiffHeader
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+METADATA_LABELS = [
+    'timestamp', 'filetype', 'subject_id',
+    'specimen', 'laterality', 'stain_1',
+    'stain_2', 'channel', 'stain',
+    'section', 'magnification', 'z_stack'
+    ]
+PATH_LABELS = ['sparc_file_path', 'current_file_path']
+# catalog columns with a saved secondary index
+INDEX_LABELS = [
+    'subject_id', 'stain', 'section', 'magnification', 'laterality'
+    ]
+COLUMN_LABELS = METADATA_LABELS + PATH_LABELS
+CATEGORY_LABELS = [
+    'specimen', 'stain', 'laterality', 'magnification', 'channel'
+    ]
+CHUNK_SIZE = 50000
+# directories listed ahead of the scan, per worker process
+DIRECTORY_PREFETCH = 8
+HEADER_LABELS = [
+    'image_width', 'image_height', 'bit_depth', 'samples_per_pixel',
+    'pages', 'xmp_bytes'
+    ]
+HEADER_JOBS = 8
+
+TAG_LABELS = [
+    'subject_id', 'specimen', 'laterality', 'stain_1',
+    'stain_2', 'channel', 'section', 'magnification'
+    ]
+TAG_JOBS = 4
+
+TagResult = collections.namedtuple(
+    'TagResult', ['file_path', 'status', 'seconds', 'error']
+    )
+
+# Directory listings and file stats made while scanning, per process
+SCAN_COUNTS = collections.Counter()
+
+def writeXmpTag(file_path, tag_list, skip_unchanged=True):
+    '''
+    Labels image files with metadata values as XMP property tags,
+    searchable in windows explorer. The file is only rewritten when its
+    existing tags differ. Returns True if written, False if skipped.
+    '''
+
+    tag_list = list(tag_list)
+    metadata = pyexiv2.ImageMetadata(file_path)
+    metadata.read()
+    if skip_unchanged and 'Xmp.dc.subject' in metadata.xmp_keys \
+            and metadata['Xmp.dc.subject'].value == tag_list:
+        return False
+    metadata['Xmp.dc.subject'] = tag_list
+    metadata.write()
+    return True
+
+def tagFile(file_path, tag_list):
+    '''
+    Writes XMP tags to one file for XmpTagger.
+    Returns TagResult with status and time taken.
+    '''
+    start = time.perf_counter()
+    try:
+        status = 'written' if writeXmpTag(file_path, tag_list) else 'skipped'
+        error = None
+    except Exception as ex:
+        status = 'failed'
+        error = str(ex)
+    return TagResult(file_path, status, time.perf_counter() - start, error)
+
+class XmpTagger:
+    '''
+    Writes XMP tags to many image files in a bounded thread pool, or
+    process pool, of jobs workers. Files whose tags already match are
+    skipped. Keeps per file results for the summary.
+    '''
+
+    def __init__(self, jobs=TAG_JOBS, processes=False):
+        self.jobs = jobs
+        self.processes = processes
+        self.results = []
+
+    def tagAll(self, tasks):
+        '''
+        Tags files from iterable of (file_path, tag_list) pairs.
+        Returns list of TagResult in task order.
+        '''
+        if self.processes:
+            executor = concurrent.futures.ProcessPoolExecutor
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor
+        tasks = list(tasks)
+        paths, tag_lists = zip(*tasks) if tasks else ((), ())
+        with executor(self.jobs) as pool:
+            results = list(pool.map(tagFile, paths, tag_lists))
+        for result in results:
+            if result.status == 'failed':
+                print('Tag error for {}. {}'.format(
+                    result.file_path, result.error))
+        self.results.extend(results)
+        return results
+
+    def summary(self, slowest=5):
+        '''
+        Returns text report of written, skipped and failed
+        counts, total time and the slowest files.
+        '''
+        counts = collections.Counter(result.status for result in self.results)
+        lines = ['{} written, {} skipped, {} failed in {:.2f}s'.format(
+            counts['written'], counts['skipped'], counts['failed'],
+            sum(result.seconds for result in self.results))]
+        for result in sorted(self.results, key=lambda result: result.seconds,
+                             reverse=True)[:slowest]:
+            lines.append('{:>8.3f}s {} {}'.format(
+                result.seconds, result.status, result.file_path))
+        return '\n'.join(lines)
+
+def parseSparcFormat(parts):
+    sparc_path = parts[-1].split('_')
+    stain = sparc_path[3].split('-')[1]
+    format_metadata = {
+        'subject_id': sparc_path[0][4:],
+        'specimen': sparc_path[1].split('-')[1],
+        'laterality': sparc_path[2].split('-')[1],
+        'section': sparc_path[4].split('-')[1],
+        'magnification': sparc_path[5].split('-')[1],
+        'z_stack': sparc_path[6],
+        }
+    if '+' in stain:
+        format_metadata['channel'] = 'overlay'
+        format_metadata['stain_1'], format_metadata['stain_2'] = \
+            stain.split('+')[:2]
+    else:
+        format_metadata['channel'] = 'ch1'
+        format_metadata['stain_1'] = stain
+        format_metadata['stain_2'] = None
+    return format_metadata
+
+def parseHt2Format(parts, stain_1):
+    folder = parts[-2].split()
+    return {
+        'subject_id': parts[-3], 'laterality': folder[1],
+        'stain_1': stain_1, 'stain_2': 'ctb',
+        'section': folder[3], 'magnification': folder[4],
+        }
+
+def parseHt2bFormat(parts):
+    return parseHt2Format(parts, '5ht2b')
+
+def parseHt2aFormat(parts):
+    return parseHt2Format(parts, '5ht2a')
+
+def parseHt7Format(parts):
+    folder = parts[-2].split()
+    return {
+        'subject_id': parts[-3], 'laterality': folder[1],
+        'stain_1': '5ht7', 'stain_2': 'ctb',
+        'section': folder[-2], 'magnification': folder[-1],
+        }
+
+def parseA2aFormat(parts):
+    name = parts[-1].split('_')
+    folder = parts[-2].split('_')
+    return {
+        'subject_id': name[2], 'laterality': name[-3],
+        'stain_1': 'a2a', 'stain_2': 'ctb',
+        'section': folder[3][3:], 'magnification': folder[1],
+        }
+
+def parseHtFormat(parts):
+    name = parts[-1].split('_')
+    subject_id = name[1]
+    magnification = name[-2]
+    if 'section' in subject_id:
+        subject_id = name[0].split()[2]
+    if magnification == '2x':
+        laterality = 'whole'
+    elif name[-3].lower() in ['il', 'l', 'lft']:
+        laterality = 'left'
+    elif name[-3].lower() in ['r', 'cl', 'rt']:
+        laterality = 'right'
+    else:
+        laterality = None
+    if magnification == '2x':
+        section = name[-3][7:]
+    elif 'section' in name[1]:
+        section = name[1][7:]
+    else:
+        section = name[-4][7:]
+    return {
+        'subject_id': subject_id, 'laterality': laterality,
+        'stain_1': '5ht', 'stain_2': 'ctb',
+        'section': section, 'magnification': magnification,
+        }
+
+# Parser of each source format in pathFormats.PATH_FORMATS.
+# Register a new lab format with a (label, parser) row.
+FILE_FORMATS = pathFormats.FormatClassifier([
+    ('sparc', parseSparcFormat),
+    ('5ht2b', parseHt2bFormat),
+    ('5ht2a', parseHt2aFormat),
+    ('5ht7', parseHt7Format),
+    ('a2a', parseA2aFormat),
+    ('5ht', parseHtFormat),
+    ])
+
+def getSampleMetadata(file_path, stat_result=None):
+    '''
+    Classifies input file path by source format and parses it with the
+    format specific parser registered in FILE_FORMATS. Code after the parser
+    assigns remaining metadata based on common scheme and returns metadata
+    dictionary. Timestamp is read from stat_result when the walker already
+    has it, otherwise the file is stat'ed.
+    '''
+
+    try:
+
+        path_format = FILE_FORMATS.classify(file_path)
+        if path_format is None:
+            raise ValueError('Make sure root contains format label')
+        label, handler, parts = path_format
+        format_metadata = handler(parts)
+        subject_id = format_metadata['subject_id']
+        laterality = format_metadata['laterality']
+        stain_1 = format_metadata['stain_1']
+        stain_2 = format_metadata['stain_2']
+        section = format_metadata['section']
+        magnification = format_metadata['magnification']
+
+        specimen = format_metadata.get('specimen', 'phrenic')
+        channel = format_metadata.get('channel') or parts[-1][-7:-4].lower()
+        if channel == 'ch1':
+            stain = stain_1
+            stain_2 = None
+        else:
+            channel = 'overlay'
+            stain = stain_1 + '+' + stain_2
+        if 'z_stack' in format_metadata:
+            z_stack = format_metadata['z_stack']
+        else:
+            z_stack = parts[-1].split('_')[-1].lower()
+        if 'z0' not in z_stack.lower():
+            z_stack = None
+
+        if stat_result is None:
+            SCAN_COUNTS['stat'] += 1
+            stat_result = os.stat(file_path)
+        timestamp = str(
+                datetime.date.fromtimestamp(
+                    stat_result.st_mtime
+                    ))
+        filetype = os.path.splitext(
+                parts[-1]
+                )[1]
+
+        metadata = [
+            timestamp, filetype, subject_id,
+            specimen, laterality, stain_1,
+            stain_2, channel, stain,
+            section, magnification, z_stack
+            ]
+
+        if metadata:
+            sample_metadata = collections.OrderedDict(
+                zip(METADATA_LABELS, metadata)
+                )
+            return sample_metadata
+        else:
+            raise ValueError('Metadata missing')
+
+    except Exception as ex:
+        print('{} Metadata Error\n{}'.format(file_path, str(ex)))
+        traceback.print_exc()
+        return {}
+
+def getSparcFilePath(sample_metadata):
+    '''
+    Takes metadata dictionary and generates a file path conforming to sparc
+    data format. Returns sparc file path string.
+    '''
+
+    if 'z_stack' in sample_metadata:
+        sparc_file_path = (
+            'samples/sam-{0}/{1}/{2}/{3}/section_{4}/{5}/'
+            'sam-{0}_spec-{1}_lat-{2}_stain-{3}_sec-{4}_mag-{5}_{6}_IHC{7}'
+            .format(
+                sample_metadata['subject_id'], sample_metadata['specimen'],
+                sample_metadata['laterality'], sample_metadata['stain'],
+                sample_metadata['section'], sample_metadata['magnification'],
+                sample_metadata['z_stack'], sample_metadata['filetype'],
+                ))
+
+    else:
+        sparc_file_path = (
+            'samples/sam-{0}/{1}/{2}/{3}/section_{4}/{5}/'
+            'sam-{0}_spec-{1}_lat-{2}_stain-{3}_sec-{4}_mag-{5}_IHC{6}'
+            .format(
+                sample_metadata['subject_id'], sample_metadata['specimen'],
+                sample_metadata['laterality'], sample_metadata['stain'],
+                sample_metadata['section'], sample_metadata['magnification'],
+                sample_metadata['filetype'],
+                ))
+
+    return sparc_file_path
+
+def changeBaseName(file_path, sparc_file_path):
+    '''
+    Renames base name at file_path to conform to sparc_file_path.
+    '''
+
+    if os.path.basename(file_path) == os.path.basename(sparc_file_path):
+        print('{} already in sparc format'.format(file_path))
+        return
+    else:
+        try:
+            os.rename(file_path, sparcBaseName(file_path, sparc_file_path))
+        except Exception as ex:
+            print('Rename error for {}. {}'.format(file_path, str(ex)))
+            return
+
+def sparcBaseName(file_path, sparc_file_path):
+    '''
+    Returns file_path with its base name replaced by that of sparc_file_path.
+    '''
+    return os.path.join(
+        os.path.dirname(file_path), os.path.basename(sparc_file_path)
+        )
+
+@scanProfile.timed('rename_plan')
+def planRenames(dFrame, relocate_dir=None):
+    '''
+    Computes rename targets for every parsed row of a scan dataframe, in
+    place or relocated under the sparc directory tree in relocate_dir.
+    Returns validated RenamePlan.
+    '''
+    pairs = []
+    for file_path, sparc_file_path in dFrame[
+            ['current_file_path', 'sparc_file_path']].itertuples(index=False):
+        if pd.isna(sparc_file_path):
+            continue
+        if relocate_dir:
+            pairs.append((
+                file_path, os.path.join(relocate_dir, sparc_file_path)
+                ))
+        else:
+            pairs.append((
+                file_path, sparcBaseName(file_path, sparc_file_path)
+                ))
+    return renamePlanner.RenamePlan(pairs)
+
+def newColumns():
+    return {label: [] for label in COLUMN_LABELS}
+
+def appendRow(columns, sample_metadata):
+    for label, column in columns.items():
+        column.append(sample_metadata.get(label))
+
+class MetadataBatch:
+    '''
+    Buffers sample metadata in one list per column and converts the buffer
+    to a dataframe chunk every chunk_size rows. Low-cardinality labels are
+    stored as categoricals. Chunks are passed to writer as they are made,
+    and only concatenated once, when the full dataframe is requested.
+    Without keep_chunks, chunks are dropped once written to bound memory.
+    Each chunk is passed through annotate, if set, before it is written.
+    '''
+
+    def __init__(self, chunk_size=CHUNK_SIZE, writer=None, keep_chunks=True,
+                 annotate=None):
+        self.chunk_size = chunk_size
+        self.writer = writer
+        self.keep_chunks = keep_chunks
+        self.annotate = annotate
+        self.chunks = []
+        self.rows = 0
+        self.columns = newColumns()
+
+    def append(self, sample_metadata):
+        appendRow(self.columns, sample_metadata)
+        self.rows += 1
+        if self.rows >= self.chunk_size:
+            self.flush()
+
+    def extend(self, columns):
+        '''
+        Adds a column batch, as returned by scanDirectory, to the buffer.
+        '''
+        for label, column in self.columns.items():
+            column.extend(columns[label])
+        self.rows += len(columns['current_file_path'])
+        if self.rows >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Converts buffered columns to a dataframe chunk and empties buffer.
+        Returns the chunk, or None if nothing was buffered.
+        '''
+        if not self.rows:
+            return None
+        with scanProfile.PROFILER.phase('dataframe'):
+            chunk = pd.DataFrame(self.columns, columns=COLUMN_LABELS)
+            for label in CATEGORY_LABELS:
+                chunk[label] = chunk[label].astype('category')
+        scanProfile.PROFILER.count('rows', self.rows)
+        if self.annotate:
+            chunk = self.annotate(chunk)
+        if self.writer:
+            self.writer.write(chunk)
+        if self.keep_chunks:
+            self.chunks.append(chunk)
+        self.rows = 0
+        self.columns = newColumns()
+        return chunk
+
+    def toDataframe(self):
+        '''
+        Returns all collected rows as one dataframe.
+        '''
+        self.flush()
+        if not self.chunks:
+            return pd.DataFrame(columns=COLUMN_LABELS)
+        with scanProfile.PROFILER.phase('dataframe'):
+            dFrame = pd.concat(self.chunks, ignore_index=True)
+            for label in CATEGORY_LABELS:
+                # chunks with different categories concatenate to object dtype
+                dFrame[label] = dFrame[label].astype('category')
+        return dFrame
+
+def readHeaderRow(file_path):
+    '''
+    Returns list of HEADER_LABELS values of a .tif file,
+    or None values if its header cannot be read.
+    '''
+    try:
+        header = tiffHeader.readTiffHeader(file_path)
+    except Exception as ex:
+        print('Cannot read TIFF header of {}. {}'.format(file_path, str(ex)))
+        return [None] * len(HEADER_LABELS)
+    return [header.width, header.height, header.bits_per_sample,
+            header.samples_per_pixel, header.pages, header.xmp_bytes]
+
+@scanProfile.timed('headers')
+def addHeaderColumns(chunk, jobs=HEADER_JOBS):
+    '''
+    Reads the TIFF header of every file in chunk in a pool of jobs
+    threads and adds HEADER_LABELS columns. Returns chunk.
+    '''
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        rows = list(pool.map(readHeaderRow, chunk['current_file_path']))
+    headers = pd.DataFrame(
+        rows, columns=HEADER_LABELS, index=chunk.index, dtype='Int64'
+        )
+    return pd.concat([chunk, headers], axis=1)
+
+@scanProfile.timed('parse')
+def collectRow(file_path, stat_result=None):
+    '''
+    Gets metadata and formatted sparc file path for a single image file.
+    Returns row dictionary for a metadata batch.
+    '''
+    sample_metadata = getSampleMetadata(file_path, stat_result)
+    if sample_metadata:
+        sample_metadata['sparc_file_path'] = getSparcFilePath(sample_metadata)
+    sample_metadata['current_file_path'] = file_path
+    return sample_metadata
+
+@scanProfile.timed('walk')
+def listDirectory(path):
+    '''
+    Lists path with a single scandir call. Returns subdirectory paths,
+    leaving out symlinks as os.walk does, and (file_path, stat_result)
+    pairs for .tif files. Each image is stat'ed once here, and the result
+    is reused for its metadata.
+    '''
+    dirs = []
+    images = []
+    stat_seconds = 0.0
+    SCAN_COUNTS['scandir'] += 1
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        dirs.append(entry.path)
+                elif entry.name.endswith('.tif'):
+                    SCAN_COUNTS['files'] += 1
+                    SCAN_COUNTS['stat'] += 1
+                    start = time.perf_counter()
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        stat_result = None
+                    stat_seconds += time.perf_counter() - start
+                    images.append((path + '/' + entry.name, stat_result))
+    except OSError as ex:
+        print('Cannot list {}. {}'.format(path, str(ex)))
+    if images and scanProfile.PROFILER.enabled:
+        scanProfile.PROFILER.add('stat', stat_seconds, len(images))
+    return dirs, images
+
+def imageChunks(images, chunk_size=CHUNK_SIZE):
+    '''
+    Yields lists of at most chunk_size (file_path, stat_result) pairs.
+    '''
+    images = iter(images)
+    while True:
+        chunk = list(itertools.islice(images, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def walkImages(to_walk):
+    '''
+    Walks directory tree starting in to_walk. Yields (file_path, stat_result)
+    for .tif image files in the same order as os.walk.
+    '''
+    dirs, images = listDirectory(to_walk)
+    yield from images
+    for path in dirs:
+        yield from walkImages(path)
+
+def rowColumns(images):
+    '''
+    Collects rows for (file_path, stat_result) pairs one at a time.
+    Returns column batch.
+    '''
+    columns = newColumns()
+    for file_path, stat_result in images:
+        appendRow(columns, collectRow(file_path, stat_result))
+    return columns
+
+def scanDirectory(path, chunk_size=CHUNK_SIZE, parse=False, profile=False):
+    '''
+    Lists one directory in a scanner worker process, timing phases if
+    profile. If parse, collects rows for its .tif image files. Returns
+    subdirectory paths, list of column batches of at most chunk_size rows
+    or, without parse, list of (file_path, stat_result), the worker's scan
+    counts and its profiler snapshot.
+    '''
+    SCAN_COUNTS.clear()
+    scanProfile.PROFILER.reset(profile)
+    dirs, images = listDirectory(path)
+    if parse:
+        images = [rowColumns(chunk)
+                  for chunk in imageChunks(images, chunk_size)]
+    return dirs, images, collections.Counter(SCAN_COUNTS), \
+        scanProfile.PROFILER.snapshot()
+
+def walkPool(to_walk, jobs, chunk_size=CHUNK_SIZE, parse=False):
+    '''
+    Scans every directory below to_walk with scanDirectory in a pool of jobs
+    worker processes, at most jobs * DIRECTORY_PREFETCH directories ahead
+    of the one being yielded. Yields the image list of each directory as it
+    is done, in the same order as walkImages.
+    '''
+    limit = jobs * DIRECTORY_PREFETCH
+    profile = scanProfile.PROFILER.enabled
+    # directories in walk order, with the future of their scan once started
+    order = collections.deque([[to_walk, None]])
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        while order:
+            for entry in itertools.islice(order, limit):
+                if entry[1] is None:
+                    entry[1] = pool.submit(
+                        scanDirectory, entry[0], chunk_size, parse, profile
+                        )
+            path, future = order.popleft()
+            dirs, images, counts, snapshot = future.result()
+            SCAN_COUNTS.update(counts)
+            scanProfile.PROFILER.merge(snapshot)
+            order.extendleft([subdir, None] for subdir in reversed(dirs))
+            yield images
+
+def dropRows(columns, skip):
+    '''
+    Returns column batch without the rows whose
+    current_file_path is in skip.
+    '''
+    keep = [
+        index for index, path in enumerate(columns['current_file_path'])
+        if path not in skip
+        ]
+    return {
+        label: [column[index] for index in keep]
+        for label, column in columns.items()
+        }
+
+def collectParallel(to_walk, batch, jobs, skip=frozenset()):
+    '''
+    Scans the directories of to_walk in a pool of jobs worker processes.
+    Column batches are merged into batch as each directory is done, in the
+    same order a serial walk would visit them, leaving out paths in skip.
+    '''
+    for batches in walkPool(to_walk, jobs, batch.chunk_size, True):
+        for columns in batches:
+            if skip:
+                columns = dropRows(columns, skip)
+            batch.extend(columns)
+
+def collectDataframe(to_walk, dfSamples, chunk_size=CHUNK_SIZE, jobs=1,
+                     writer=None, keep_chunks=True, headers=False):
+    '''
+    Walks directory tree starting in to_walk, gets metadata and formatted file
+    path for .tif image files and collects them in a metadata batch. With
+    more than one job, directories are scanned in worker processes.
+    Chunks are streamed to writer while scanning, and files it already holds
+    are skipped. With headers, TIFF header columns are added to each chunk.
+    Returns full dataframe, appended to dfSamples.
+    '''
+
+    batch = MetadataBatch(chunk_size, writer, keep_chunks,
+                          addHeaderColumns if headers else None)
+    skip = writer.writtenPaths() if writer else frozenset()
+    if jobs > 1:
+        collectParallel(to_walk, batch, jobs, skip)
+    else:
+        for file_path, stat_result in walkImages(to_walk):
+            if file_path not in skip:
+                batch.append(collectRow(file_path, stat_result))
+    dFrame = batch.toDataframe()
+    if dfSamples.empty:
+        return dFrame
+    return pd.concat([dfSamples, dFrame], ignore_index=True)
+
+def walkParallel(to_walk, jobs):
+    '''
+    Walks the directories of to_walk in a pool of jobs worker processes.
+    Yields (file_path, stat_result) in the same order as walkImages.
+    '''
+    for images in walkPool(to_walk, jobs):
+        yield from images
+
+def collectIncremental(to_walk, manifest, chunk_size=CHUNK_SIZE, jobs=1,
+                       writer=None, keep_chunks=True, headers=False):
+    '''
+    Walks directory tree starting in to_walk and compares mtime and size of
+    each .tif image file against the scan manifest. Only new or modified
+    files are parsed and stored, files missing from the tree are removed.
+    Files that cannot be stat'ed keep their manifest row.
+    The full dataframe is then built from the manifest, streaming chunks to
+    writer, with TIFF header columns if headers is set.
+    Returns dataframe and the scan delta.
+    '''
+    known = manifest.signatures()
+    if jobs > 1:
+        images = walkParallel(to_walk, jobs)
+    else:
+        images = walkImages(to_walk)
+    changed = []
+    added = modified = unchanged = unreadable = 0
+    for file_path, stat_result in images:
+        if stat_result is None:
+            # still in the tree, so not removed
+            known.pop(file_path, None)
+            unreadable += 1
+            continue
+        signature = known.pop(file_path, None)
+        if signature == (stat_result.st_mtime, stat_result.st_size):
+            unchanged += 1
+            continue
+        if signature is None:
+            added += 1
+        else:
+            modified += 1
+        changed.append((stat_result, collectRow(file_path, stat_result)))
+        if len(changed) >= chunk_size:
+            manifest.upsert(changed)
+            changed = []
+    manifest.upsert(changed)
+    # files left in known were not found by the walk
+    manifest.remove(known)
+    manifest.commit()
+
+    batch = MetadataBatch(chunk_size, writer, keep_chunks,
+                          addHeaderColumns if headers else None)
+    for columns in manifest.rows(chunk_size):
+        batch.extend(columns)
+    delta = scanManifest.ScanDelta(
+        added, modified, len(known), unchanged, unreadable
+        )
+    return batch.toDataframe(), delta
+
+@scanProfile.timed('hash')
+def flagDuplicates(dFrame, dedup):
+    '''
+    Hashes files of dFrame sharing a size through dedup, a DedupIndex.
+    Adds content_hash, and duplicate_of holding the original file path
+    of byte-identical copies. Returns dataframe.
+    '''
+    digests, duplicates = dedup.duplicates(dFrame['current_file_path'])
+    dFrame['content_hash'] = dFrame['current_file_path'].map(digests)
+    dFrame['duplicate_of'] = dFrame['current_file_path'].map(duplicates)
+    return dFrame
+
+def buildCatalog(dFrame):
+    '''
+    Returns SparcCatalog of the metadata and paths in dFrame,
+    interning metadata values into integer codes.
+    '''
+    catalog = sparcCatalog.SparcCatalog(METADATA_LABELS, PATH_LABELS)
+    catalog.addDataframe(dFrame)
+    catalog.freeze()
+    return catalog
+
+def scanReport():
+    '''
+    Returns a summary of the directory listings and
+    file stats made per image file in this scan.
+    '''
+    files = SCAN_COUNTS['files']
+    syscalls = SCAN_COUNTS['scandir'] + SCAN_COUNTS['stat']
+    return '{} image files, {} scandir and {} stat calls, ' \
+        '{:.2f} syscalls per file'.format(
+            files, SCAN_COUNTS['scandir'], SCAN_COUNTS['stat'],
+            syscalls / files if files else 0)
+
+def parquetSchema(labels):
+    '''
+    Returns pyarrow schema of the metadata columns in labels. Types come
+    from the column lists rather than from the values in a chunk, so a
+    column holding only None values is still written as strings and every
+    part of a .parquet directory has the same schema.
+    '''
+    fields = []
+    for label in labels:
+        if label in CATEGORY_LABELS:
+            field_type = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        elif label in HEADER_LABELS:
+            field_type = pyarrow.int64()
+        else:
+            field_type = pyarrow.string()
+        fields.append(pyarrow.field(label, field_type))
+    return pyarrow.schema(fields)
+
+class MetadataWriter:
+    '''
+    Appends metadata dataframe chunks to a .csv log file, or to a .parquet
+    directory of part files, as they are collected. Each chunk is complete
+    on disk once write returns, so an interrupted scan leaves a valid file
+    that a resumed scan appends to.
+    '''
+
+    def __init__(self, metadata_file, resume=True):
+        self.metadata_file = metadata_file
+        self.parquet = metadata_file.endswith('.parquet')
+        self.rows = 0
+        if self.parquet:
+            if not resume:
+                for part in glob.glob(os.path.join(metadata_file, '*')):
+                    os.remove(part)
+            os.makedirs(metadata_file, exist_ok=True)
+            # parts an interrupted write left unfinished
+            for temp in glob.glob(os.path.join(metadata_file, '.part-*.tmp')):
+                os.remove(temp)
+            parts = self.partFiles()
+            self.parts = int(parts[-1][-13:-8]) + 1 if parts else 0
+        else:
+            if not resume:
+                open(metadata_file, 'w').close()
+            self.truncatePartialLine()
+
+    def partFiles(self):
+        return sorted(glob.glob(
+            os.path.join(self.metadata_file, 'part-*.parquet')
+            ))
+
+    def truncatePartialLine(self):
+        '''
+        Cuts a row left unfinished by an interrupted write
+        from the end of the csv file.
+        '''
+        with open(self.metadata_file, 'a+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if not size:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            f.seek(0)
+            complete = f.read().rfind(b'\n') + 1
+            f.truncate(complete)
+
+    def writtenPaths(self):
+        '''
+        Returns set of current_file_path values already in metadata file.
+        '''
+        if self.parquet:
+            return set(
+                path for part in self.partFiles()
+                for path in pd.read_parquet(
+                    part, columns=['current_file_path']
+                    )['current_file_path']
+                )
+        if not os.path.getsize(self.metadata_file):
+            return set()
+        return set(pd.read_csv(
+            self.metadata_file, usecols=['current_file_path']
+            )['current_file_path'])
+
+    @scanProfile.timed('write')
+    def write(self, chunk):
+        if self.parquet:
+            name = 'part-{:05d}.parquet'.format(self.parts)
+            part = os.path.join(self.metadata_file, name)
+            # written under a hidden name that reading the directory skips,
+            # renamed only once complete, so no part is ever partial
+            temp = os.path.join(
+                self.metadata_file, '.part-{:05d}.tmp'.format(self.parts)
+                )
+            table = pyarrow.Table.from_pandas(
+                chunk, schema=parquetSchema(chunk.columns),
+                preserve_index=False
+                )
+            pyarrow.parquet.write_table(
+                table, temp, row_group_size=len(chunk)
+                )
+            os.replace(temp, part)
+            self.parts += 1
+        else:
+            with open(self.metadata_file, 'a') as f:
+                header = f.tell() == 0
+                chunk.to_csv(
+                    f, header=header, index=False, lineterminator="\n"
+                    )
+        self.rows += len(chunk)
+
+def writeMetadata(fromDf, toCsv):
+    '''
+    Writes metadata from collected dataframe to a log csv files.
+    '''
+    MetadataWriter(toCsv).write(fromDf)
+
+def parseArguments():
+    '''
+    Parses command line arguments for optional file management
+    functions, source and destination file names. Returns arguments object.
+    '''
+
+    parser = argparse.ArgumentParser(description='Provide directory path to'
+    'walk and optionally write metadata, change names, or tag files.')
+    parser.add_argument('-wd', '--working_dir', type=str, default=os.getcwd(),
+                        help='set directory path to parse for files, defaults '
+                        'to current working directory.')
+    parser.add_argument('-cn', '--change_name',
+                        help='set to rename found files to sparc format',
+                        action="store_true")
+    parser.add_argument('-rd', '--relocate_dir', type=str,
+                        help='set with directory path to move found files '
+                        'into sparc directory tree')
+    parser.add_argument('-rj', '--rename_journal', type=str,
+                        default='rename_journal.csv',
+                        help='set file path of undo journal for renames, '
+                        'defaults to rename_journal.csv.')
+    parser.add_argument('-ur', '--undo_renames',
+                        help='set to undo renames in rename journal and exit',
+                        action="store_true")
+    parser.add_argument('-mf', '--metadata_file', type=str,
+                        help='set with valid .csv or .parquet file path to '
+                        'write metadata, resuming an interrupted scan')
+    parser.add_argument('-tag', '--write_tags',
+                        help='set to write metadata to files in xmp namespace',
+                        action="store_true")
+    parser.add_argument('-mn', '--manifest', type=str,
+                        help='set with file path of scan manifest to only '
+                        'parse new or modified files')
+    parser.add_argument('-tj', '--tag_jobs', type=int, default=TAG_JOBS,
+                        help='set number of files tagged at once, defaults '
+                        'to {}.'.format(TAG_JOBS))
+    parser.add_argument('-hd', '--read_headers',
+                        help='set to add tiff dimensions, bit depth, page '
+                        'count and xmp packet size to metadata',
+                        action="store_true")
+    parser.add_argument('-dd', '--dedup_index', type=str,
+                        help='set with file path of content hash index to '
+                        'flag byte-identical copies in metadata')
+    parser.add_argument('-hj', '--hash_jobs', type=int,
+                        default=dedupIndex.HASH_JOBS,
+                        help='set number of files hashed at once, defaults '
+                        'to {}.'.format(dedupIndex.HASH_JOBS))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='set number of worker processes used to scan '
+                        'directories, defaults to 1.')
+    parser.add_argument('-ct', '--catalog', type=str,
+                        help='set with directory path to save a compact '
+                        'catalog of the metadata, with values stored as '
+                        'integer codes and indexes for sample, stain, '
+                        'section, magnification and laterality queries')
+    parser.add_argument('-pf', '--profile',
+                        help='set to add cProfile function times and '
+                        'tracemalloc allocations to the profile report',
+                        action="store_true")
+    parser.add_argument('-pr', '--profile_report', type=str,
+                        help='set with file path of json report of phase '
+                        'times and counters, defaults to {} with '
+                        '--profile.'.format(scanProfile.PROFILE_REPORT))
+    args = parser.parse_args()
+
+    dir = glob.glob(args.working_dir)
+    if not dir:
+        print('Invalid directory specified in arguments.')
+        exit()
+
+    if args.metadata_file and not args.metadata_file.endswith(
+            ('.csv', '.parquet')):
+        print('Invalid file name for writing metadata')
+        exit()
+
+    if args.metadata_file and args.metadata_file.endswith('.parquet') \
+            and pyarrow is None:
+        print('Writing .parquet metadata requires pyarrow')
+        exit()
+
+    if args.jobs < 1 or args.tag_jobs < 1 or args.hash_jobs < 1:
+        print('Invalid number of jobs specified in arguments.')
+        exit()
+
+    return args
+
+def setup():
+    '''
+    Sets up command line arguments, checks/creates Csv file to write metadata,
+    initializes data frame. Returns arguments and dataframe objects.
+    '''
+    args = parseArguments()
+    if args.metadata_file:
+        try:
+            if args.metadata_file.endswith('.parquet'):
+                os.makedirs(args.metadata_file, exist_ok=True)
+            else:
+                with open(args.metadata_file, 'a+') as metadata_file:
+                    metadata_file.close()
+        except Exception as ex:
+            print('Error creating metadata file. {}'.format(str(ex)))
+            exit()
+    dFrame = pd.DataFrame(data=None, columns=None)
+    return(args, dFrame)
+
+def main():
+    '''
+    Collects metadata dataframe and executes optional log csv file, file
+    renaming, and xmp metadata file tagging functions. Prints collected
+    dataframe header.
+    '''
+    (args, dFrame) = setup()
+    if args.profile and not args.profile_report:
+        args.profile_report = scanProfile.PROFILE_REPORT
+    if args.profile_report:
+        scanProfile.PROFILER.enable(args.profile, args.profile)
+    if args.undo_renames:
+        counts = renamePlanner.undoRenames(args.rename_journal)
+        print('{} restored, {} failed'.format(
+            counts['restored'], counts['failed']))
+        return
+    writer = None
+    if args.metadata_file:
+        # a manifest rescan rewrites the whole file from the manifest,
+        # duplicates are only known once the whole tree is scanned
+        writer = MetadataWriter(
+            args.metadata_file,
+            resume=not (args.manifest or args.dedup_index)
+            )
+    scan_writer = None if args.dedup_index else writer
+    keep_chunks = args.change_name or args.relocate_dir or args.write_tags \
+        or args.catalog or not scan_writer
+    with scanProfile.PROFILER.phase('scan'):
+        if args.manifest:
+            manifest = scanManifest.ScanManifest(args.manifest, COLUMN_LABELS)
+            dFrame, delta = collectIncremental(
+                args.working_dir, manifest, jobs=args.jobs,
+                writer=scan_writer, keep_chunks=keep_chunks,
+                headers=args.read_headers
+                )
+            manifest.close()
+            print('{} added, {} modified, {} removed, {} unchanged, '
+                  '{} unreadable'.format(*delta))
+        else:
+            dFrame = collectDataframe(
+                args.working_dir, dFrame, jobs=args.jobs,
+                writer=scan_writer, keep_chunks=keep_chunks,
+                headers=args.read_headers
+                )
+    if args.dedup_index:
+        dedup = dedupIndex.DedupIndex(args.dedup_index, args.hash_jobs)
+        dFrame = flagDuplicates(dFrame, dedup)
+        dedup.close()
+        print('{}, {} duplicates'.format(
+            dedup.report(), dFrame['duplicate_of'].notna().sum()))
+        if writer:
+            writer.write(dFrame)
+    if writer:
+        print('{} rows written to {}'.format(
+            writer.rows, args.metadata_file))
+    if args.catalog:
+        catalog = buildCatalog(dFrame)
+        catalog.save(args.catalog, INDEX_LABELS)
+        print('{} rows, {} code bytes saved to catalog {}'.format(
+            len(catalog), catalog.nbytes(), args.catalog))
+    if args.change_name or args.relocate_dir:
+        plan = planRenames(dFrame, args.relocate_dir)
+        print(plan.report())
+        with scanProfile.PROFILER.phase('rename'):
+            counts = plan.execute(args.rename_journal)
+        scanProfile.PROFILER.count('renamed', counts['renamed'])
+        print('{} renamed, {} failed, undo journal {}'.format(
+            counts['renamed'], counts['failed'], args.rename_journal))
+    if args.write_tags:
+        tasks = []
+        for row in dFrame[['current_file_path'] + TAG_LABELS].itertuples(
+                index=False):
+            tasks.append((
+                row[0], [str(value) for value in row[1:] if pd.notna(value)]
+                ))
+        tagger = XmpTagger(args.tag_jobs)
+        with scanProfile.PROFILER.phase('xmp'):
+            results = tagger.tagAll(tasks)
+        for result in results:
+            scanProfile.PROFILER.count('xmp_' + result.status)
+        print(tagger.summary())
+
+    print(dFrame.head())
+    print(scanReport())
+    if args.profile_report:
+        scanProfile.PROFILER.write(args.profile_report, SCAN_COUNTS)
+        print('Profile report written to {}'.format(args.profile_report))
+
+
+if __name__ == '__main__':
+    main()
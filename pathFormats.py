@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+'''
+Registry of image file path formats shared by imageFileManager and
+SparcDataOOP.
+
+Each user wrote image paths with their own labels ('5ht2b', 'a2a', ...).
+PATH_FORMATS holds one (label, compiled pattern) row per format in
+priority order, and a path belongs to the first format whose pattern is
+found in it. Each module classifies paths with a FormatClassifier holding
+its own handler per label. Adding a lab format is a call to
+registerFormat() and a handler for its label in each module.
+'''
+
+import re
+
+PATH_FORMATS = []
+
+
+def registerFormat(label, pattern, before=None):
+    '''
+    Adds a format to the registry, at the end or
+    ahead of the format labelled before.
+    '''
+    row = (label, re.compile(pattern))
+    if before is None:
+        PATH_FORMATS.append(row)
+    else:
+        labels = [fmt[0] for fmt in PATH_FORMATS]
+        PATH_FORMATS.insert(labels.index(before), row)
+
+
+# file names already in sparc format come first, longer stain labels
+# ahead of the '5ht' they contain
+for label, pattern in [
+        ('sparc', r'sam-[^/]*$'),
+        ('5ht2b', '5ht2b'),
+        ('5ht2a', '5ht2a'),
+        ('5ht7', '5ht7'),
+        ('a2a', 'a2a'),
+        ('5ht', '5ht'),
+        ]:
+    registerFormat(label, pattern)
+
+
+class FormatClassifier:
+    '''
+    Classifies paths against PATH_FORMATS, for the formats
+    given a handler in (label, handler) rows.
+    '''
+
+    def __init__(self, handlers=()):
+        self.handlers = dict(handlers)
+
+    def classify(self, path):
+        '''
+        Returns (label, handler, parts) for the highest priority format
+        found in path string, parts being the path split at '/', or None.
+        '''
+        for label, pattern in PATH_FORMATS:
+            if label in self.handlers and pattern.search(path):
+                return label, self.handlers[label], path.split('/')
+        return None
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+'''
+Plans and executes renames for a whole scan result at once.
+
+All targets are computed before any file is touched. Duplicate targets, and
+targets that already exist on disk, are reported as conflicts and left out.
+Existing files are looked up in one directory listing per target directory,
+missing directories are created once each, and renames run in a thread
+pool. Every completed rename is appended to an undo journal so a batch can
+be rolled back with undoRenames.
+'''
+
+import os
+import csv
+import threading
+import collections
+import concurrent.futures
+
+RENAME_JOBS = 8
+
+RenameConflict = collections.namedtuple(
+    'RenameConflict', ['source', 'target', 'reason']
+    )
+
+
+class RenamePlan:
+    '''
+    Validated set of (source, target) renames. Sources whose target equals
+    the source are counted as unchanged, conflicting pairs are kept in
+    conflicts and are not executed.
+    '''
+
+    def __init__(self, pairs):
+        self.renames = []
+        self.conflicts = []
+        self.unchanged = 0
+        self.listings = {}
+        self.missing = set()
+        self.plan(pairs)
+
+    def listDirectory(self, path):
+        '''
+        Returns set of names in path, listing each directory only once.
+        Missing directories are empty and remembered in missing.
+        '''
+        if path not in self.listings:
+            try:
+                self.listings[path] = set(os.listdir(path))
+            except FileNotFoundError:
+                self.listings[path] = set()
+                self.missing.add(path)
+        return self.listings[path]
+
+    def plan(self, pairs):
+        targets = collections.defaultdict(list)
+        for source, target in pairs:
+            if source == target:
+                self.unchanged += 1
+            else:
+                targets[target].append(source)
+        sources = set(
+            source for sources in targets.values() for source in sources
+            )
+
+        for target, target_sources in targets.items():
+            if len(target_sources) > 1:
+                for source in target_sources:
+                    self.conflicts.append(
+                        RenameConflict(source, target, 'duplicate target')
+                        )
+            elif target in sources:
+                self.conflicts.append(RenameConflict(
+                    target_sources[0], target, 'target is renamed source'
+                    ))
+            elif os.path.basename(target) in self.listDirectory(
+                    os.path.dirname(target) or '.'):
+                self.conflicts.append(RenameConflict(
+                    target_sources[0], target, 'target exists'
+                    ))
+            else:
+                self.renames.append((target_sources[0], target))
+
+    def missingDirectories(self):
+        '''
+        Returns sorted target directories that do not exist yet, leaving
+        out any whose subdirectory is also missing, as makedirs creates
+        the parents on the way. Uses the listings made while planning, so
+        no directory is looked up again.
+        '''
+        missing = set(os.path.dirname(target) for source, target in
+                      self.renames) & self.missing
+        parents = set(
+            os.path.dirname(path) for path in missing
+            )
+        return sorted(missing - parents)
+
+    def execute(self, journal_file, jobs=RENAME_JOBS):
+        '''
+        Creates missing directories, then renames files in a pool of jobs
+        threads. Completed renames are appended to journal_file.
+        Returns counts of renamed and failed files.
+        '''
+        for path in self.missingDirectories():
+            os.makedirs(path, exist_ok=True)
+
+        counts = collections.Counter()
+        lock = threading.Lock()
+        with open(journal_file, 'a', newline='') as journal:
+            writer = csv.writer(journal)
+
+            def rename(pair):
+                source, target = pair
+                try:
+                    os.rename(source, target)
+                except Exception as ex:
+                    print('Rename error for {}. {}'.format(source, str(ex)))
+                    with lock:
+                        counts['failed'] += 1
+                    return
+                with lock:
+                    writer.writerow([source, target])
+                    journal.flush()
+                    counts['renamed'] += 1
+
+            with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+                list(pool.map(rename, self.renames))
+        return counts
+
+    def report(self):
+        lines = ['{} to rename, {} unchanged, {} conflicts'.format(
+            len(self.renames), self.unchanged, len(self.conflicts))]
+        for conflict in self.conflicts:
+            lines.append('{}: {} -> {}'.format(
+                conflict.reason, conflict.source, conflict.target))
+        return '\n'.join(lines)
+
+
+def undoRenames(journal_file):
+    '''
+    Reverses the renames recorded in journal_file, newest first, and
+    removes the journal once all are restored.
+    Returns counts of restored and failed files.
+    '''
+    with open(journal_file, newline='') as journal:
+        renames = list(csv.reader(journal))
+    counts = collections.Counter()
+    for source, target in reversed(renames):
+        if os.path.lexists(source):
+            print('Cannot undo {}: {} exists'.format(target, source))
+            counts['failed'] += 1
+            continue
+        try:
+            os.rename(target, source)
+            counts['restored'] += 1
+        except Exception as ex:
+            print('Undo error for {}. {}'.format(target, str(ex)))
+            counts['failed'] += 1
+    if not counts['failed']:
+        os.remove(journal_file)
+    return counts
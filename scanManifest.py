@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+'''
+Persistent record of a scanned image repository, kept in a SQLite file.
+
+Each image file is stored with the mtime and size it had when it was parsed,
+its parsed metadata and its sparc file path. A rescan compares the stat of
+every walked file against the manifest, so only new or modified files are
+parsed again and files no longer on disk are dropped. Files found but not
+stat'ed keep the row of the scan before.
+'''
+
+import sqlite3
+import collections
+
+ScanDelta = collections.namedtuple(
+    'ScanDelta', ['added', 'modified', 'removed', 'unchanged', 'unreadable']
+    )
+
+
+class ScanManifest:
+    '''
+    SQLite manifest of image files keyed by current_file_path.
+    Stores one column per label in labels, which must include
+    current_file_path.
+    '''
+
+    def __init__(self, manifest_file, labels):
+        self.manifest_file = manifest_file
+        self.labels = list(labels)
+        self.connection = sqlite3.connect(manifest_file)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS images ('
+            'current_file_path TEXT PRIMARY KEY, mtime REAL, size INTEGER, '
+            '{})'.format(', '.join(
+                '{} TEXT'.format(label) for label in self.labels
+                if label != 'current_file_path'
+                ))
+            )
+        self.connection.commit()
+
+    def signatures(self):
+        '''
+        Returns dictionary of current_file_path to (mtime, size)
+        for every file in the manifest.
+        '''
+        return {
+            path: (mtime, size) for path, mtime, size in
+            self.connection.execute(
+                'SELECT current_file_path, mtime, size FROM images'
+                )
+            }
+
+    def upsert(self, rows):
+        '''
+        Inserts or replaces (stat_result, row dictionary) pairs.
+        '''
+        columns = ['mtime', 'size'] + self.labels
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO images ({}) VALUES ({})'.format(
+                ', '.join(columns), ', '.join('?' * len(columns))
+                ),
+            ([stat_result.st_mtime, stat_result.st_size] +
+             [row.get(label) for label in self.labels]
+             for stat_result, row in rows)
+            )
+
+    def remove(self, paths):
+        self.connection.executemany(
+            'DELETE FROM images WHERE current_file_path = ?',
+            ((path,) for path in paths)
+            )
+
+    def commit(self):
+        self.connection.commit()
+
+    def rows(self, chunk_size):
+        '''
+        Yields column batches of at most chunk_size rows,
+        ordered by current_file_path.
+        '''
+        cursor = self.connection.execute(
+            'SELECT {} FROM images ORDER BY current_file_path'.format(
+                ', '.join(self.labels)
+                )
+            )
+        while True:
+            fetched = cursor.fetchmany(chunk_size)
+            if not fetched:
+                break
+            yield dict(zip(self.labels, map(list, zip(*fetched))))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+'''
+Per-phase timers and counters for image scans, renames, tagging and
+uploads, with optional cProfile and tracemalloc capture, written as a JSON
+report at the end of a run.
+
+Phases are blocks timed with PROFILER.phase(name), or functions wrapped
+with timed(name). A phase holds the total seconds and number of calls of
+its block, and phases may nest, so a phase includes the phases run inside
+it. Timing is off until PROFILER.enable() is called, and a disabled timed
+function only pays one extra call and flag check.
+
+Scanner worker processes keep their own PROFILER. Their totals are passed
+back with snapshot() and merge(), so worker phases add up the seconds
+spent in every process. cProfile and tracemalloc cover the main process.
+'''
+
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import contextlib
+import tracemalloc
+import collections
+
+PROFILE_REPORT = 'scan_profile.json'
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 15
+
+
+class ScanProfiler:
+    '''
+    Total seconds and calls per phase name, and event counters.
+    Thread safe, so phases can be timed in worker threads.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.seconds = collections.Counter()
+        self.calls = collections.Counter()
+        self.counts = collections.Counter()
+        self.profile = None
+        self.start = time.perf_counter()
+
+    def enable(self, profile=False, memory=False):
+        '''
+        Starts timing phases, with a cProfile of the main thread if profile
+        and tracemalloc allocation tracking if memory.
+        '''
+        self.enabled = True
+        self.start = time.perf_counter()
+        if profile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        if memory:
+            tracemalloc.start()
+
+    def reset(self, enabled=False):
+        '''
+        Drops all totals, and any capture inherited by a forked worker.
+        '''
+        if self.profile:
+            self.profile.disable()
+            self.profile = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.enabled = enabled
+        self.seconds.clear()
+        self.calls.clear()
+        self.counts.clear()
+        self.start = time.perf_counter()
+
+    def add(self, name, seconds, calls=1):
+        with self.lock:
+            self.seconds[name] += seconds
+            self.calls[name] += calls
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counts[name] += value
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        '''
+        Returns picklable totals, for merge() in the parent process.
+        '''
+        return dict(self.seconds), dict(self.calls), dict(self.counts)
+
+    def merge(self, snapshot):
+        seconds, calls, counts = snapshot
+        with self.lock:
+            self.seconds.update(seconds)
+            self.calls.update(calls)
+            self.counts.update(counts)
+
+    def functions(self, top=TOP_FUNCTIONS):
+        '''
+        Returns list of the top functions by cumulative time in the
+        cProfile capture, or None if there is no capture.
+        '''
+        if not self.profile:
+            return None
+        self.profile.disable()
+        stats = pstats.Stats(self.profile, stream=io.StringIO())
+        rows = []
+        for (file_name, line, function), (
+                calls, total_calls, own, cumulative, callers) in \
+                stats.stats.items():
+            rows.append({
+                'function': '{}:{}({})'.format(file_name, line, function),
+                'calls': total_calls,
+                'seconds': own,
+                'cumulative': cumulative,
+                })
+        rows.sort(key=lambda row: row['cumulative'], reverse=True)
+        return rows[:top]
+
+    def memory(self, top=TOP_ALLOCATIONS):
+        '''
+        Returns current and peak traced bytes and the top allocation
+        sites, or None if tracemalloc is not tracing.
+        '''
+        if not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        sites = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        return {
+            'current': current,
+            'peak': peak,
+            'top': [{
+                'site': '{}:{}'.format(site.traceback[0].filename,
+                                       site.traceback[0].lineno),
+                'bytes': site.size,
+                'blocks': site.count,
+                } for site in sites],
+            }
+
+    def report(self, counters=None):
+        '''
+        Returns dictionary of elapsed seconds, phases ordered by seconds,
+        counters plus extra counters, and any cProfile and tracemalloc
+        results.
+        '''
+        counts = collections.Counter(self.counts)
+        counts.update(counters or {})
+        return {
+            'elapsed': time.perf_counter() - self.start,
+            'phases': collections.OrderedDict(
+                (name, {'seconds': seconds, 'calls': self.calls[name]})
+                for name, seconds in self.seconds.most_common()
+                ),
+            'counters': dict(counts),
+            'functions': self.functions(),
+            'memory': self.memory(),
+            }
+
+    def write(self, report_file=PROFILE_REPORT, counters=None):
+        with open(report_file, 'w') as f:
+            json.dump(self.report(counters), f, indent=2)
+
+
+PROFILER = ScanProfiler()
+
+
+def timed(name):
+    '''
+    Decorator timing every call of the function as phase name.
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
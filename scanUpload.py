@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+'''
+This program scans a local image directory and uploads the images to their
+SPARC collections in a Blackfynn dataset in one run, without writing and
+reading back an upload csv in between.
+
+Image paths found by the imageFileManager scanner are turned into
+SparcImages and passed as a stream to BlackfynnUploader, so the first
+uploads start while the rest of the tree is still being scanned. The upload
+csv read by dataWarehouseUpload.py can still be written alongside, as a
+record of the run or to repeat the upload later.
+
+With --stack_groups, images are grouped into z-stacks and channel groups
+by stackGroups as their directories are scanned, each stack is uploaded as
+one batch, and stacks and channel groups with missing z indices are
+reported.
+
+Requires Python3, Blackfynn client, and Blackfynn profile.
+'''
+
+import os
+import csv
+import argparse
+import imageFileManager
+import SparcDataOOP
+import uploadScheduler
+import dataWarehouseUpload
+import dedupIndex
+import stackGroups
+
+
+def scanImages(to_walk, jobs=1):
+    '''
+    Walks directory tree starting in to_walk, with jobs worker processes.
+    Yields SparcImage for each .tif file of a known format, holding the
+    stat result of the walk.
+    '''
+    if jobs > 1:
+        images = imageFileManager.walkParallel(to_walk, jobs)
+    else:
+        images = imageFileManager.walkImages(to_walk)
+    for file_path, stat_result in images:
+        image = SparcDataOOP.PathFormatFactory(file_path).format()
+        if not isinstance(image, SparcDataOOP.SparcImage):
+            print('Unknown path format {}'.format(file_path))
+            continue
+        if stat_result is not None:
+            image.cache_stat(stat_result)
+        yield image
+
+
+def recordImages(images, upload_csv, dataset_name):
+    '''
+    Passes images through, writing each image with its destination
+    collection to upload_csv in the dataWarehouseUpload.py format.
+    '''
+    with open(upload_csv, 'w', newline='') as csvfile:
+        out_file = csv.writer(csvfile)
+        out_file.writerow([dataset_name])
+        for image in images:
+            for task in SparcDataOOP.sparc_tasks([image]):
+                out_file.writerow([task.collection_path, task.files[0]])
+            yield image
+
+
+def parseArguments():
+    '''
+    Parses command line arguments for source directory, destination
+    dataset and upload options. Returns arguments object.
+    '''
+    parser = argparse.ArgumentParser(description='Scan images and upload '
+    'them to their SPARC collections in a Blackfynn dataset.')
+    parser.add_argument('-wd', '--working_dir', type=str, default=os.getcwd(),
+                        help='set working directory to scan, defaults to '
+                        'current working directory.')
+    parser.add_argument('-ds', '--dataset', type=str, required=True,
+                        help='set name of destination Blackfynn dataset.')
+    parser.add_argument('-uc', '--upload_csv', type=str,
+                        help='set with file path to also write the upload '
+                        'csv read by dataWarehouseUpload.py')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='set number of worker processes used to scan '
+                        'directories, defaults to 1.')
+    parser.add_argument('-uj', '--upload_jobs', type=int,
+                        default=uploadScheduler.UPLOAD_JOBS,
+                        help='set number of files uploaded at once, defaults '
+                        'to {}.'.format(uploadScheduler.UPLOAD_JOBS))
+    parser.add_argument('-jf', '--journal_file', type=str,
+                        default=dataWarehouseUpload.JOURNAL_FILE,
+                        help='set journal of completed uploads, defaults to '
+                        '{}.'.format(dataWarehouseUpload.JOURNAL_FILE))
+    parser.add_argument('-if', '--index_file', type=str,
+                        default=dataWarehouseUpload.INDEX_FILE,
+                        help='set cache of remote collection listings, '
+                        'defaults to {}.'.format(dataWarehouseUpload.INDEX_FILE))
+    parser.add_argument('-dd', '--dedup_index', type=str,
+                        help='set with file path of content hash index to '
+                        'skip byte-identical copies')
+    parser.add_argument('-sg', '--stack_groups',
+                        action='store_true',
+                        help='set to upload each z-stack as one batch and '
+                        'report stacks with missing z indices')
+    parser.add_argument('-gf', '--group_file', type=str,
+                        help='set with file path to write a csv of z-stacks '
+                        'and their channel groups, implies --stack_groups')
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Streams scanned images to the uploader and prints the upload and
+    scan summaries.
+    '''
+    args = parseArguments()
+    if not os.path.isdir(args.working_dir):
+        print('Invalid directory specified in arguments.')
+        exit()
+    uploader = SparcDataOOP.BlackfynnUploader(
+        args.dataset, index_file=args.index_file
+        )
+    journal = uploadScheduler.UploadJournal(args.journal_file)
+    dedup = None
+    if args.dedup_index:
+        dedup = dedupIndex.DedupIndex(args.dedup_index)
+    stacks = None
+    if args.stack_groups or args.group_file:
+        stacks = stackGroups.StackIndex()
+    images = scanImages(args.working_dir, args.jobs)
+    if args.upload_csv:
+        images = recordImages(images, args.upload_csv, args.dataset)
+    try:
+        uploader.upload_files(images, args.upload_jobs, journal, dedup,
+                              stacks)
+    finally:
+        journal.close()
+        if dedup:
+            dedup.close()
+    print('{} collections listed remotely'.format(uploader.index.fetches))
+    print(uploader.get_tree(uploader.dataset).report())
+    print(imageFileManager.scanReport())
+    if stacks is not None:
+        print(stacks.report())
+    if args.group_file:
+        stacks.write(args.group_file)
+        print('Stack groups written to {}'.format(args.group_file))
+    if args.upload_csv:
+        print('Upload csv written to {}'.format(args.upload_csv))
+    print('\nDONE!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,520 @@
+#!/usr/bin/python3
+'''
+This program times the metadata collection steps of imageFileManager.py
+against synthetic sample data, so that changes to the scan can be checked
+for scaling regressions without access to the image repository. Uploads
+are timed against the local fakeBlackfynn client.
+
+The suite benchmark writes a synthetic image tree in every source layout,
+with empty or sparse TIFF files, and times the scan, path parsing, the
+SparcDataOOP factory and getters, rename planning and uploads over it.
+Suite results are appended to a json lines file with the git commit they
+were measured at, and compared against the last run of another commit.
+'''
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import struct
+import random
+import tempfile
+import argparse
+import itertools
+import contextlib
+import subprocess
+import collections
+import pandas as pd
+import pyexiv2
+import imageFileManager
+import tiffHeader
+import fakeBlackfynn
+import warehouseIndex
+import uploadScheduler
+import SparcDataOOP
+
+SCALES = [10000, 100000, 1000000]
+SUITE_SCALES = [1000, 10000]
+RESULTS_FILE = 'benchmark_results.jsonl'
+SPARC_GETTERS = [
+    'get_sample_id', 'get_specimen', 'get_laterality', 'get_stain',
+    'get_section', 'get_magnification', 'get_zstack', 'get_creation_date',
+    'get_sparc_path',
+    ]
+FORMATS = ['sparc', '5ht2b', '5ht2a', '5ht7', 'a2a', '5ht']
+LATERALITY_CODES = {'left': 'L', 'right': 'R'}
+UPLOAD_LATENCY = 0.02
+UPLOAD_PER_FILE = 0.001
+TIFF_SIZES = [64 * 1024 * 1024, 1024 * 1024 * 1024, 4 * 1024 * 1024 * 1024]
+XMP_PACKET = '<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>' \
+    '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf=' \
+    '"http://www.w3.org/1999/02/22-rdf-syntax-ns#"><rdf:Description ' \
+    'xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:subject><rdf:Bag>' \
+    '<rdf:li>phrenic</rdf:li></rdf:Bag></dc:subject></rdf:Description>' \
+    '</rdf:RDF></x:xmpmeta><?xpacket end="w"?>'
+
+def syntheticPath(path_format, rand, root='/images'):
+    '''
+    Returns a random image path following the directory and file naming
+    conventions of one source format.
+    '''
+    subject_id = rand.randint(1, 40)
+    laterality = rand.choice(['left', 'right'])
+    section = rand.randint(1, 30)
+    magnification = rand.choice(['10x', '20x'])
+    z_stack = rand.randint(0, 20)
+    channel = rand.choice(['ch1', 'ch2'])
+    if path_format == 'sparc':
+        stain = rand.choice(['5ht', '5ht+ctb'])
+        return '{}/sparc/sam-{}_spec-phrenic_lat-{}_stain-{}_sec-{}_mag-{}' \
+            '_z-{:02d}.tif'.format(root, subject_id, laterality, stain,
+                                    section, magnification, z_stack)
+    if path_format in ['5ht2b', '5ht2a', '5ht7']:
+        return '{0}/{1}+ctb/batch/{2}/{3} {4} sec {5} {6}/' \
+            'img_z{7:02d}_{8}.tif'.format(
+                root, path_format, subject_id,
+                LATERALITY_CODES[laterality], laterality, section,
+                magnification, z_stack, channel)
+    if path_format == 'a2a':
+        return '{0}/a2a+ctb/batch/{1}/a2a_{2}_x_sec{3}/' \
+            'a2a_img_{1}_{4}_z{5:02d}_{6}.tif'.format(
+                root, subject_id, magnification, section, laterality,
+                z_stack, channel)
+    if path_format == '5ht':
+        return '{0}/5ht+ctb/batch/{1}/{1} sections/' \
+            '5ht_{1}_section{2}_{3}_{4}_{5}.tif'.format(
+                root, subject_id, section, LATERALITY_CODES[laterality],
+                magnification, channel)
+    raise ValueError('Unknown format {}'.format(path_format))
+
+def syntheticPaths(count, seed=0, root='/images'):
+    '''
+    Returns count image paths spread evenly over all source formats.
+    '''
+    rand = random.Random(seed)
+    return [syntheticPath(FORMATS[index % len(FORMATS)], rand, root)
+            for index in range(count)]
+
+def legacyFormat(file_path):
+    '''
+    Sequential substring checks used to classify paths before the
+    pathFormats registry. Returns label and split path, the same
+    work FormatClassifier.classify does.
+    '''
+    parts = file_path.split('/')
+    if 'sam-' in parts[-1]:
+        return 'sparc', parts
+    elif '5ht2b' in file_path:
+        return '5ht2b', parts
+    elif '5ht2a' in file_path:
+        return '5ht2a', parts
+    elif '5ht7' in file_path:
+        return '5ht7', parts
+    elif 'a2a' in file_path:
+        return 'a2a', parts
+    elif '5ht' in file_path:
+        return '5ht', parts
+    return None, parts
+
+def syntheticRows(count, seed=0):
+    '''
+    Generates metadata rows in the format returned by
+    imageFileManager.collectRow. Only a pool of distinct rows is built, and
+    rows are reused to keep memory flat at large counts.
+    '''
+    rand = random.Random(seed)
+    pool = []
+    for index in range(min(count, 1000)):
+        channel = rand.choice(['ch1', 'overlay'])
+        stain_1 = rand.choice(['5ht', '5ht2a', '5ht2b', '5ht7', 'a2a'])
+        sample_metadata = {
+            'timestamp': '2019-06-0{}'.format(rand.randint(1, 9)),
+            'filetype': '.tif',
+            'subject_id': str(rand.randint(1, 40)),
+            'specimen': 'phrenic',
+            'laterality': rand.choice(['left', 'right', 'whole']),
+            'stain_1': stain_1,
+            'stain_2': None if channel == 'ch1' else 'ctb',
+            'channel': channel,
+            'stain': stain_1 if channel == 'ch1' else stain_1 + '+ctb',
+            'section': str(rand.randint(1, 30)),
+            'magnification': rand.choice(['2x', '10x', '20x']),
+            'z_stack': 'z{:02d}'.format(rand.randint(0, 20)),
+            }
+        sample_metadata['sparc_file_path'] = \
+            imageFileManager.getSparcFilePath(sample_metadata)
+        sample_metadata['current_file_path'] = \
+            '/images/{}/image_{}.tif'.format(stain_1, index)
+        pool.append(sample_metadata)
+    return itertools.islice(itertools.cycle(pool), count)
+
+def benchCollect(count, chunk_size=imageFileManager.CHUNK_SIZE):
+    '''
+    Times building a dataframe of count rows with MetadataBatch.
+    Returns elapsed seconds.
+    '''
+    rows = syntheticRows(count)
+    start = time.perf_counter()
+    batch = imageFileManager.MetadataBatch(chunk_size)
+    for sample_metadata in rows:
+        batch.append(sample_metadata)
+    dFrame = batch.toDataframe()
+    elapsed = time.perf_counter() - start
+    assert len(dFrame) == count
+    return elapsed
+
+def benchClassify(count, rounds=3):
+    '''
+    Times classifying count paths with the legacy checks and with the
+    FormatClassifier, alternating for rounds. Returns the best paths per
+    second of each.
+    '''
+    paths = syntheticPaths(count)
+    classify = imageFileManager.FILE_FORMATS.classify
+    legacy_rate = table_rate = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        legacy = [legacyFormat(path)[0] for path in paths]
+        legacy_rate = max(legacy_rate,
+                          count / (time.perf_counter() - start))
+        start = time.perf_counter()
+        table = [classify(path)[0] for path in paths]
+        table_rate = max(table_rate, count / (time.perf_counter() - start))
+        assert legacy == table
+    return legacy_rate, table_rate
+
+def benchUpload(count, batch_files, latency=UPLOAD_LATENCY,
+                per_file=UPLOAD_PER_FILE, jobs=uploadScheduler.UPLOAD_JOBS):
+    '''
+    Times uploading count small files to one collection of a fake client
+    taking latency seconds per request and per_file seconds per file,
+    batch_files files per request. Returns elapsed seconds and requests made.
+    '''
+    with tempfile.TemporaryDirectory() as root:
+        files = []
+        for index in range(count):
+            file_path = os.path.join(root, 'img_z{:04d}.tif'.format(index))
+            with open(file_path, 'wb') as image_file:
+                image_file.write(b'\0' * 1024)
+            files.append(file_path)
+        client = fakeBlackfynn.FakeBlackfynn(latency, per_file)
+        scheduler = uploadScheduler.UploadScheduler(
+            warehouseIndex.CollectionTree(client.get_dataset('bench')),
+            warehouseIndex.RemoteIndexCache(), jobs,
+            batch_files=batch_files
+            )
+        start = time.perf_counter()
+        results = scheduler.run([('samples/sam-1', files)])
+        elapsed = time.perf_counter() - start
+    assert all(result.status == 'uploaded' for result in results)
+    return elapsed, client.calls['upload']
+
+def writeSyntheticTiff(file_path, size, xmp=XMP_PACKET):
+    '''
+    Writes a little endian, uncompressed, 16 bit grayscale TIFF of about
+    size bytes, one strip per image of at most 2 GiB, with an XMP packet.
+    Pixel data is left as a sparse hole, so large files take no disk space.
+    '''
+    strip_size = min(size, 2 * 1024 * 1024 * 1024)
+    side = int(math.sqrt(strip_size // 2))
+    strip_size = side * side * 2
+    pages = max(size // strip_size, 1)
+    packet = xmp.encode('utf-8') if xmp else b''
+    tags_per_ifd = 10 if packet else 9
+    ifd_size = 2 + 12 * tags_per_ifd + 4
+    data_offset = 8 + ifd_size * pages + len(packet)
+    with open(file_path, 'wb') as f:
+        f.write(b'II*\0' + struct.pack('<I', 8))
+        for page in range(pages):
+            next_ifd = 8 + ifd_size * (page + 1) if page + 1 < pages else 0
+            entries = [
+                (256, 4, 1, side), (257, 4, 1, side), (258, 3, 1, 16),
+                (259, 3, 1, 1), (262, 3, 1, 1),
+                (273, 4, 1, data_offset + page * strip_size),
+                (277, 3, 1, 1), (278, 4, 1, side),
+                (279, 4, 1, strip_size),
+                ]
+            if packet and page == 0:
+                entries.append((700, 1, len(packet), 8 + ifd_size * pages))
+            elif packet:
+                entries.append((305, 2, 4, 0))
+            f.write(struct.pack('<H', len(entries)))
+            for tag, field_type, count, value in entries:
+                if field_type == 3:
+                    f.write(struct.pack('<HHIHH', tag, field_type, count,
+                                        value, 0))
+                else:
+                    f.write(struct.pack('<HHII', tag, field_type, count,
+                                        value))
+            f.write(struct.pack('<I', next_ifd))
+        f.write(packet)
+        f.truncate(data_offset + pages * strip_size)
+
+def benchDirectory():
+    '''
+    Returns a TemporaryDirectory whose path contains no format label,
+    which would change how the paths below it are classified.
+    '''
+    while True:
+        root = tempfile.TemporaryDirectory(prefix='bench_')
+        if not any(label in root.name for label in FORMATS):
+            return root
+        root.cleanup()
+
+def writeSyntheticTree(root, count, seed=0, tiff_size=0):
+    '''
+    Writes count synthetic image files below root, spread over all source
+    formats. Files are empty, or sparse TIFFs of tiff_size bytes.
+    Returns sorted list of distinct file paths written.
+    '''
+    paths = sorted(set(syntheticPaths(count, seed, root)))
+    for file_path in paths:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if tiff_size:
+            writeSyntheticTiff(file_path, tiff_size, None)
+        else:
+            open(file_path, 'wb').close()
+    return paths
+
+def timeCall(function, *args):
+    '''
+    Returns seconds taken by function(*args) and its result.
+    '''
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def benchSuite(count, tiff_size=0, seed=0):
+    '''
+    Writes a synthetic tree of count images and times each step over it.
+    Returns OrderedDict of benchmark name to (items, seconds).
+    '''
+    timings = collections.OrderedDict()
+    with benchDirectory() as root:
+        paths = writeSyntheticTree(root, count, seed, tiff_size)
+        elapsed, dFrame = timeCall(
+            imageFileManager.collectDataframe, root, pd.DataFrame()
+            )
+        assert len(dFrame) == len(paths)
+        timings['collectDataframe'] = (len(dFrame), elapsed)
+        stats = [os.stat(file_path) for file_path in paths]
+        elapsed, rows = timeCall(lambda: [
+            imageFileManager.getSampleMetadata(file_path, stat_result)
+            for file_path, stat_result in zip(paths, stats)
+            ])
+        timings['getSampleMetadata'] = (len(rows), elapsed)
+        elapsed, images = timeCall(lambda: [
+            SparcDataOOP.PathFormatFactory(
+                SparcDataOOP.ImagePath(file_path)).format()
+            for file_path in paths
+            ])
+        timings['PathFormatFactory.format'] = (len(images), elapsed)
+        elapsed, values = timeCall(lambda: [
+            getattr(image, getter)()
+            for image in images for getter in SPARC_GETTERS
+            ])
+        timings['SparcImage getters'] = (len(values), elapsed)
+        elapsed, plan = timeCall(imageFileManager.planRenames, dFrame)
+        timings['planRenames'] = (len(dFrame), elapsed)
+        elapsed, plan = timeCall(SparcDataOOP.plan_sparc_renames, images)
+        timings['plan_sparc_renames'] = (len(images), elapsed)
+        client = fakeBlackfynn.FakeBlackfynn()
+        uploader = SparcDataOOP.BlackfynnUploader(
+            'bench', client.get_dataset('bench'),
+            os.path.join(root, 'index.sqlite')
+            )
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, scheduler = timeCall(uploader.upload_files, images)
+        timings['BlackfynnUploader.upload_files'] = (len(images), elapsed)
+    return timings
+
+def gitCommit():
+    '''
+    Returns short hash of the checked out commit, with a + suffix when the
+    tree has uncommitted changes, or None outside a git repository.
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=directory,
+            capture_output=True, text=True, check=True
+            ).stdout.strip()
+        changes = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=directory, capture_output=True, text=True, check=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + '+' if changes else commit
+
+def loadResults(results_file):
+    '''
+    Returns list of result records stored in results_file.
+    '''
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def baselineResults(results, commit, count, tiff_size=0, compare_with=None):
+    '''
+    Returns dictionary of benchmark name to seconds per item from the last
+    stored run at count items and tiff_size of commit compare_with, or of
+    any other commit when not given.
+    '''
+    baseline = {}
+    for record in results:
+        if (record['count'], record['tiff_size']) != (count, tiff_size):
+            continue
+        if compare_with is not None:
+            if not (record['commit'] or '').startswith(compare_with):
+                continue
+        elif record['commit'] == commit:
+            continue
+        if record['run'] != baseline.get('run'):
+            baseline = {'run': record['run']}
+        baseline[record['bench']] = record['seconds'] / max(record['items'], 1)
+    baseline.pop('run', None)
+    return baseline
+
+def storeResults(results_file, commit, run, count, tiff_size, timings):
+    with open(results_file, 'a') as f:
+        for bench, (items, seconds) in timings.items():
+            f.write(json.dumps({
+                'run': run, 'commit': commit, 'count': count,
+                'tiff_size': tiff_size, 'bench': bench, 'items': items,
+                'seconds': seconds, 'python': sys.version.split()[0],
+                }) + '\n')
+
+def readExiv2Header(file_path):
+    '''
+    Reads the values tiffHeader.readTiffHeader returns with pyexiv2.
+    '''
+    metadata = pyexiv2.ImageMetadata(file_path)
+    metadata.read()
+    return (metadata['Exif.Image.ImageWidth'].value,
+            metadata['Exif.Image.ImageLength'].value,
+            metadata['Exif.Image.BitsPerSample'].value,
+            metadata.xmp_keys)
+
+def benchHeader(size, count=20):
+    '''
+    Times reading the header of a synthetic TIFF of size bytes count times
+    with tiffHeader and with pyexiv2. Returns milliseconds per read for
+    each, None for pyexiv2 if it cannot read the file.
+    '''
+    with tempfile.TemporaryDirectory() as root:
+        file_path = os.path.join(root, 'synthetic.tif')
+        writeSyntheticTiff(file_path, size)
+        start = time.perf_counter()
+        for index in range(count):
+            header = tiffHeader.readTiffHeader(file_path)
+        mmap_ms = (time.perf_counter() - start) / count * 1e3
+        assert header.xmp == XMP_PACKET
+        try:
+            start = time.perf_counter()
+            for index in range(count):
+                readExiv2Header(file_path)
+            exiv2_ms = (time.perf_counter() - start) / count * 1e3
+        except Exception as ex:
+            print('pyexiv2 error. {}'.format(str(ex)))
+            exiv2_ms = None
+    return mmap_ms, exiv2_ms
+
+def parseArguments():
+    '''
+    Parses command line arguments for benchmark scales.
+    Returns arguments object.
+    '''
+    parser = argparse.ArgumentParser(description='Time metadata collection '
+    'against synthetic data.')
+    parser.add_argument('-b', '--bench',
+                        choices=['collect', 'classify', 'upload', 'header',
+                                 'suite'],
+                        default='collect', help='set benchmark to run.')
+    parser.add_argument('-s', '--scales', type=int, nargs='+',
+                        help='set row counts to benchmark, defaults to {}, '
+                        'and {} for the suite.'.format(SCALES, SUITE_SCALES))
+    parser.add_argument('-ts', '--tiff_size', type=int, default=0,
+                        help='set size in bytes of the sparse TIFF files '
+                        'written for the suite, defaults to empty files.')
+    parser.add_argument('-rf', '--results_file', type=str,
+                        default=RESULTS_FILE,
+                        help='set json lines file suite results are stored '
+                        'in and compared against, defaults to '
+                        '{}.'.format(RESULTS_FILE))
+    parser.add_argument('-cw', '--compare_with', type=str,
+                        help='set commit to compare suite results against, '
+                        'defaults to the last run of another commit.')
+    parser.add_argument('-cs', '--chunk_size', type=int,
+                        default=imageFileManager.CHUNK_SIZE,
+                        help='set rows per dataframe chunk.')
+    return parser.parse_args()
+
+def main():
+    '''
+    Prints elapsed time and time per row at each scale. Per row times
+    staying flat as the scale grows means the build is linear.
+    '''
+    args = parseArguments()
+    if args.bench == 'suite':
+        commit = gitCommit()
+        run = time.strftime('%Y-%m-%dT%H:%M:%S')
+        results = loadResults(args.results_file)
+        print('commit {}'.format(commit))
+        print('{:>32} {:>8} {:>10} {:>10} {:>10}'.format(
+            'benchmark', 'items', 'seconds', 'us/item', 'change'))
+        for count in args.scales or SUITE_SCALES:
+            baseline = baselineResults(
+                results, commit, count, args.tiff_size, args.compare_with
+                )
+            timings = benchSuite(count, args.tiff_size)
+            for bench, (items, seconds) in timings.items():
+                per_item = seconds / max(items, 1)
+                change = '-'
+                if bench in baseline:
+                    change = '{:+.1f}%'.format(
+                        (per_item / baseline[bench] - 1) * 100)
+                print('{:>32} {:>8} {:>10.3f} {:>10.2f} {:>10}'.format(
+                    bench, items, seconds, per_item * 1e6, change))
+            storeResults(args.results_file, commit, run, count,
+                         args.tiff_size, timings)
+        print('Results stored in {}'.format(args.results_file))
+        return
+    args.scales = args.scales or SCALES
+    if args.bench == 'header':
+        print('{:>14} {:>10} {:>10}'.format('bytes', 'mmap ms', 'exiv2 ms'))
+        for size in TIFF_SIZES:
+            mmap_ms, exiv2_ms = benchHeader(size)
+            print('{:>14} {:>10.3f} {:>10}'.format(
+                size, mmap_ms,
+                '{:.3f}'.format(exiv2_ms) if exiv2_ms is not None else '-'))
+        return
+    if args.bench == 'upload':
+        print('{:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+            'files', 'batch', 'requests', 'seconds', 'ms/file'))
+        for count in args.scales:
+            for batch_files in [1, uploadScheduler.BATCH_FILES]:
+                elapsed, requests = benchUpload(count, batch_files)
+                print('{:>10} {:>10} {:>10} {:>10.2f} {:>10.2f}'.format(
+                    count, batch_files, requests, elapsed,
+                    elapsed / count * 1e3))
+        return
+    if args.bench == 'classify':
+        print('{:>10} {:>14} {:>14}'.format('paths', 'legacy/s', 'table/s'))
+        for count in args.scales:
+            legacy_rate, table_rate = benchClassify(count)
+            print('{:>10} {:>14.0f} {:>14.0f}'.format(
+                count, legacy_rate, table_rate))
+        return
+    print('{:>10} {:>10} {:>10}'.format('rows', 'seconds', 'us/row'))
+    for count in args.scales:
+        elapsed = benchCollect(count, args.chunk_size)
+        print('{:>10} {:>10.2f} {:>10.2f}'.format(
+            count, elapsed, elapsed / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
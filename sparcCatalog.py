@@ -0,0 +1,583 @@
+#!/usr/bin/python3
+'''
+Compact catalog of image metadata for repositories of millions of images.
+
+Metadata values repeat across rows ('phrenic', '20x', 'left'), so each
+labelled column is held as integer codes into a string table of the
+column's distinct values, -1 coding a missing value. Codes are added in
+NumPy chunks and joined into one array per column by freeze(), using the
+smallest integer type pandas uses for category codes, so columns export to
+pandas categoricals without copying. File paths, distinct per row, are
+kept as plain path columns.
+
+Rows are found by value with select() and grouped with groups(). A catalog
+is saved to a directory holding one .npy code file per column, a json
+string table and one text file per path column with its line offsets, and
+is loaded back memory mapped, so a lookup only reads the columns it needs.
+
+Secondary indexes on chosen columns are saved alongside. An index holds
+the row numbers of a column ordered by value, in natural order so that
+section 2 sorts before section 10, and the offset where each value starts.
+find() answers value and range conditions from slices of these arrays,
+without reading the code columns.
+
+Run as a program to query a saved catalog, e.g.
+    sparcCatalog.py -ct catalog -w subject_id=12 -w section=3..10 -g section
+'''
+
+import os
+import re
+import json
+import mmap
+import bisect
+import argparse
+import collections
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 10000
+CATALOG_FILE = 'catalog.json'
+INDEX_FILES = ['order', 'rows', 'starts']
+
+ValueRange = collections.namedtuple('ValueRange', ['low', 'high'])
+ValueRange.__doc__ = '''
+    Inclusive range of column values for find(), None leaving a side open.
+    '''
+
+
+def codeType(categories):
+    '''
+    Returns the integer type pandas uses for codes of categories values.
+    '''
+    for dtype in [np.int8, np.int16, np.int32]:
+        if categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def isMissing(value):
+    return value is None or value != value
+
+
+class PathColumn:
+    '''
+    Read only path column of a saved catalog: a memory mapped text file
+    of one path per line, and the offsets of its lines.
+    '''
+
+    def __init__(self, text_file, offsets_file):
+        self.offsets = np.load(offsets_file, mmap_mode='r')
+        with open(text_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        path = self.data[
+            self.offsets[row]:self.offsets[row + 1] - 1
+            ].decode('utf-8')
+        return path or None
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+def naturalKey(value):
+    '''
+    Returns sort key of value comparing runs of digits as numbers.
+    '''
+    return tuple(
+        int(part) if index % 2 else part
+        for index, part in enumerate(re.split(r'(\d+)', value))
+        )
+
+
+class ValueIndex:
+    '''
+    Secondary index of one code column. order holds the codes in natural
+    order of their values, rows the row numbers grouped in that order, and
+    starts the offset in rows of each value, missing values last.
+    '''
+
+    def __init__(self, strings, order, rows, starts):
+        self.order = order
+        self.rows = rows
+        self.starts = starts
+        self.values = [strings[code] for code in order]
+        self.keys = [naturalKey(value) for value in self.values]
+        self.positions = {
+            value: position for position, value in enumerate(self.values)
+            }
+
+    @classmethod
+    def build(cls, strings, codes):
+        '''
+        Returns index of codes, a column with string table strings.
+        '''
+        order = np.array(sorted(
+            range(len(strings)), key=lambda code: naturalKey(strings[code])
+            ), dtype=np.int64)
+        # position of each code in order, code -1 taking the last one
+        positions = np.empty(len(strings) + 1, dtype=np.int64)
+        positions[order] = np.arange(len(strings))
+        positions[-1] = len(strings)
+        row_positions = positions[codes]
+        rows = np.argsort(row_positions, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(
+            np.bincount(row_positions, minlength=len(strings) + 1)
+            )])
+        return cls(strings, order, rows, starts)
+
+    def find(self, value):
+        '''
+        Returns array of row numbers of value, None for missing values.
+        '''
+        if isMissing(value):
+            position = len(self.values)
+        elif value in self.positions:
+            position = self.positions[value]
+        else:
+            return self.rows[:0]
+        return self.rows[self.starts[position]:self.starts[position + 1]]
+
+    def range(self, low=None, high=None):
+        '''
+        Returns array of row numbers of values from low to high inclusive,
+        in natural order.
+        '''
+        first = 0 if low is None else bisect.bisect_left(
+            self.keys, naturalKey(low)
+            )
+        last = len(self.keys) if high is None else bisect.bisect_right(
+            self.keys, naturalKey(high)
+            )
+        if first >= last:
+            return self.rows[:0]
+        return self.rows[self.starts[first]:self.starts[last]]
+
+    def save(self, catalog_dir, label):
+        for name in INDEX_FILES:
+            np.save(indexFile(catalog_dir, label, name), getattr(self, name))
+
+    @classmethod
+    def load(cls, catalog_dir, label, strings, mmap_mode='r'):
+        return cls(strings, *[
+            np.load(indexFile(catalog_dir, label, name), mmap_mode=mmap_mode)
+            for name in INDEX_FILES
+            ])
+
+
+def indexFile(catalog_dir, label, name):
+    return os.path.join(catalog_dir, 'index-{}-{}.npy'.format(label, name))
+
+
+class SparcCatalog:
+    '''
+    Interned code columns for labels and path columns for path_labels.
+    Rows are added with append(), extend() or addDataframe(), and are
+    visible to queries once frozen, which queries do on first use.
+    '''
+
+    def __init__(self, labels, path_labels=(), chunk_size=CHUNK_SIZE):
+        self.labels = list(labels)
+        self.path_labels = list(path_labels)
+        self.chunk_size = chunk_size
+        self.strings = {label: [] for label in self.labels}
+        self.lookup = {label: {} for label in self.labels}
+        self.codes = {label: np.zeros(0, np.int8) for label in self.labels}
+        self.paths = {label: [] for label in self.path_labels}
+        self.pending = {label: [] for label in self.labels}
+        self.buffer = self.newBuffer()
+        self.rows = 0
+        self.frozen = True
+        self.indexes = {}
+        self.catalog_dir = None
+        self.saved_indexes = []
+
+    def newBuffer(self):
+        return {label: [] for label in self.labels + self.path_labels}
+
+    def __len__(self):
+        self.freeze()
+        return self.rows
+
+    def intern(self, label, value):
+        '''
+        Returns code of value in the string table of label, adding it.
+        '''
+        lookup = self.lookup[label]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.strings[label])
+            self.strings[label].append(value)
+        return code
+
+    def encode(self, label, values):
+        '''
+        Returns int32 array of codes of values, interning new values.
+        '''
+        local_codes, uniques = pd.factorize(
+            np.asarray(values, dtype=object), use_na_sentinel=True
+            )
+        table = np.array(
+            [self.intern(label, value) for value in uniques] + [-1],
+            dtype=np.int32
+            )
+        # -1 local codes pick the -1 at the end of table
+        return table[local_codes]
+
+    def append(self, row):
+        '''
+        Adds one row dictionary, e.g. from getSampleMetadata.
+        '''
+        for label, column in self.buffer.items():
+            column.append(row.get(label))
+        if len(self.buffer[next(iter(self.buffer))]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        buffer = self.buffer
+        self.buffer = self.newBuffer()
+        if buffer and buffer[next(iter(buffer))]:
+            self.extend(buffer)
+
+    def extend(self, columns):
+        '''
+        Adds a column batch, dictionary of label to list of values,
+        as made by MetadataBatch.
+        '''
+        for label in self.labels:
+            self.pending[label].append(self.encode(label, columns[label]))
+        for label in self.path_labels:
+            self.paths[label].extend(columns[label])
+        self.frozen = False
+        self.indexes = {}
+
+    def addDataframe(self, dFrame):
+        '''
+        Adds dataframe rows. Categorical columns are added from
+        their codes, without reading each value.
+        '''
+        self.flush()
+        for label in self.labels:
+            column = dFrame[label]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                table = np.array(
+                    [self.intern(label, value)
+                     for value in column.cat.categories] + [-1],
+                    dtype=np.int32
+                    )
+                self.pending[label].append(table[column.array.codes])
+            else:
+                self.pending[label].append(self.encode(label, column))
+        for label in self.path_labels:
+            self.paths[label].extend(
+                None if isMissing(path) else path for path in dFrame[label]
+                )
+        self.frozen = False
+        self.indexes = {}
+
+    def freeze(self):
+        '''
+        Joins added codes into one array per column.
+        '''
+        self.flush()
+        if self.frozen:
+            return
+        for label in self.labels:
+            if not self.pending[label]:
+                continue
+            dtype = codeType(len(self.strings[label]))
+            self.codes[label] = np.concatenate(
+                [self.codes[label].astype(dtype)] +
+                [codes.astype(dtype) for codes in self.pending[label]]
+                )
+            self.pending[label] = []
+        if self.labels:
+            self.rows = len(self.codes[self.labels[0]])
+        elif self.path_labels:
+            self.rows = len(self.paths[self.path_labels[0]])
+        self.frozen = True
+
+    def code(self, label, value):
+        '''
+        Returns code of value in label, -1 for missing values,
+        or None if the value does not occur.
+        '''
+        if isMissing(value):
+            return -1
+        return self.lookup[label].get(value)
+
+    def select(self, rows=None, **conditions):
+        '''
+        Returns array of row numbers, of rows or all rows, whose label
+        values match conditions. A condition is a value, None for missing,
+        or a list of values any of which matches.
+        '''
+        self.freeze()
+        if rows is None:
+            mask = np.ones(self.rows, dtype=bool)
+        else:
+            mask = np.zeros(self.rows, dtype=bool)
+            mask[rows] = True
+        for label, wanted in conditions.items():
+            if isinstance(wanted, (list, tuple, set, frozenset)):
+                wanted_codes = [self.code(label, value) for value in wanted]
+                wanted_codes = [code for code in wanted_codes
+                                if code is not None]
+                mask &= np.isin(self.codes[label], wanted_codes)
+            else:
+                wanted_code = self.code(label, wanted)
+                if wanted_code is None:
+                    return np.zeros(0, dtype=np.int64)
+                mask &= self.codes[label] == wanted_code
+        return np.flatnonzero(mask)
+
+    def index(self, label):
+        '''
+        Returns ValueIndex of label, loaded memory mapped if saved with
+        the catalog, else built from the code column.
+        '''
+        self.freeze()
+        if label not in self.indexes:
+            if label in self.saved_indexes:
+                self.indexes[label] = ValueIndex.load(
+                    self.catalog_dir, label, self.strings[label]
+                    )
+            else:
+                self.indexes[label] = ValueIndex.build(
+                    self.strings[label], self.codes[label]
+                    )
+        return self.indexes[label]
+
+    def find(self, **conditions):
+        '''
+        Returns sorted array of row numbers matching all conditions through
+        the indexes of their labels. A condition is a value, None for
+        missing, a list of values, or a ValueRange.
+        '''
+        found = None
+        for label, wanted in conditions.items():
+            index = self.index(label)
+            if isinstance(wanted, ValueRange):
+                rows = index.range(*wanted)
+            elif isinstance(wanted, (list, tuple, set, frozenset)):
+                rows = np.concatenate(
+                    [index.find(value) for value in wanted] + [index.rows[:0]]
+                    )
+            else:
+                rows = index.find(wanted)
+            rows = np.sort(rows)
+            found = rows if found is None else np.intersect1d(
+                found, rows, assume_unique=True
+                )
+        if found is None:
+            return np.arange(len(self))
+        return found
+
+    def groupKeys(self, labels, rows):
+        '''
+        Returns one int64 key per row combining the codes of labels.
+        '''
+        key = np.zeros(len(rows), dtype=np.int64)
+        for label in labels:
+            key = key * (len(self.strings[label]) + 1) + \
+                self.codes[label][rows].astype(np.int64) + 1
+        return key
+
+    def groups(self, *labels, rows=None):
+        '''
+        Groups rows, or all rows, by the values of labels.
+        Returns OrderedDict of value tuple to array of row numbers.
+        '''
+        self.freeze()
+        rows = np.arange(self.rows) if rows is None else np.asarray(rows)
+        key = self.groupKeys(labels, rows)
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        starts = np.flatnonzero(np.diff(sorted_key, prepend=-1))
+        grouped = collections.OrderedDict()
+        for group_rows in np.split(rows[order], starts[1:]):
+            if len(group_rows):
+                first = group_rows[0]
+                grouped[tuple(self.value(label, first) for label in labels)] \
+                    = group_rows
+        return grouped
+
+    def counts(self, *labels, rows=None):
+        '''
+        Returns OrderedDict of value tuple of labels to row count.
+        '''
+        return collections.OrderedDict(
+            (values, len(group_rows))
+            for values, group_rows in self.groups(*labels, rows=rows).items()
+            )
+
+    def value(self, label, row):
+        '''
+        Returns value of label in row, from a code or a path column.
+        '''
+        self.freeze()
+        if label in self.paths:
+            return self.paths[label][row]
+        code = self.codes[label][row]
+        return self.strings[label][code] if code >= 0 else None
+
+    def values(self, label, rows=None):
+        '''
+        Returns list of values of label for rows, or all rows.
+        '''
+        self.freeze()
+        if rows is None:
+            rows = range(self.rows)
+        return [self.value(label, row) for row in rows]
+
+    def toDataframe(self, rows=None):
+        '''
+        Returns dataframe of rows, or all rows, with a categorical column
+        per code column. For all rows the categoricals share the code
+        arrays of the catalog instead of copying them.
+        '''
+        self.freeze()
+        data = collections.OrderedDict()
+        for label in self.labels:
+            codes = self.codes[label] if rows is None else \
+                self.codes[label][rows]
+            data[label] = pd.Series(pd.Categorical.from_codes(
+                codes, categories=self.strings[label], validate=False
+                ), copy=False)
+        for label in self.path_labels:
+            data[label] = self.values(label, rows)
+        return pd.DataFrame(data, copy=False)
+
+    def nbytes(self):
+        '''
+        Returns bytes held by code arrays, not counting string tables.
+        '''
+        self.freeze()
+        return sum(codes.nbytes for codes in self.codes.values())
+
+    def save(self, catalog_dir, index_labels=()):
+        '''
+        Writes the catalog to catalog_dir, replacing a catalog there,
+        with secondary indexes of index_labels.
+        '''
+        self.freeze()
+        os.makedirs(catalog_dir, exist_ok=True)
+        for label in index_labels:
+            self.index(label).save(catalog_dir, label)
+        for label in self.labels:
+            np.save(os.path.join(catalog_dir, label + '.npy'),
+                    self.codes[label])
+        for label in self.path_labels:
+            offsets = [0]
+            with open(os.path.join(catalog_dir, label + '.txt'), 'wb') as f:
+                for path in self.paths[label]:
+                    line = '{}\n'.format(
+                        '' if isMissing(path) else path
+                        ).encode('utf-8')
+                    f.write(line)
+                    offsets.append(offsets[-1] + len(line))
+            np.save(os.path.join(catalog_dir, label + '.offsets.npy'),
+                    np.array(offsets, dtype=np.int64))
+        with open(os.path.join(catalog_dir, CATALOG_FILE), 'w') as f:
+            json.dump({
+                'rows': self.rows,
+                'labels': self.labels,
+                'path_labels': self.path_labels,
+                'indexes': list(index_labels),
+                'strings': self.strings,
+                }, f)
+
+    @classmethod
+    def load(cls, catalog_dir, mmap_mode='r'):
+        '''
+        Returns catalog saved in catalog_dir, with code columns memory
+        mapped unless mmap_mode is None. Loaded catalogs are read only.
+        '''
+        with open(os.path.join(catalog_dir, CATALOG_FILE)) as f:
+            header = json.load(f)
+        catalog = cls(header['labels'], header['path_labels'])
+        for label in catalog.labels:
+            catalog.strings[label] = header['strings'][label]
+            catalog.lookup[label] = {
+                value: code for code, value in
+                enumerate(catalog.strings[label])
+                }
+            catalog.codes[label] = np.load(
+                os.path.join(catalog_dir, label + '.npy'), mmap_mode=mmap_mode
+                )
+        for label in catalog.path_labels:
+            catalog.paths[label] = PathColumn(
+                os.path.join(catalog_dir, label + '.txt'),
+                os.path.join(catalog_dir, label + '.offsets.npy')
+                )
+        catalog.rows = header['rows']
+        catalog.catalog_dir = catalog_dir
+        catalog.saved_indexes = header.get('indexes', [])
+        return catalog
+
+
+def parseCondition(condition):
+    '''
+    Parses label=value, label=a,b for any of several values and
+    label=low..high for a range. Returns label and find() condition.
+    '''
+    label, sep, value = condition.partition('=')
+    if '..' in value:
+        low, sep, high = value.partition('..')
+        return label, ValueRange(low or None, high or None)
+    if ',' in value:
+        return label, value.split(',')
+    return label, value or None
+
+
+def parseArguments():
+    '''
+    Parses command line arguments for a catalog query.
+    Returns arguments object.
+    '''
+    parser = argparse.ArgumentParser(description='Query a saved image '
+    'metadata catalog through its indexes.')
+    parser.add_argument('-ct', '--catalog', type=str, required=True,
+                        help='set directory of the saved catalog.')
+    parser.add_argument('-w', '--where', type=str, action='append',
+                        default=[],
+                        help='set condition label=value, label=a,b or '
+                        'label=low..high, repeat for more conditions.')
+    parser.add_argument('-g', '--group_by', type=str, nargs='+',
+                        help='set labels to count matching rows by.')
+    parser.add_argument('-p', '--print_label', type=str,
+                        help='set label whose values are printed for '
+                        'matching rows, defaults to the first path label.')
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Prints the number of matching rows, then counts per group,
+    or the values of a label for each matching row.
+    '''
+    args = parseArguments()
+    catalog = SparcCatalog.load(args.catalog)
+    rows = catalog.find(**dict(
+        parseCondition(condition) for condition in args.where
+        ))
+    print('{} of {} rows match'.format(len(rows), len(catalog)))
+    if args.group_by:
+        counts = catalog.counts(*args.group_by, rows=rows)
+        for values in sorted(counts, key=lambda values: [
+                naturalKey(value or '') for value in values]):
+            print('{:>8} {}'.format(counts[values], ' '.join(map(str, values))))
+        return
+    label = args.print_label or (catalog.path_labels or catalog.labels)[0]
+    for value in catalog.values(label, rows):
+        print(value)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+'''
+Groups scanned SparcImages into z-stacks and channel groups.
+
+A z-stack holds the images of one channel that differ only in their z
+index. Its key is the Sparc path without the z suffix, so all images of a
+stack go to one Sparc collection and can be uploaded as one batch. A
+channel group holds the stacks of the channels imaged together. The Sparc
+path holds the channel as its stain, so channel groups are keyed by the
+source path without the z and channel suffixes instead.
+
+Both keys are dictionary lookups, so grouping costs one hash per image and
+key. The scanner yields the images of a directory together, so the stacks
+of a directory are closed when the scan leaves it and can be uploaded
+while the rest of the tree is scanned. A stack seen again after it was
+closed is closed again as a further part, and its parts are merged in the
+index.
+'''
+
+import os
+import re
+import csv
+import collections
+import uploadScheduler
+
+StackGroup = collections.namedtuple(
+    'StackGroup',
+    ['key', 'channel_key', 'channel', 'collection_path', 'files', 'count',
+     'z_indices', 'missing', 'bytes']
+    )
+ChannelGroup = collections.namedtuple(
+    'ChannelGroup',
+    ['key', 'channels', 'stacks', 'count', 'z_indices', 'missing', 'bytes']
+    )
+
+# z suffix of Sparc file names, e.g. _z-05
+SPARC_Z_SUFFIX = re.compile(r'_z-[0-9]+$')
+# z and channel tokens of source file names, e.g. _z05_ch2
+SOURCE_SUFFIXES = re.compile(r'[_ ](?:z-?[0-9]+|ch[0-9]*)(?=[_ ]|$)',
+                             re.IGNORECASE)
+GROUP_LABELS = [
+    'key', 'channel_key', 'channel', 'count', 'z_first', 'z_last', 'missing',
+    'bytes'
+    ]
+
+
+def stackKey(sparc_path):
+    '''
+    Returns Sparc path string without file suffix and z suffix.
+    '''
+    return SPARC_Z_SUFFIX.sub('', sparc_path.with_suffix('').as_posix())
+
+
+def channelKey(image):
+    '''
+    Returns source path string of image without file suffix and its z and
+    channel suffixes.
+    '''
+    stem = os.path.splitext(image.name)[0]
+    return str(image.parent.joinpath(SOURCE_SUFFIXES.sub('', stem)))
+
+
+def zIndex(image):
+    '''
+    Returns z index of image as int, or None if image is not in a z-stack.
+    '''
+    z_stack = image.get_metadata().z_stack
+    if z_stack and z_stack.isdigit():
+        return int(z_stack)
+    return None
+
+
+def zGaps(z_indices):
+    '''
+    Returns sorted list of z indices missing between the first and last of
+    z_indices.
+    '''
+    if not z_indices:
+        return []
+    return sorted(set(range(min(z_indices), max(z_indices) + 1))
+                  - set(z_indices))
+
+
+def fileSize(image):
+    try:
+        return image.get_stat().st_size
+    except OSError:
+        return 0
+
+
+def mergeStacks(stack, part):
+    '''
+    Returns StackGroup holding the files of stack and of its later part.
+    '''
+    files = stack.files + part.files
+    z_indices = sorted(set(stack.z_indices) | set(part.z_indices))
+    return stack._replace(
+        files=files, count=len(files), z_indices=z_indices,
+        missing=zGaps(z_indices), bytes=stack.bytes + part.bytes
+        )
+
+
+class StackIndex:
+    '''
+    Hash index of z-stacks by Sparc path without z suffix, and of channel
+    groups by source path without z and channel suffixes.
+    Open stacks are held per source directory until the scan leaves it.
+    '''
+
+    def __init__(self):
+        self.open = collections.OrderedDict()
+        self.stacks = collections.OrderedDict()
+        self.channels = collections.OrderedDict()
+        self.directory = None
+        self.parts = 0
+
+    def __len__(self):
+        return len(self.stacks)
+
+    def add(self, image):
+        '''
+        Adds image to its open stack. Returns list of StackGroup parts
+        closed because image is in a new source directory.
+        '''
+        try:
+            sparc_path = image.get_sparc_path()
+        except Exception as ex:
+            print('Cannot parse Sparc path of {}.\n{}'.format(image, str(ex)))
+            return []
+        directory = str(image.parent)
+        closed = []
+        if directory != self.directory:
+            closed = self.close()
+            self.directory = directory
+        key = stackKey(sparc_path)
+        stack = self.open.get(key)
+        if stack is None:
+            stack = self.open[key] = [
+                channelKey(image), image.get_channel(),
+                sparc_path.parent.as_posix(), [], 0
+                ]
+        stack[3].append((zIndex(image), str(image)))
+        stack[4] += fileSize(image)
+        return closed
+
+    def close(self):
+        '''
+        Closes all open stacks. Returns list of StackGroup parts, with
+        files ordered by z index.
+        '''
+        closed = []
+        for key, (channel_key, channel, collection_path, files,
+                  size) in self.open.items():
+            files.sort(key=lambda item: (item[0] is None, item[0] or 0))
+            z_indices = sorted(set(
+                z for z, file_path in files if z is not None
+                ))
+            part = StackGroup(
+                key, channel_key, channel, collection_path,
+                [file_path for z, file_path in files], len(files),
+                z_indices, zGaps(z_indices), size
+                )
+            if key in self.stacks:
+                self.stacks[key] = mergeStacks(self.stacks[key], part)
+            else:
+                self.stacks[key] = part
+                self.channels.setdefault(channel_key, []).append(key)
+            self.parts += 1
+            closed.append(part)
+        self.open.clear()
+        return closed
+
+    def group(self, images):
+        '''
+        Yields StackGroup parts of images as their source directories
+        are scanned.
+        '''
+        for image in images:
+            yield from self.add(image)
+        yield from self.close()
+
+    def tasks(self, images):
+        '''
+        Yields an UploadTask per StackGroup part of images, so each stack
+        is uploaded as one batch.
+        '''
+        for stack in self.group(images):
+            yield uploadScheduler.UploadTask(
+                stack.collection_path, stack.files
+                )
+
+    def channelGroups(self):
+        '''
+        Yields ChannelGroup of the stacks found for each channel key. The
+        missing z indices of each channel are those from the first to the
+        last z index of the whole group that the channel has no image for.
+        '''
+        for key, stack_keys in self.channels.items():
+            stacks = [self.stacks[stack_key] for stack_key in stack_keys]
+            z_indices = sorted(set().union(
+                *[stack.z_indices for stack in stacks]
+                ))
+            z_range = set(zGaps(z_indices) + z_indices)
+            missing = collections.OrderedDict()
+            for stack in stacks:
+                gaps = sorted(z_range - set(stack.z_indices))
+                if gaps:
+                    missing[stack.channel] = gaps
+            yield ChannelGroup(
+                key, [stack.channel for stack in stacks], stack_keys,
+                sum(stack.count for stack in stacks), z_indices, missing,
+                sum(stack.bytes for stack in stacks)
+                )
+
+    def report(self):
+        stacks = self.stacks.values()
+        gaps = [stack for stack in stacks if stack.missing]
+        partial = [group for group in self.channelGroups() if group.missing]
+        return (
+            '{} images in {} stacks, {} upload batches, {} bytes\n'
+            '{} stacks with {} missing z indices\n'
+            '{} channel groups, {} with channels missing z indices'.format(
+                sum(stack.count for stack in stacks), len(self.stacks),
+                self.parts, sum(stack.bytes for stack in stacks),
+                len(gaps), sum(len(stack.missing) for stack in gaps),
+                len(self.channels), len(partial)
+                ))
+
+    def write(self, group_csv):
+        '''
+        Writes a row per stack to group_csv, with its channel group key,
+        image count, z range, missing z indices and total bytes.
+        '''
+        with open(group_csv, 'w', newline='') as csvfile:
+            out_file = csv.writer(csvfile)
+            out_file.writerow(GROUP_LABELS)
+            for stack in self.stacks.values():
+                out_file.writerow([
+                    stack.key, stack.channel_key, stack.channel, stack.count,
+                    stack.z_indices[0] if stack.z_indices else '',
+                    stack.z_indices[-1] if stack.z_indices else '',
+                    ' '.join(str(z) for z in stack.missing), stack.bytes
+                    ])
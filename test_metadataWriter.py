@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+'''
+Tests of MetadataWriter appending chunks to .csv and .parquet metadata
+files, and resuming after an interrupted write.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+import imageFileManager
+
+
+def metadataChunk(first, rows, stain_2=True):
+    '''
+    Returns chunk of rows metadata rows, as MetadataBuffer builds them,
+    with values numbered from first. Without stain_2 the stain_2 column
+    holds only None values.
+    '''
+    chunk = pd.DataFrame({
+        label: ['{}-{}'.format(label, first + row) for row in range(rows)]
+        for label in imageFileManager.COLUMN_LABELS
+        }, columns=imageFileManager.COLUMN_LABELS)
+    if not stain_2:
+        chunk['stain_2'] = None
+    for label in imageFileManager.CATEGORY_LABELS:
+        chunk[label] = chunk[label].astype('category')
+    return chunk
+
+
+class CsvWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.metadata_file = os.path.join(self.temp_dir, 'metadata.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def testResumeAppends(self):
+        imageFileManager.MetadataWriter(self.metadata_file) \
+            .write(metadataChunk(0, 3))
+        writer = imageFileManager.MetadataWriter(self.metadata_file)
+        self.assertEqual(len(writer.writtenPaths()), 3)
+        writer.write(metadataChunk(3, 2))
+        dFrame = pd.read_csv(self.metadata_file)
+        self.assertEqual(len(dFrame), 5)
+        self.assertEqual(list(dFrame.columns), imageFileManager.COLUMN_LABELS)
+
+    def testResumeCutsPartialRow(self):
+        imageFileManager.MetadataWriter(self.metadata_file) \
+            .write(metadataChunk(0, 3))
+        with open(self.metadata_file, 'a') as f:
+            f.write('timestamp-3,filetype-3,subj')
+        writer = imageFileManager.MetadataWriter(self.metadata_file)
+        self.assertEqual(
+            writer.writtenPaths(),
+            {'current_file_path-{}'.format(row) for row in range(3)}
+            )
+
+    def testNoResumeTruncates(self):
+        imageFileManager.MetadataWriter(self.metadata_file) \
+            .write(metadataChunk(0, 3))
+        writer = imageFileManager.MetadataWriter(
+            self.metadata_file, resume=False
+            )
+        self.assertEqual(writer.writtenPaths(), set())
+
+
+class ParquetWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.metadata_file = os.path.join(self.temp_dir, 'metadata.parquet')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def testNoneColumnReadsBack(self):
+        writer = imageFileManager.MetadataWriter(self.metadata_file)
+        writer.write(metadataChunk(0, 3, stain_2=False))
+        writer.write(metadataChunk(3, 2))
+        dFrame = pd.read_parquet(self.metadata_file)
+        self.assertEqual(len(dFrame), 5)
+        self.assertEqual(dFrame['stain_2'].isna().sum(), 3)
+
+    def testResumeAfterCrash(self):
+        writer = imageFileManager.MetadataWriter(self.metadata_file)
+        writer.write(metadataChunk(0, 3, stain_2=False))
+        # a crash in the middle of writing the second part
+        temp = os.path.join(self.metadata_file, '.part-00001.tmp')
+        with open(temp, 'wb') as f:
+            f.write(b'PAR1\0\0')
+        self.assertEqual(len(pd.read_parquet(self.metadata_file)), 3)
+        resumed = imageFileManager.MetadataWriter(self.metadata_file)
+        self.assertFalse(os.path.exists(temp))
+        self.assertEqual(resumed.parts, 1)
+        self.assertEqual(len(resumed.writtenPaths()), 3)
+        resumed.write(metadataChunk(3, 2))
+        dFrame = pd.read_parquet(self.metadata_file)
+        self.assertEqual(len(dFrame), 5)
+        self.assertEqual(
+            sorted(os.listdir(self.metadata_file)),
+            ['part-00000.parquet', 'part-00001.parquet']
+            )
+
+    def testNoResumeRemovesParts(self):
+        imageFileManager.MetadataWriter(self.metadata_file) \
+            .write(metadataChunk(0, 3))
+        writer = imageFileManager.MetadataWriter(
+            self.metadata_file, resume=False
+            )
+        self.assertEqual(writer.parts, 0)
+        self.assertEqual(writer.writtenPaths(), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+'''
+Tests of RenamePlan conflict detection, execution into missing
+directories, and rollback with undoRenames from the journal.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import renamePlanner
+
+
+class RenamePlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.temp_dir, 'journal.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def touch(self, *names):
+        path = self.path(*names)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(names[-1])
+        return path
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def testConflicts(self):
+        a, b, c, d = (self.touch(name) for name in 'abcd')
+        existing = self.touch('existing')
+        plan = renamePlanner.RenamePlan([
+            (a, self.path('same')), (b, self.path('same')),
+            (c, existing), (d, a), (a, a),
+            ])
+        reasons = sorted((conflict.source, conflict.reason)
+                         for conflict in plan.conflicts)
+        self.assertEqual(reasons, [
+            (a, 'duplicate target'), (b, 'duplicate target'),
+            (c, 'target exists'), (d, 'target is renamed source'),
+            ])
+        self.assertEqual(plan.renames, [])
+        self.assertEqual(plan.unchanged, 1)
+        self.assertTrue(plan.report().startswith(
+            '0 to rename, 1 unchanged, 4 conflicts'))
+
+    def testListsEachDirectoryOnce(self):
+        sources = [self.touch('src', name) for name in 'abc']
+        with mock.patch('renamePlanner.os.listdir',
+                        wraps=os.listdir) as listdir:
+            plan = renamePlanner.RenamePlan([
+                (source, self.path('dst', os.path.basename(source)))
+                for source in sources
+                ])
+        self.assertEqual(listdir.call_count, 1)
+        self.assertEqual(len(plan.renames), 3)
+
+    def testExecuteCreatesDirectories(self):
+        a = self.touch('a')
+        b = self.touch('b')
+        plan = renamePlanner.RenamePlan([
+            (a, self.path('x', 'y', 'a')), (b, self.path('x', 'b')),
+            ])
+        self.assertEqual(plan.missingDirectories(), [self.path('x', 'y')])
+        counts = plan.execute(self.journal_file, jobs=2)
+        self.assertEqual(counts['renamed'], 2)
+        self.assertEqual(self.read(self.path('x', 'y', 'a')), 'a')
+        self.assertEqual(self.read(self.path('x', 'b')), 'b')
+        self.assertFalse(os.path.exists(a))
+
+    def testFailedRenameNotJournaled(self):
+        a = self.touch('a')
+        plan = renamePlanner.RenamePlan([
+            (a, self.path('a2')), (self.path('gone'), self.path('gone2')),
+            ])
+        with mock.patch('builtins.print'):
+            counts = plan.execute(self.journal_file)
+        self.assertEqual((counts['renamed'], counts['failed']), (1, 1))
+        with open(self.journal_file) as journal:
+            self.assertEqual(len(journal.readlines()), 1)
+
+    def testUndoRestoresAndRemovesJournal(self):
+        sources = [self.touch(name) for name in 'abc']
+        plan = renamePlanner.RenamePlan([
+            (source, self.path('new', os.path.basename(source)))
+            for source in sources
+            ])
+        plan.execute(self.journal_file)
+        counts = renamePlanner.undoRenames(self.journal_file)
+        self.assertEqual(counts['restored'], 3)
+        for source in sources:
+            self.assertEqual(self.read(source), os.path.basename(source))
+        self.assertFalse(os.path.exists(self.journal_file))
+
+    def testUndoKeepsJournalOnFailure(self):
+        a = self.touch('a')
+        plan = renamePlanner.RenamePlan([(a, self.path('a2'))])
+        plan.execute(self.journal_file)
+        # a new file took the original name
+        self.touch('a')
+        with mock.patch('builtins.print'):
+            counts = renamePlanner.undoRenames(self.journal_file)
+        self.assertEqual((counts['restored'], counts['failed']), (0, 1))
+        self.assertTrue(os.path.exists(self.path('a2')))
+        self.assertTrue(os.path.exists(self.journal_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
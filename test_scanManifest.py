@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+'''
+Tests of ScanManifest, and of incremental rescans through it with
+imageFileManager.collectIncremental.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import imageFileManager
+import scanManifest
+
+LABELS = ['subject_id', 'stain', 'current_file_path']
+SAMPLE_DIR = '5ht2b/sam-1_spec-phrenic_lat-left_sec-3_mag-20x'
+SAMPLE_NAME = 'sam-1_spec-phrenic_lat-left_stain-5ht2b_sec-3_mag-20x_{}.tif'
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manifest_file = os.path.join(self.temp_dir, 'manifest.sqlite')
+        self.stat_result = os.stat(__file__)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def row(self, path, subject_id='1'):
+        return {'subject_id': subject_id, 'stain': '5ht',
+                'current_file_path': path}
+
+    def testUpsertReplaces(self):
+        manifest = scanManifest.ScanManifest(self.manifest_file, LABELS)
+        manifest.upsert([(self.stat_result, self.row('/a.tif')),
+                         (self.stat_result, self.row('/b.tif'))])
+        manifest.upsert([(self.stat_result, self.row('/a.tif', '2'))])
+        manifest.commit()
+        columns, = manifest.rows(10)
+        self.assertEqual(columns['current_file_path'], ['/a.tif', '/b.tif'])
+        self.assertEqual(columns['subject_id'], ['2', '1'])
+        manifest.close()
+
+    def testSignaturesPersist(self):
+        manifest = scanManifest.ScanManifest(self.manifest_file, LABELS)
+        manifest.upsert([(self.stat_result, self.row('/a.tif'))])
+        manifest.commit()
+        manifest.close()
+        reopened = scanManifest.ScanManifest(self.manifest_file, LABELS)
+        self.assertEqual(reopened.signatures(), {
+            '/a.tif': (self.stat_result.st_mtime, self.stat_result.st_size)
+            })
+        reopened.close()
+
+    def testRemoveAndChunkedRows(self):
+        manifest = scanManifest.ScanManifest(self.manifest_file, LABELS)
+        manifest.upsert([(self.stat_result, self.row('/{}.tif'.format(name)))
+                         for name in 'edcba'])
+        manifest.remove(['/c.tif'])
+        chunks = list(manifest.rows(2))
+        self.assertEqual([len(chunk['current_file_path']) for chunk in chunks],
+                         [2, 2])
+        self.assertEqual(
+            [path for chunk in chunks for path in chunk['current_file_path']],
+            ['/a.tif', '/b.tif', '/d.tif', '/e.tif']
+            )
+        manifest.close()
+
+
+class IncrementalScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, 'images')
+        os.makedirs(os.path.join(self.root, SAMPLE_DIR))
+        self.paths = [self.writeImage(index) for index in range(3)]
+        self.manifest = scanManifest.ScanManifest(
+            os.path.join(self.temp_dir, 'manifest.sqlite'),
+            imageFileManager.COLUMN_LABELS
+            )
+
+    def tearDown(self):
+        self.manifest.close()
+        shutil.rmtree(self.temp_dir)
+
+    def writeImage(self, index, data=b'\0'):
+        path = os.path.join(self.root, SAMPLE_DIR, SAMPLE_NAME.format(index))
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def rescan(self):
+        return imageFileManager.collectIncremental(self.root, self.manifest)
+
+    def testDelta(self):
+        dFrame, delta = self.rescan()
+        self.assertEqual(delta, (3, 0, 0, 0, 0))
+        self.assertEqual(len(dFrame), 3)
+        self.writeImage(0, b'\0\0')
+        os.remove(self.paths[1])
+        self.writeImage(3)
+        dFrame, delta = self.rescan()
+        self.assertEqual(delta, (1, 1, 1, 1, 0))
+        self.assertEqual(sorted(dFrame['current_file_path']),
+                         [self.paths[0], self.paths[2],
+                          self.writeImage(3)])
+
+    def testUnreadableKeepsRow(self):
+        self.rescan()
+        walked = list(imageFileManager.walkImages(self.root))
+        failed = [(path, None if path == self.paths[1] else stat_result)
+                  for path, stat_result in walked]
+        with mock.patch('imageFileManager.walkImages',
+                        return_value=iter(failed)):
+            dFrame, delta = self.rescan()
+        self.assertEqual(delta, (0, 0, 0, 2, 1))
+        self.assertIn(self.paths[1], set(dFrame['current_file_path']))
+        # readable again, and not parsed again
+        dFrame, delta = self.rescan()
+        self.assertEqual(delta, (0, 0, 0, 3, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+'''
+Tests of SparcCatalog queries through its indexes, and of saving and
+loading a catalog, against the same rows held in a dataframe.
+'''
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import sparcCatalog
+
+LABELS = ['subject_id', 'stain', 'section', 'laterality']
+PATH_LABELS = ['current_file_path']
+INDEX_LABELS = ['subject_id', 'section', 'laterality']
+
+
+def catalogRows():
+    '''
+    Returns list of row dictionaries, with sections 1 to 12 so natural
+    and text order differ, and laterality missing in some rows.
+    '''
+    rows = []
+    for index in range(60):
+        rows.append({
+            'subject_id': str(index % 3 + 1),
+            'stain': ['5ht', '5ht2a', 'a2a+ctb'][index % 3 - 1],
+            'section': str(index % 12 + 1),
+            'laterality': [None, 'left', 'right', 'left'][index % 4],
+            'current_file_path': '/images/image_{}.tif'.format(index),
+            })
+    return rows
+
+
+class SparcCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = catalogRows()
+        self.dFrame = pd.DataFrame(self.rows)
+        self.catalog = sparcCatalog.SparcCatalog(
+            LABELS, PATH_LABELS, chunk_size=7
+            )
+        for row in self.rows:
+            self.catalog.append(row)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def expected(self, mask):
+        return list(np.flatnonzero(mask.to_numpy()))
+
+    def testInterning(self):
+        self.assertEqual(len(self.catalog), 60)
+        self.assertEqual(sorted(self.catalog.strings['subject_id']),
+                         ['1', '2', '3'])
+        self.assertEqual(self.catalog.codes['section'].dtype, np.int8)
+        self.assertEqual(self.catalog.values('laterality', [0, 1]),
+                         [None, 'left'])
+        self.assertEqual(self.catalog.value('current_file_path', 5),
+                         '/images/image_5.tif')
+
+    def testFindValues(self):
+        self.assertEqual(
+            list(self.catalog.find(subject_id='2', laterality='left')),
+            self.expected((self.dFrame['subject_id'] == '2') &
+                          (self.dFrame['laterality'] == 'left'))
+            )
+        self.assertEqual(list(self.catalog.find(laterality=None)),
+                         self.expected(self.dFrame['laterality'].isna()))
+        self.assertEqual(list(self.catalog.find(subject_id=['1', '3', '9'])),
+                         self.expected(self.dFrame['subject_id'] != '2'))
+        self.assertEqual(len(self.catalog.find(subject_id='9')), 0)
+        self.assertEqual(len(self.catalog.find()), 60)
+
+    def testFindMatchesSelect(self):
+        self.assertEqual(
+            list(self.catalog.find(subject_id='1', stain='5ht')),
+            list(self.catalog.select(subject_id='1', stain='5ht'))
+            )
+
+    def testRangeInNaturalOrder(self):
+        sections = self.dFrame['section'].astype(int)
+        found = self.catalog.find(section=sparcCatalog.ValueRange('2', '10'))
+        self.assertEqual(list(found),
+                         self.expected((sections >= 2) & (sections <= 10)))
+        found = self.catalog.find(section=sparcCatalog.ValueRange('11', None))
+        self.assertEqual(list(found), self.expected(sections >= 11))
+        found = self.catalog.find(section=sparcCatalog.ValueRange('5', '3'))
+        self.assertEqual(len(found), 0)
+
+    def testGroups(self):
+        counts = self.catalog.counts('subject_id', 'laterality')
+        expected = self.dFrame.fillna({'laterality': 'none'}).groupby(
+            ['subject_id', 'laterality']).size()
+        self.assertEqual(sum(counts.values()), 60)
+        for (subject_id, laterality), count in counts.items():
+            self.assertEqual(
+                count, expected[subject_id, laterality or 'none']
+                )
+
+    def testSaveLoad(self):
+        self.catalog.save(self.temp_dir, INDEX_LABELS)
+        loaded = sparcCatalog.SparcCatalog.load(self.temp_dir)
+        self.assertEqual(len(loaded), 60)
+        self.assertEqual(loaded.saved_indexes, INDEX_LABELS)
+        for conditions in [
+                {'subject_id': '3'},
+                {'laterality': None},
+                {'section': sparcCatalog.ValueRange('9', '12'),
+                 'laterality': 'right'},
+                {'stain': 'a2a+ctb'},
+                ]:
+            self.assertEqual(list(loaded.find(**conditions)),
+                             list(self.catalog.find(**conditions)))
+        self.assertIsInstance(loaded.index('section').rows, np.memmap)
+        self.assertEqual(list(loaded.values('current_file_path')),
+                         [row['current_file_path'] for row in self.rows])
+        # codes of the loaded frame stay memory mapped
+        self.assertTrue(
+            loaded.toDataframe().equals(self.catalog.toDataframe())
+            )
+
+    def testAddDataframe(self):
+        dFrame = self.dFrame.copy()
+        dFrame['stain'] = dFrame['stain'].astype('category')
+        catalog = sparcCatalog.SparcCatalog(LABELS, PATH_LABELS)
+        catalog.addDataframe(dFrame)
+        self.assertEqual(catalog.values('stain'), list(self.dFrame['stain']))
+        self.assertEqual(list(catalog.find(laterality='right')),
+                         list(self.catalog.find(laterality='right')))
+
+    def testParseCondition(self):
+        self.assertEqual(sparcCatalog.parseCondition('section=3..10'),
+                         ('section', sparcCatalog.ValueRange('3', '10')))
+        self.assertEqual(sparcCatalog.parseCondition('section=..10'),
+                         ('section', sparcCatalog.ValueRange(None, '10')))
+        self.assertEqual(sparcCatalog.parseCondition('stain=5ht,a2a'),
+                         ('stain', ['5ht', 'a2a']))
+        self.assertEqual(sparcCatalog.parseCondition('laterality='),
+                         ('laterality', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+'''
+Tests of readTiffHeader and the header columns built from it, on the
+synthetic TIFF files of sparcBenchmarks.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import imageFileManager
+import sparcBenchmarks
+import tiffHeader
+
+# a packet whose text is shorter than its utf-8 bytes
+XMP_PACKET = '<x:xmpmeta><dc:subject>Färbung µm</dc:subject></x:xmpmeta>'
+
+
+class TiffHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'image.tif')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def testHeaderValues(self):
+        sparcBenchmarks.writeSyntheticTiff(self.file_path, 2 * 64 * 64)
+        header = tiffHeader.readTiffHeader(self.file_path)
+        self.assertEqual(header[:5], (64, 64, 16, 1, 1))
+
+    def testXmpBytes(self):
+        sparcBenchmarks.writeSyntheticTiff(
+            self.file_path, 2 * 64 * 64, XMP_PACKET
+            )
+        header = tiffHeader.readTiffHeader(self.file_path)
+        self.assertEqual(header.xmp, XMP_PACKET)
+        self.assertEqual(header.xmp_bytes, len(XMP_PACKET.encode('utf-8')))
+        self.assertEqual(
+            imageFileManager.readHeaderRow(self.file_path)[-1],
+            len(XMP_PACKET.encode('utf-8'))
+            )
+
+    def testNoXmp(self):
+        sparcBenchmarks.writeSyntheticTiff(self.file_path, 2 * 64 * 64, '')
+        header = tiffHeader.readTiffHeader(self.file_path)
+        self.assertIsNone(header.xmp)
+        self.assertEqual(header.xmp_bytes, 0)
+
+    def testNotTiff(self):
+        with open(self.file_path, 'wb') as f:
+            f.write(b'not a tiff')
+        with self.assertRaises(ValueError):
+            tiffHeader.readTiffHeader(self.file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
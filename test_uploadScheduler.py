@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+'''
+Tests of UploadScheduler batching, retries with backoff, failure handling
+and the upload journal, against the local fakeBlackfynn client.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import fakeBlackfynn
+import uploadScheduler
+import warehouseIndex
+
+
+class UploadSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.files = []
+        for index in range(5):
+            file_path = os.path.join(
+                self.temp_dir, 'image_{}.tif'.format(index)
+                )
+            with open(file_path, 'wb') as f:
+                f.write(b'\0' * (index + 1))
+            self.files.append(file_path)
+        self.journal_file = os.path.join(self.temp_dir, 'journal.csv')
+        self.client = fakeBlackfynn.FakeBlackfynn()
+        self.dataset = self.client.get_dataset('dataset')
+        # backoff sleeps are recorded instead of waited for
+        patcher = mock.patch('uploadScheduler.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def scheduler(self, **kwargs):
+        self.tree = warehouseIndex.CollectionTree(self.dataset)
+        self.index = warehouseIndex.RemoteIndexCache()
+        return uploadScheduler.UploadScheduler(
+            self.tree, self.index, jobs=2, **kwargs
+            )
+
+    def backoffs(self):
+        # the fake client sleeps its zero latency through the same patch
+        return [call.args[0] for call in self.sleep.call_args_list
+                if call.args[0]]
+
+    def statuses(self, results):
+        return sorted((result.status, len(result.task.files))
+                      for result in results)
+
+    def testBatchesPerCollection(self):
+        scheduler = self.scheduler(batch_files=2)
+        results = scheduler.run([('samples/sam-1', self.files[:3]),
+                                 ('samples/sam-1', self.files[3:])])
+        self.assertEqual(self.statuses(results),
+                         [('uploaded', 1), ('uploaded', 2), ('uploaded', 2)])
+        self.assertEqual(self.client.calls['upload'], 3)
+        self.assertEqual(sum(result.bytes for result in results), 15)
+        collection = self.tree.resolve('samples/sam-1')
+        self.assertEqual(len(self.index.cached(collection)), 5)
+
+    def testRetriesTransientErrors(self):
+        scheduler = self.scheduler(backoff=1.0)
+        collection = self.tree.resolve('samples')
+        with mock.patch.object(collection, 'upload', side_effect=[
+                ConnectionError('dropped'), TimeoutError('timed out'), None
+                ]) as upload:
+            result, = scheduler.run([('samples', self.files)])
+        self.assertEqual(upload.call_count, 3)
+        self.assertEqual((result.status, result.attempts), ('uploaded', 3))
+        self.assertEqual(self.backoffs(), [1.0, 2.0])
+        self.assertIn('2 retries', scheduler.report())
+
+    def testGivesUpAfterRetries(self):
+        self.client.failure_rate = 1.0
+        scheduler = self.scheduler(retries=2, backoff=0.5)
+        with mock.patch('builtins.print'):
+            result, = scheduler.run([('samples', self.files)])
+        self.assertEqual((result.status, result.attempts), ('failed', 3))
+        self.assertEqual(self.client.calls['upload'], 3)
+        self.assertEqual(self.backoffs(), [0.5, 1.0])
+
+    def testPermanentErrorNotRetried(self):
+        scheduler = self.scheduler()
+        collection = self.tree.resolve('samples')
+        with mock.patch.object(collection, 'upload',
+                               side_effect=ValueError('bad request')), \
+                mock.patch('builtins.print'):
+            result, = scheduler.run([('samples', self.files)])
+        self.assertEqual((result.status, result.attempts), ('failed', 1))
+        self.assertEqual(result.error, 'bad request')
+        self.assertEqual(self.backoffs(), [])
+
+    def testResolveRetriedAndFailureRecorded(self):
+        scheduler = self.scheduler()
+        with mock.patch('builtins.print'):
+            collection = self.tree.resolve('ok')
+        # tasks run in collection order, 'denied' first
+        with mock.patch.object(self.tree, 'resolve', side_effect=[
+                ValueError('no access'), ConnectionError('dropped'),
+                collection,
+                ]), mock.patch('builtins.print'):
+            results = scheduler.run([('ok', self.files[:2]),
+                                     ('denied', self.files[2:])])
+        self.assertEqual(self.statuses(results),
+                         [('failed', 3), ('uploaded', 2)])
+        self.assertEqual(self.backoffs(), [1.0])
+
+    def testMissingFileFailsAlone(self):
+        missing = os.path.join(self.temp_dir, 'missing.tif')
+        scheduler = self.scheduler()
+        with mock.patch('builtins.print'):
+            results = scheduler.run([('samples', self.files + [missing])])
+        self.assertEqual(self.statuses(results),
+                         [('failed', 1), ('uploaded', 5)])
+
+    def testSkipsRemoteCopies(self):
+        self.tree = warehouseIndex.CollectionTree(self.dataset)
+        self.tree.resolve('samples').upload(self.files[0])
+        scheduler = self.scheduler()
+        with mock.patch('builtins.print'):
+            results = scheduler.run([('samples', self.files)])
+        self.assertEqual(self.statuses(results),
+                         [('skipped', 1), ('uploaded', 4)])
+
+    def testJournalSkipsWithoutRemoteCalls(self):
+        journal = uploadScheduler.UploadJournal(self.journal_file)
+        self.scheduler(journal=journal).run([('samples', self.files)])
+        journal.close()
+        calls = dict(self.client.calls)
+        journal = uploadScheduler.UploadJournal(self.journal_file)
+        scheduler = self.scheduler(journal=journal)
+        with mock.patch('builtins.print'):
+            results = scheduler.run([('samples', self.files)])
+        journal.close()
+        self.assertEqual(self.statuses(results), [('skipped', 1)] * 5)
+        self.assertEqual(dict(self.client.calls), calls)
+
+    def testJournalMissesChangedFile(self):
+        journal = uploadScheduler.UploadJournal(self.journal_file)
+        self.scheduler(journal=journal).run([('samples', self.files[:1])])
+        journal.close()
+        with open(self.files[0], 'ab') as f:
+            f.write(b'\0')
+        journal = uploadScheduler.UploadJournal(self.journal_file)
+        self.assertFalse(journal.contains(self.files[0], 'samples'))
+        self.assertFalse(journal.contains(self.files[0], 'other'))
+        journal.close()
+
+
+class BatchFilesTest(unittest.TestCase):
+
+    def testLimits(self):
+        sizes = {'a': 5, 'b': 5, 'c': 20, 'd': 1, 'e': 1, 'f': 1}
+        batches = list(uploadScheduler.batchFiles(
+            'abcdef', batch_bytes=10, batch_files=2, sizes=sizes
+            ))
+        self.assertEqual(batches,
+                         [['a', 'b'], ['c'], ['d', 'e'], ['f']])
+
+
+if __name__ == '__main__':
+    unittest.main()
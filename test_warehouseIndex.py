@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+'''
+Tests of RemoteIndexCache and CollectionTree against the local
+fakeBlackfynn client, counting the calls that would reach the API.
+'''
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import fakeBlackfynn
+import warehouseIndex
+
+
+class RemoteIndexCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = fakeBlackfynn.FakeBlackfynn()
+        self.collection = self.client.get_dataset('dataset') \
+            .create_collection('images')
+        self.collection.upload('/images/a.tif', '/images/b.tif')
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.temp_dir, 'index.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def listingCalls(self):
+        return self.client.calls['items'] + self.client.calls['sources']
+
+    def testMissListsRemotely(self):
+        index = warehouseIndex.RemoteIndexCache()
+        self.assertIsNone(index.cached(self.collection))
+        self.assertEqual(index.names(self.collection), {'a.tif', 'b.tif'})
+        self.assertEqual(index.fetches, 1)
+        self.assertEqual(self.client.calls['items'], 1)
+        self.assertEqual(self.client.calls['sources'], 2)
+
+    def testHitMakesNoCalls(self):
+        index = warehouseIndex.RemoteIndexCache()
+        index.names(self.collection)
+        calls = self.listingCalls()
+        self.assertTrue(index.contains(self.collection, 'a.tif'))
+        self.assertFalse(index.contains(self.collection, 'c.tif'))
+        self.assertEqual(self.listingCalls(), calls)
+        self.assertEqual(index.fetches, 1)
+
+    def testAddKeepsListingCurrent(self):
+        index = warehouseIndex.RemoteIndexCache()
+        index.add(self.collection, 'c.tif')
+        calls = self.listingCalls()
+        self.assertTrue(index.contains(self.collection, 'c.tif'))
+        self.assertEqual(self.listingCalls(), calls)
+
+    def testPersistsAcrossReopen(self):
+        index = warehouseIndex.RemoteIndexCache(self.cache_file)
+        index.names(self.collection)
+        index.add(self.collection, 'c.tif')
+        index.close()
+        calls = self.listingCalls()
+        reopened = warehouseIndex.RemoteIndexCache(self.cache_file)
+        self.assertEqual(reopened.cached(self.collection),
+                         {'a.tif', 'b.tif', 'c.tif'})
+        self.assertEqual(reopened.fetches, 0)
+        self.assertEqual(self.listingCalls(), calls)
+        reopened.close()
+
+    def testTtlExpiry(self):
+        index = warehouseIndex.RemoteIndexCache(self.cache_file, ttl=60)
+        index.names(self.collection)
+        index.close()
+        now = time.time()
+        with mock.patch('warehouseIndex.time.time', return_value=now + 30):
+            fresh = warehouseIndex.RemoteIndexCache(self.cache_file, ttl=60)
+            self.assertIsNotNone(fresh.cached(self.collection))
+            fresh.close()
+        calls = self.listingCalls()
+        with mock.patch('warehouseIndex.time.time', return_value=now + 90):
+            expired = warehouseIndex.RemoteIndexCache(self.cache_file, ttl=60)
+            self.assertIsNone(expired.cached(self.collection))
+            self.assertEqual(self.listingCalls(), calls)
+            self.assertEqual(expired.names(self.collection),
+                             {'a.tif', 'b.tif'})
+            self.assertEqual(expired.fetches, 1)
+            self.assertGreater(self.listingCalls(), calls)
+            expired.close()
+
+    def testInvalidateCollection(self):
+        other = self.client.get_dataset('dataset').create_collection('other')
+        index = warehouseIndex.RemoteIndexCache(self.cache_file)
+        index.names(self.collection)
+        index.names(other)
+        index.invalidate(self.collection)
+        self.assertIsNone(index.cached(self.collection))
+        self.assertIsNotNone(index.cached(other))
+        self.collection.upload('/images/c.tif')
+        self.assertTrue(index.contains(self.collection, 'c.tif'))
+        self.assertEqual(index.fetches, 3)
+        index.close()
+
+    def testInvalidateAll(self):
+        other = self.client.get_dataset('dataset').create_collection('other')
+        index = warehouseIndex.RemoteIndexCache(self.cache_file)
+        index.names(self.collection)
+        index.names(other)
+        index.invalidate()
+        index.close()
+        reopened = warehouseIndex.RemoteIndexCache(self.cache_file)
+        self.assertIsNone(reopened.cached(self.collection))
+        self.assertIsNone(reopened.cached(other))
+        reopened.close()
+
+
+class CollectionTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = fakeBlackfynn.FakeBlackfynn()
+        self.dataset = self.client.get_dataset('dataset')
+        self.tree = warehouseIndex.CollectionTree(self.dataset)
+
+    def testCreatesMissingLevels(self):
+        collection = self.tree.resolve('samples/sam-1/phrenic')
+        self.assertEqual(collection.name, 'phrenic')
+        self.assertEqual(self.client.calls['create_collection'], 3)
+        # collections just created are known to be empty, only root is listed
+        self.assertEqual(self.client.calls['items'], 1)
+
+    def testReusesPrefix(self):
+        first = self.tree.resolve('samples/sam-1/phrenic')
+        second = self.tree.resolve('samples/sam-1/vagus')
+        again = self.tree.resolve('samples/sam-1/phrenic')
+        self.assertIs(again, first)
+        self.assertIsNot(second, first)
+        # the second path only adds its leaf, the third is cached
+        self.assertEqual(self.client.calls['items'], 1)
+        self.assertEqual(self.client.calls['create_collection'], 4)
+        self.assertEqual(self.tree.listings, 1)
+        self.assertEqual(self.tree.created, 4)
+        self.assertEqual(
+            self.tree.report(),
+            '1 collection listings, 4 created, 8 API calls saved'
+            )
+
+    def testFindsExistingCollections(self):
+        samples = self.dataset.create_collection('samples')
+        existing = samples.create_collection('sam-1')
+        calls = self.client.calls['create_collection']
+        self.assertIs(self.tree.resolve('samples/sam-1'), existing)
+        self.assertIs(self.tree.resolve('/samples/sam-1/'), existing)
+        self.assertEqual(self.client.calls['create_collection'], calls)
+        self.assertEqual(self.client.calls['items'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
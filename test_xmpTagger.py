@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+'''
+Tests of XmpTagger against an in-memory stand-in for pyexiv2 metadata,
+counting the files it rewrites.
+'''
+
+import unittest
+from unittest import mock
+
+import imageFileManager
+
+
+class FakeTag:
+
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeMetadata:
+    '''
+    pyexiv2.ImageMetadata over a dictionary of file path to
+    Xmp.dc.subject list. Paths not in files cannot be read.
+    '''
+
+    files = {}
+    writes = []
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.tags = {}
+
+    def read(self):
+        if self.file_path not in self.files:
+            raise IOError('No such file {}'.format(self.file_path))
+        if self.files[self.file_path] is not None:
+            self.tags['Xmp.dc.subject'] = FakeTag(self.files[self.file_path])
+
+    @property
+    def xmp_keys(self):
+        return list(self.tags)
+
+    def __getitem__(self, key):
+        return self.tags[key]
+
+    def __setitem__(self, key, value):
+        self.tags[key] = FakeTag(value)
+
+    def write(self):
+        self.files[self.file_path] = self.tags['Xmp.dc.subject'].value
+        self.writes.append(self.file_path)
+
+
+class XmpTaggerTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeMetadata.files = {'/a.tif': None, '/b.tif': ['1', 'left'],
+                              '/c.tif': ['1', 'right']}
+        FakeMetadata.writes = []
+        patcher = mock.patch('imageFileManager.pyexiv2.ImageMetadata',
+                             FakeMetadata)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testWritesOnlyChangedTags(self):
+        tagger = imageFileManager.XmpTagger(jobs=2)
+        results = tagger.tagAll([
+            ('/a.tif', ['1', 'left']), ('/b.tif', ['1', 'left']),
+            ('/c.tif', ['1', 'left']),
+            ])
+        self.assertEqual([result.file_path for result in results],
+                         ['/a.tif', '/b.tif', '/c.tif'])
+        self.assertEqual([result.status for result in results],
+                         ['written', 'skipped', 'written'])
+        self.assertEqual(sorted(FakeMetadata.writes), ['/a.tif', '/c.tif'])
+        self.assertEqual(FakeMetadata.files['/c.tif'], ['1', 'left'])
+
+    def testRetagSkipsEverything(self):
+        tasks = [('/a.tif', ['2']), ('/b.tif', ['2'])]
+        imageFileManager.XmpTagger().tagAll(tasks)
+        FakeMetadata.writes = []
+        results = imageFileManager.XmpTagger().tagAll(tasks)
+        self.assertEqual([result.status for result in results],
+                         ['skipped', 'skipped'])
+        self.assertEqual(FakeMetadata.writes, [])
+
+    def testFailureIsRecorded(self):
+        tagger = imageFileManager.XmpTagger()
+        with mock.patch('builtins.print'):
+            results = tagger.tagAll([('/missing.tif', ['1']),
+                                     ('/a.tif', ['1'])])
+        self.assertEqual(results[0].status, 'failed')
+        self.assertIn('/missing.tif', results[0].error)
+        self.assertEqual(results[1].status, 'written')
+
+    def testSummary(self):
+        tagger = imageFileManager.XmpTagger()
+        with mock.patch('builtins.print'):
+            tagger.tagAll([('/a.tif', ['1']), ('/b.tif', ['1', 'left']),
+                           ('/missing.tif', ['1'])])
+        lines = tagger.summary(slowest=2).split('\n')
+        self.assertTrue(lines[0].startswith('1 written, 1 skipped, 1 failed'))
+        self.assertEqual(len(lines), 3)
+
+    def testNoTasks(self):
+        tagger = imageFileManager.XmpTagger()
+        self.assertEqual(tagger.tagAll([]), [])
+        self.assertTrue(tagger.summary().startswith('0 written'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+'''
+Reads TIFF header values without loading the image.
+
+The file is memory mapped and only the IFD chain and the XMP packet are
+read from it, so the cost does not grow with the size of the pixel data.
+Classic and BigTIFF files in either byte order are supported. Values come
+from the first IFD; pages counts every IFD in the chain.
+'''
+
+import mmap
+import struct
+import collections
+
+TiffHeader = collections.namedtuple(
+    'TiffHeader',
+    ['width', 'height', 'bits_per_sample', 'samples_per_pixel', 'pages', 'xmp',
+     'xmp_bytes']
+    )
+
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+SAMPLES_PER_PIXEL = 277
+XMP_PACKET = 700
+
+# struct format and size of the TIFF field types used by the header tags
+FIELD_TYPES = {
+    1: ('B', 1), 2: ('B', 1), 3: ('H', 2), 4: ('I', 4),
+    7: ('B', 1), 16: ('Q', 8),
+    }
+
+# classic and BigTIFF layouts: magic number, offset of the first IFD
+# offset, entry count format, entry format and next IFD offset format
+LAYOUTS = {
+    42: (4, 'I', 'H', 'HHI', 'I'),
+    43: (8, 'Q', 'Q', 'HHQ', 'Q'),
+    }
+
+
+def readIfd(view, order, layout, offset):
+    '''
+    Returns dictionary of tag to (field type, count, value offset) for the
+    IFD at offset, and the offset of the next IFD.
+    '''
+    first, offset_format, count_format, entry_format, next_format = layout
+    entry_size = struct.calcsize(order + entry_format + offset_format)
+    inline_size = struct.calcsize(order + offset_format)
+    count, = struct.unpack_from(order + count_format, view, offset)
+    offset += struct.calcsize(order + count_format)
+    tags = {}
+    for entry in range(count):
+        tag, field_type, value_count = struct.unpack_from(
+            order + entry_format, view, offset
+            )
+        value_offset = offset + entry_size - inline_size
+        size = FIELD_TYPES.get(field_type, ('B', 1))[1] * value_count
+        if size > inline_size:
+            value_offset, = struct.unpack_from(
+                order + offset_format, view, value_offset
+                )
+        tags[tag] = (field_type, value_count, value_offset)
+        offset += entry_size
+    next_ifd, = struct.unpack_from(order + next_format, view, offset)
+    return tags, next_ifd
+
+
+def readValue(view, order, tags, tag, default=None):
+    '''
+    Returns first value of numeric tag, or default if missing.
+    '''
+    if tag not in tags:
+        return default
+    field_type, value_count, value_offset = tags[tag]
+    value_format = FIELD_TYPES.get(field_type, ('B', 1))[0]
+    return struct.unpack_from(order + value_format, view, value_offset)[0]
+
+
+def readTiffHeader(file_path):
+    '''
+    Memory maps file_path and reads dimensions, bit depth, samples per
+    pixel, page count, and XMP packet text and size in bytes of its
+    first IFD.
+    Returns TiffHeader. Raises ValueError if file_path is not a TIFF.
+    '''
+    with open(file_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        order = {b'II': '<', b'MM': '>'}.get(view[:2])
+        if order is None:
+            raise ValueError('Not a TIFF file')
+        magic, = struct.unpack_from(order + 'H', view, 2)
+        if magic not in LAYOUTS:
+            raise ValueError('Unknown TIFF version {}'.format(magic))
+        layout = LAYOUTS[magic]
+        offset, = struct.unpack_from(order + layout[1], view, layout[0])
+        tags, offset = readIfd(view, order, layout, offset)
+        pages = 1
+        visited = set()
+        while offset and offset not in visited and offset < len(view):
+            visited.add(offset)
+            offset = readIfd(view, order, layout, offset)[1]
+            pages += 1
+        xmp = None
+        xmp_bytes = 0
+        if XMP_PACKET in tags:
+            field_type, value_count, value_offset = tags[XMP_PACKET]
+            xmp = view[value_offset:value_offset + value_count].decode(
+                'utf-8', errors='replace'
+                )
+            xmp_bytes = value_count
+        return TiffHeader(
+            readValue(view, order, tags, IMAGE_WIDTH),
+            readValue(view, order, tags, IMAGE_LENGTH),
+            readValue(view, order, tags, BITS_PER_SAMPLE, 1),
+            readValue(view, order, tags, SAMPLES_PER_PIXEL, 1),
+            pages,
+            xmp,
+            xmp_bytes
+            )
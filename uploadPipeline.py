@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+'''
+Asyncio upload pipeline overlapping local file checks, collection
+resolution, remote duplicate checks and uploads.
+
+Upload tasks are read and their files stat'ed in a discovery thread, so
+tasks can come from a generator that is still scanning the disk. The other
+stages are coroutines, each connected to the next by a bounded queue, so a
+slow stage holds back the stages before it instead of buffering without
+limit:
+
+    discover -> check -> resolve -> lookup -> collect -> upload workers
+
+check drops copies known to the dedup index and files in the journal.
+resolve finds or creates the destination collection. lookup starts the
+remote listing of each new collection, and collect drops files the listing
+already holds and groups the rest into upload batches per collection.
+
+Blocking Blackfynn client calls run in thread pool executors. Collections
+are resolved one at a time, since CollectionTree creates missing levels,
+and each collection is listed at most once. Journal, dedup index and
+listing cache lookups use SQLite, so they stay in the event loop thread.
+
+UploadPipeline can replace UploadScheduler and keeps its retries, batch
+limits, journal, dedup index and report. Tasks are taken in the order
+given rather than sorted, so batches are kept open for the most recent
+collections only, and files of one collection far apart in the input can
+go in separate batches.
+'''
+
+import os
+import time
+import asyncio
+import threading
+import collections
+import concurrent.futures
+import uploadScheduler
+import warehouseIndex
+
+QUEUE_SIZE = 256
+OPEN_BATCHES = 64
+
+
+class UploadPipeline(uploadScheduler.UploadScheduler):
+    '''
+    UploadScheduler running its steps as asyncio pipeline stages, with
+    at most queue_size tasks waiting between two stages and batches open
+    for at most open_batches collections. With task_batches, files of
+    different tasks are not batched together.
+    '''
+
+    def __init__(self, tree, index, jobs=uploadScheduler.UPLOAD_JOBS,
+                 retries=uploadScheduler.UPLOAD_RETRIES,
+                 backoff=uploadScheduler.UPLOAD_BACKOFF, journal=None,
+                 batch_bytes=uploadScheduler.BATCH_BYTES,
+                 batch_files=uploadScheduler.BATCH_FILES,
+                 sizes=None, dedup=None, queue_size=QUEUE_SIZE,
+                 open_batches=OPEN_BATCHES, task_batches=False):
+        super().__init__(tree, index, jobs, retries, backoff, journal,
+                         batch_bytes, batch_files, sizes, dedup)
+        self.queue_size = queue_size
+        self.open_batches = open_batches
+        self.task_batches = task_batches
+        self.listings = {}
+        self.error = None
+
+    def discover(self, tasks, outbox, loop):
+        '''
+        Reads tasks and stats their files in the discovery thread. Puts
+        tasks of the files found on outbox, waiting while it is full.
+        '''
+        def put(task):
+            asyncio.run_coroutine_threadsafe(outbox.put(task), loop).result()
+
+        try:
+            for task in tasks:
+                task = uploadScheduler.UploadTask(*task)
+                files = []
+                for file_path in task.files:
+                    file_path = str(file_path)
+                    try:
+                        self.sizes[file_path] = os.stat(file_path).st_size
+                    except OSError:
+                        print('Error uploading {}. File does not exist.'
+                              .format(file_path))
+                        continue
+                    files.append(file_path)
+                if files:
+                    put(uploadScheduler.UploadTask(task.collection_path, files))
+        except Exception as ex:
+            self.error = ex
+        finally:
+            put(None)
+
+    async def check(self, inbox, outbox):
+        while True:
+            task = await inbox.get()
+            if task is None:
+                break
+            files = self.dropKnown(task)
+            if files:
+                await outbox.put(
+                    uploadScheduler.UploadTask(task.collection_path, files)
+                    )
+        await outbox.put(None)
+
+    async def resolve(self, inbox, outbox, pool):
+        '''
+        Resolves task collections one at a time in pool, remembering
+        each collection path resolved in this run.
+        '''
+        loop = asyncio.get_running_loop()
+        resolved = {}
+        while True:
+            task = await inbox.get()
+            if task is None:
+                break
+            collection = resolved.get(task.collection_path)
+            if collection is None:
+                try:
+                    collection = await loop.run_in_executor(
+                        pool, self.retry, self.tree.resolve,
+                        task.collection_path
+                        )
+                except Exception as ex:
+                    self.fail(task, ex)
+                    continue
+                resolved[task.collection_path] = collection
+            await outbox.put((collection, task))
+        await outbox.put(None)
+
+    async def fetch(self, collection, pool):
+        loop = asyncio.get_running_loop()
+        names = await loop.run_in_executor(
+            pool, self.retry, warehouseIndex.listCollection, collection
+            )
+        return self.index.update(collection, names)
+
+    def listing(self, collection, pool):
+        '''
+        Returns future of the file names in collection, listed remotely
+        in pool only when the index holds no fresh listing.
+        '''
+        collection_id = str(collection.id)
+        if collection_id not in self.listings:
+            names = self.index.cached(collection)
+            if names is None:
+                future = asyncio.ensure_future(self.fetch(collection, pool))
+            else:
+                future = asyncio.get_running_loop().create_future()
+                future.set_result(names)
+            self.listings[collection_id] = future
+        return self.listings[collection_id]
+
+    async def lookup(self, inbox, outbox, pool):
+        '''
+        Starts the listing of each collection as its first task arrives,
+        so listings run ahead of the collect stage.
+        '''
+        while True:
+            item = await inbox.get()
+            if item is None:
+                break
+            collection, task = item
+            await outbox.put((collection, task, self.listing(collection, pool)))
+        await outbox.put(None)
+
+    async def collect(self, inbox, outbox):
+        '''
+        Drops files already in their collection listing and adds the rest
+        to an open batch per collection. A batch is put on outbox once it
+        holds batch_files files or batch_bytes, or when it is the oldest
+        of more than open_batches open batches, or at the end of its task
+        with task_batches.
+        '''
+        batches = collections.OrderedDict()
+        while True:
+            item = await inbox.get()
+            if item is None:
+                break
+            collection, task, listing = item
+            try:
+                names = await listing
+            except Exception as ex:
+                self.fail(task, ex)
+                continue
+            for file_path in task.files:
+                if os.path.basename(file_path) in names:
+                    self.skip(task, file_path)
+                    continue
+                file_size = self.sizes.get(file_path, 0)
+                batch = batches.get(task.collection_path)
+                if batch and (len(batch[1]) >= self.batch_files or
+                              batch[2] + file_size > self.batch_bytes):
+                    del batches[task.collection_path]
+                    await self.send(outbox, task.collection_path, batch)
+                    batch = None
+                if batch is None:
+                    batch = batches[task.collection_path] = [collection, [], 0]
+                    if len(batches) > self.open_batches:
+                        oldest = next(iter(batches))
+                        await self.send(outbox, oldest, batches.pop(oldest))
+                batch[1].append(file_path)
+                batch[2] += file_size
+            if self.task_batches and task.collection_path in batches:
+                await self.send(outbox, task.collection_path,
+                                batches.pop(task.collection_path))
+        for collection_path, batch in batches.items():
+            await self.send(outbox, collection_path, batch)
+        for worker in range(self.jobs):
+            await outbox.put(None)
+
+    async def send(self, outbox, collection_path, batch):
+        collection, files, size = batch
+        await outbox.put(
+            (collection, uploadScheduler.UploadTask(collection_path, files))
+            )
+
+    async def upload(self, inbox, pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await inbox.get()
+            if item is None:
+                return
+            collection, task = item
+            result = await loop.run_in_executor(
+                pool, self.uploadWithRetry, task, collection
+                )
+            self.record(collection, result)
+
+    async def runAsync(self, tasks):
+        '''
+        Uploads (collection_path, files) tasks through the pipeline.
+        Returns list of UploadResult for this run.
+        '''
+        start = time.perf_counter()
+        first = len(self.results)
+        loop = asyncio.get_running_loop()
+        self.listings = {}
+        self.error = None
+        queues = [asyncio.Queue(self.queue_size) for stage in range(4)]
+        # at most jobs batches wait for a free upload worker
+        batches = asyncio.Queue(self.jobs)
+        resolve_pool = concurrent.futures.ThreadPoolExecutor(1)
+        list_pool = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        upload_pool = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        discovery = threading.Thread(
+            target=self.discover, args=(tasks, queues[0], loop), daemon=True
+            )
+        discovery.start()
+        try:
+            await asyncio.gather(
+                self.check(queues[0], queues[1]),
+                self.resolve(queues[1], queues[2], resolve_pool),
+                self.lookup(queues[2], queues[3], list_pool),
+                self.collect(queues[3], batches),
+                *[self.upload(batches, upload_pool)
+                  for worker in range(self.jobs)]
+                )
+        finally:
+            for pool in [resolve_pool, list_pool, upload_pool]:
+                pool.shutdown()
+        discovery.join()
+        self.elapsed += time.perf_counter() - start
+        if self.error:
+            raise self.error
+        return self.results[first:]
+
+    def run(self, tasks):
+        '''
+        Runs the pipeline over tasks in a new event loop until every file
+        is uploaded or skipped. Returns list of UploadResult for this run.
+        '''
+        return asyncio.run(self.runAsync(tasks))
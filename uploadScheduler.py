@@ -0,0 +1,355 @@
+#!/usr/bin/python3
+'''
+Concurrent uploads to a Blackfynn dataset over one shared client.
+
+Upload tasks are (collection path, files) pairs. They are ordered by
+collection, resolved through a CollectionTree and checked against a
+RemoteIndexCache in the calling thread, then uploaded by a bounded pool of
+worker threads. Uploads, collection resolution and listings failing with
+transient network errors are retried with exponential backoff. Files that
+still fail, or vanish before upload, are reported as failed without
+stopping the run. Throughput in bytes/s and files/s is reported for the
+run.
+
+Files going to the same collection are sent in batches bounded by total
+bytes and file count, so small files such as z-stack slices share one
+upload request instead of paying its overhead each.
+
+Completed uploads can be recorded in an UploadJournal, so a restarted run
+skips them before any collection is resolved or listed remotely. Files a
+DedupIndex knows as copies of another file are not uploaded.
+'''
+
+import os
+import csv
+import time
+import itertools
+import collections
+import concurrent.futures
+import requests
+
+UPLOAD_JOBS = 4
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF = 1.0
+UPLOAD_CHECKPOINT = 100
+BATCH_BYTES = 256 * 1024 * 1024
+BATCH_FILES = 50
+
+UploadTask = collections.namedtuple('UploadTask', ['collection_path', 'files'])
+
+UploadResult = collections.namedtuple(
+    'UploadResult',
+    ['task', 'status', 'attempts', 'seconds', 'bytes', 'error']
+    )
+
+
+def isTransient(ex):
+    '''
+    Returns True for errors worth retrying: dropped connections,
+    timeouts, throttling and server side failures.
+    '''
+    if isinstance(ex, (ConnectionError, TimeoutError,
+                       requests.exceptions.ConnectionError,
+                       requests.exceptions.Timeout)):
+        return True
+    if isinstance(ex, requests.exceptions.HTTPError) and ex.response is not None:
+        return ex.response.status_code == 429 or ex.response.status_code >= 500
+    return False
+
+
+def fileSize(file_path, sizes=None):
+    '''
+    Returns size of file_path from sizes if known, else from disk.
+    '''
+    if sizes and file_path in sizes:
+        return sizes[file_path]
+    return os.path.getsize(file_path)
+
+
+def batchFiles(files, batch_bytes=BATCH_BYTES, batch_files=BATCH_FILES,
+               sizes=None):
+    '''
+    Splits files into lists of at most batch_files files and batch_bytes
+    total size, in order. Files larger than batch_bytes go alone.
+    Sizes are read from sizes when given.
+    '''
+    batch = []
+    size = 0
+    for file_path in files:
+        file_size = fileSize(file_path, sizes)
+        if batch and (len(batch) >= batch_files or
+                      size + file_size > batch_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(file_path)
+        size += file_size
+    if batch:
+        yield batch
+
+
+class UploadJournal:
+    '''
+    Append-only csv journal of completed uploads, one row of source path,
+    size, mtime and destination collection path per file. A file counts as
+    uploaded while its size and mtime match the journal. Rows are forced to
+    disk every checkpoint files, so a crash loses at most that many entries,
+    which the remote duplicate check then catches.
+    '''
+
+    def __init__(self, journal_file, checkpoint=UPLOAD_CHECKPOINT):
+        self.journal_file = journal_file
+        self.checkpoint = checkpoint
+        self.completed = set()
+        self.unsaved = 0
+        if os.path.exists(journal_file):
+            with open(journal_file, newline='') as journal:
+                for row in csv.reader(journal):
+                    if len(row) == 4:
+                        self.completed.add(tuple(row))
+        self.journal = open(journal_file, 'a', newline='')
+        self.writer = csv.writer(self.journal)
+
+    def key(self, file_path, collection_path):
+        stat_result = os.stat(file_path)
+        return (os.path.abspath(file_path), str(stat_result.st_size),
+                repr(stat_result.st_mtime), collection_path)
+
+    def contains(self, file_path, collection_path):
+        try:
+            return self.key(file_path, collection_path) in self.completed
+        except OSError:
+            return False
+
+    def record(self, file_path, collection_path):
+        '''
+        Appends completed upload of file_path to collection_path,
+        checkpointing every checkpoint files.
+        '''
+        key = self.key(file_path, collection_path)
+        self.completed.add(key)
+        self.writer.writerow(key)
+        self.unsaved += 1
+        if self.unsaved >= self.checkpoint:
+            self.save()
+
+    def save(self):
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.unsaved = 0
+
+    def close(self):
+        self.save()
+        self.journal.close()
+
+
+class UploadScheduler:
+    '''
+    Uploads tasks in a pool of jobs threads. Files of all tasks going to one
+    collection are merged and uploaded in batches of at most batch_files
+    files and batch_bytes. At most twice jobs batches are queued at once,
+    so collection resolution and duplicate checks for later collections
+    overlap with running uploads. File sizes already known, for example
+    from a pre-flight directory listing, can be passed in sizes.
+    '''
+
+    def __init__(self, tree, index, jobs=UPLOAD_JOBS, retries=UPLOAD_RETRIES,
+                 backoff=UPLOAD_BACKOFF, journal=None,
+                 batch_bytes=BATCH_BYTES, batch_files=BATCH_FILES,
+                 sizes=None, dedup=None):
+        self.tree = tree
+        self.index = index
+        self.journal = journal
+        self.batch_bytes = batch_bytes
+        self.batch_files = batch_files
+        self.sizes = sizes or {}
+        self.dedup = dedup
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.results = []
+        self.elapsed = 0.0
+
+    def uploadWithRetry(self, task, collection):
+        '''
+        Uploads task files to collection in a worker thread, retrying
+        transient errors. Returns UploadResult.
+        '''
+        start = time.perf_counter()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                size = sum(fileSize(file_path, self.sizes)
+                           for file_path in task.files)
+                collection.upload(*task.files, display_progress=False)
+                return UploadResult(task, 'uploaded', attempts,
+                                    time.perf_counter() - start, size, None)
+            except Exception as ex:
+                if attempts > self.retries or not isTransient(ex):
+                    return UploadResult(task, 'failed', attempts,
+                                        time.perf_counter() - start, 0,
+                                        str(ex))
+                time.sleep(self.backoff * 2 ** (attempts - 1))
+
+    def retry(self, function, *args):
+        '''
+        Calls function with args, retrying transient errors with
+        exponential backoff. Returns its result.
+        '''
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return function(*args)
+            except Exception as ex:
+                if attempts > self.retries or not isTransient(ex):
+                    raise
+                time.sleep(self.backoff * 2 ** (attempts - 1))
+
+    def fail(self, task, ex):
+        print('Error uploading {}.  {}'.format(task.files, str(ex)))
+        self.results.append(UploadResult(
+            task, 'failed', 1, 0.0, 0, str(ex)
+            ))
+
+    def skip(self, task, file_path):
+        print('File {} already uploaded to {}.'.format(
+            file_path, task.collection_path))
+        self.results.append(UploadResult(
+            UploadTask(task.collection_path, [file_path]),
+            'skipped', 0, 0.0, 0, None
+            ))
+
+    def dropKnown(self, task):
+        '''
+        Drops duplicates of other files and files recorded in the journal.
+        Returns list of remaining task files.
+        '''
+        files = []
+        for file_path in task.files:
+            original = self.dedup.originalOf(file_path) if self.dedup else None
+            if original:
+                print('File {} is a copy of {}.'.format(file_path, original))
+                self.results.append(UploadResult(
+                    UploadTask(task.collection_path, [file_path]),
+                    'duplicate', 0, 0.0, 0, None
+                    ))
+            elif self.journal and self.journal.contains(
+                    file_path, task.collection_path):
+                self.skip(task, file_path)
+            else:
+                files.append(file_path)
+        return files
+
+    def prepare(self, task):
+        '''
+        Drops duplicates of other files and files recorded in the journal,
+        then resolves task collection and drops files already uploaded to it.
+        Files whose collection cannot be resolved or listed, or whose size
+        cannot be read, are recorded as failed.
+        Returns collection and remaining task.
+        '''
+        files = self.dropKnown(task)
+        if not files:
+            return None, UploadTask(task.collection_path, files)
+        try:
+            collection = self.retry(self.tree.resolve, task.collection_path)
+            names = self.retry(self.index.names, collection)
+        except Exception as ex:
+            self.fail(UploadTask(task.collection_path, files), ex)
+            return None, UploadTask(task.collection_path, [])
+        remaining = []
+        for file_path in files:
+            if os.path.basename(file_path) in names:
+                self.skip(task, file_path)
+                continue
+            try:
+                self.sizes[file_path] = fileSize(file_path, self.sizes)
+            except OSError as ex:
+                self.fail(UploadTask(task.collection_path, [file_path]), ex)
+                continue
+            remaining.append(file_path)
+        return collection, UploadTask(task.collection_path, remaining)
+
+    def record(self, collection, result):
+        '''
+        Adds uploaded files of result to the index and journal,
+        or prints the error of a failed upload.
+        '''
+        if result.status == 'uploaded':
+            for file_path in result.task.files:
+                self.index.add(collection, os.path.basename(file_path))
+                if not self.journal:
+                    continue
+                try:
+                    self.journal.record(file_path, result.task.collection_path)
+                except OSError as ex:
+                    print('Cannot journal upload of {}.  {}'.format(
+                        file_path, str(ex)))
+        else:
+            print('Error uploading {}.  {}'.format(
+                result.task.files, result.error))
+        self.results.append(result)
+
+    def finish(self, future, pending):
+        collection = pending.pop(future)
+        self.record(collection, future.result())
+
+    def run(self, tasks):
+        '''
+        Uploads (collection_path, files) tasks ordered by collection,
+        in batches per collection.
+        Returns list of UploadResult for this run.
+        '''
+        start = time.perf_counter()
+        first = len(self.results)
+        tasks = sorted(
+            (UploadTask(*task) for task in tasks),
+            key=lambda task: task.collection_path
+            )
+        pending = {}
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as pool:
+            for collection_path, group in itertools.groupby(
+                    tasks, key=lambda task: task.collection_path):
+                task = UploadTask(collection_path, [
+                    file_path for task in group for file_path in task.files
+                    ])
+                collection, task = self.prepare(task)
+                for files in batchFiles(task.files, self.batch_bytes,
+                                        self.batch_files, self.sizes):
+                    while len(pending) >= self.jobs * 2:
+                        done, not_done = concurrent.futures.wait(
+                            pending,
+                            return_when=concurrent.futures.FIRST_COMPLETED
+                            )
+                        for future in done:
+                            self.finish(future, pending)
+                    pending[pool.submit(
+                        self.uploadWithRetry,
+                        UploadTask(collection_path, files), collection
+                        )] = collection
+            for future in concurrent.futures.as_completed(list(pending)):
+                self.finish(future, pending)
+        self.elapsed += time.perf_counter() - start
+        return self.results[first:]
+
+    def report(self):
+        '''
+        Returns text summary of uploaded, skipped, duplicate and failed files,
+        retries and aggregate throughput.
+        '''
+        files = collections.Counter()
+        retries = 0
+        size = 0
+        for result in self.results:
+            files[result.status] += len(result.task.files)
+            retries += max(result.attempts - 1, 0)
+            size += result.bytes
+        elapsed = self.elapsed or 1e-9
+        return '{} uploaded, {} skipped, {} duplicates, {} failed, ' \
+            '{} retries\n' \
+            '{:.0f} bytes/s, {:.2f} files/s over {:.2f}s'.format(
+                files['uploaded'], files['skipped'], files['duplicate'],
+                files['failed'], retries,
+                size / elapsed, files['uploaded'] / elapsed, self.elapsed)
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+'''
+Local index of files already uploaded to Blackfynn collections.
+
+Listing a collection means one remote call per item to read its sources, so
+each collection is listed once into a set of source file basenames, and the
+sets are kept in a SQLite cache file between runs. Cached listings are
+refetched once older than the time to live, or after invalidate(). Duplicate
+checks are then set lookups.
+
+CollectionTree does the same for destination collections, so uploads under a
+shared path prefix walk the collection hierarchy only once.
+'''
+
+import os
+import time
+import sqlite3
+
+INDEX_TTL = 24 * 60 * 60
+
+
+def isCollection(item):
+    '''
+    Returns True for collections, which hold no source files.
+    '''
+    return getattr(item, 'type', None) == 'Collection'
+
+
+def listCollection(collection):
+    '''
+    Returns set of source file basenames of the packages in collection.
+    '''
+    names = set()
+    for item in collection:
+        if isCollection(item):
+            continue
+        for source in item.sources:
+            real_file = os.path.basename(source.s3_key)
+            if not real_file:
+                print('List of sources empty')
+            names.add(real_file)
+    return names
+
+
+class RemoteIndexCache:
+    '''
+    Collection listings keyed by collection id, held in memory and
+    persisted in cache_file. Without cache_file listings only last
+    for the run.
+    '''
+
+    def __init__(self, cache_file=None, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self.listings = {}
+        self.fetches = 0
+        self.connection = sqlite3.connect(cache_file or ':memory:')
+        self.connection.executescript(
+            'CREATE TABLE IF NOT EXISTS listings ('
+            'collection_id TEXT PRIMARY KEY, fetched REAL);'
+            'CREATE TABLE IF NOT EXISTS names ('
+            'collection_id TEXT, name TEXT, '
+            'PRIMARY KEY (collection_id, name));'
+            )
+
+    def cached(self, collection):
+        '''
+        Returns set of file names in collection from memory or the cache
+        file if fresh, or None if the collection must be listed remotely.
+        '''
+        collection_id = str(collection.id)
+        if collection_id in self.listings:
+            return self.listings[collection_id]
+        row = self.connection.execute(
+            'SELECT fetched FROM listings WHERE collection_id = ?',
+            (collection_id,)
+            ).fetchone()
+        if not row or time.time() - row[0] >= self.ttl:
+            return None
+        names = set(name for (name,) in self.connection.execute(
+            'SELECT name FROM names WHERE collection_id = ?',
+            (collection_id,)
+            ))
+        self.listings[collection_id] = names
+        return names
+
+    def names(self, collection):
+        '''
+        Returns set of file names in collection, from memory, the cache file
+        if fresh, or by listing the collection remotely.
+        '''
+        names = self.cached(collection)
+        if names is None:
+            names = self.update(collection, listCollection(collection))
+        return names
+
+    def update(self, collection, names):
+        '''
+        Stores names listed remotely for collection. Returns names.
+        '''
+        collection_id = str(collection.id)
+        self.fetches += 1
+        self.store(collection_id, names)
+        self.listings[collection_id] = names
+        return names
+
+    def store(self, collection_id, names):
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM names WHERE collection_id = ?', (collection_id,)
+                )
+            self.connection.executemany(
+                'INSERT INTO names VALUES (?, ?)',
+                ((collection_id, name) for name in names)
+                )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO listings VALUES (?, ?)',
+                (collection_id, time.time())
+                )
+
+    def contains(self, collection, fname):
+        return fname in self.names(collection)
+
+    def add(self, collection, fname):
+        '''
+        Records fname as uploaded to collection,
+        keeping the cached listing current.
+        '''
+        collection_id = str(collection.id)
+        self.names(collection).add(fname)
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO names VALUES (?, ?)',
+                (collection_id, fname)
+                )
+
+    def invalidate(self, collection=None):
+        '''
+        Drops cached listing of collection, or of all
+        collections, so it is fetched again on next use.
+        '''
+        with self.connection:
+            if collection is None:
+                self.listings.clear()
+                self.connection.execute('DELETE FROM listings')
+                self.connection.execute('DELETE FROM names')
+            else:
+                collection_id = str(collection.id)
+                self.listings.pop(collection_id, None)
+                self.connection.execute(
+                    'DELETE FROM listings WHERE collection_id = ?',
+                    (collection_id,)
+                    )
+                self.connection.execute(
+                    'DELETE FROM names WHERE collection_id = ?',
+                    (collection_id,)
+                    )
+
+    def close(self):
+        self.connection.close()
+
+
+class CollectionTree:
+    '''
+    Collections below root, resolved once and cached by path prefix.
+    Resolving a path starts at its deepest known ancestor, lists each
+    parent collection at most once and creates only missing levels.
+    Counts collection listings made and those a walk from root for
+    every path would have made.
+    '''
+
+    def __init__(self, root):
+        self.root = root
+        self.collections = {'': root}
+        self.listed = set()
+        self.listings = 0
+        self.created = 0
+        self.uncached_listings = 0
+
+    def resolve(self, path):
+        '''
+        Finds or creates the collection hierarchy in path, levels
+        separated by '/', and returns the lowest collection.
+        '''
+        levels = [level for level in str(path).split('/') if level]
+        self.uncached_listings += len(levels)
+        depth = len(levels)
+        while '/'.join(levels[:depth]) not in self.collections:
+            depth -= 1
+        collection = self.collections['/'.join(levels[:depth])]
+        for index in range(depth, len(levels)):
+            parent = '/'.join(levels[:index])
+            key = '/'.join(levels[:index + 1])
+            if parent not in self.listed:
+                self.listed.add(parent)
+                self.listings += 1
+                for item in collection.items:
+                    if isCollection(item):
+                        self.collections.setdefault(
+                            '/'.join(levels[:index] + [item.name]), item
+                            )
+            if key not in self.collections:
+                print('Creating', levels[index], ' in', collection.name)
+                self.collections[key] = collection.create_collection(
+                    levels[index]
+                    )
+                self.created += 1
+                # a new collection is empty, no need to list it
+                self.listed.add(key)
+            collection = self.collections[key]
+        return collection
+
+    def report(self):
+        return '{} collection listings, {} created, {} API calls saved'.format(
+            self.listings, self.created,
+            self.uncached_listings - self.listings
+            )